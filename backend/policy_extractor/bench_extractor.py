@@ -0,0 +1,106 @@
+"""
+Measure requirement extraction throughput in MB/s
+
+    python bench_extractor.py                  # synthetic 8 MB rulebook
+    python bench_extractor.py rulebook.txt     # a real document, streamed from disk
+
+Reports the streaming extractor's throughput and, for comparison, that of
+the previous split-on-period extraction over the same text.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from requirement_extractor import RequirementExtractor
+
+CLAUSES = [
+    "Each covered institution shall file a report of each transaction in currency of more than $10,000.",
+    "Records must be maintained for at least 5 years, e.g. account statements and wire instructions.",
+    "The compliance officer is responsible for the programme set out in Sec. 4 of this Part.",
+    "Customers are prohibited from splitting deposits to evade the reporting threshold.",
+    "Suspicious activity must be reported no later than 30 days after initial detection.",
+    "This paragraph describes the scope of the U.S. regulations and contains no obligation.",
+    "Enhanced due diligence is mandatory for politically exposed persons.",
+    "Staff may not disclose the existence of a report to the subject of the report.",
+]
+
+
+def synthetic_rulebook(size_bytes: int, seed: int = 7) -> str:
+    """A policy text of roughly ``size_bytes`` with parts, sections and numbered clauses"""
+    rng = random.Random(seed)
+    parts = []
+    total = 0
+    part = section = 0
+    while total < size_bytes:
+        if section % 20 == 0:
+            part += 1
+            parts.append(f"PART {part} - GENERAL PROVISIONS\n")
+        section += 1
+        lines = [f"Section {section}. Requirements of this section\n"]
+        for clause in range(1, rng.randint(3, 8)):
+            sentences = ' '.join(rng.choice(CLAUSES) for _ in range(rng.randint(1, 4)))
+            # Wrap at ~90 characters like text extracted from a PDF
+            words, line, wrapped = sentences.split(), '', []
+            for word in words:
+                if len(line) + len(word) > 90:
+                    wrapped.append(line)
+                    line = ''
+                line = f"{line} {word}" if line else word
+            wrapped.append(line)
+            lines.append(f"({chr(96 + clause)}) " + '\n'.join(wrapped) + '\n')
+        lines.append('\n')
+        block = ''.join(lines)
+        parts.append(block)
+        total += len(block)
+    return ''.join(parts)
+
+
+def split_on_periods(content: str):
+    """The extraction used before the streaming extractor, for comparison"""
+    requirements = []
+    for i, sentence in enumerate(content.split('.')):
+        if 'must' in sentence.lower() or 'shall' in sentence.lower() or 'required' in sentence.lower():
+            requirements.append({"id": f"req_{i}", "text": sentence.strip(),
+                                 "risk_level": "medium" if "must" in sentence.lower() else "low"})
+    return requirements
+
+
+def timed(label: str, size_bytes: int, run):
+    start = time.perf_counter()
+    found = run()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {size_bytes / elapsed / 1e6:8.1f} MB/s  {elapsed:7.3f} s  {found:>8} requirements")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark policy requirement extraction")
+    parser.add_argument("path", nargs="?", help="Text file to extract from (default: synthetic rulebook)")
+    parser.add_argument("--size-mb", type=float, default=8.0, help="Size of the synthetic rulebook")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per extractor")
+    args = parser.parse_args()
+
+    extractor = RequirementExtractor()
+    if args.path:
+        size = os.path.getsize(args.path)
+        print(f"{args.path}: {size / 1e6:.1f} MB")
+        for _ in range(args.repeat):
+            def stream():
+                with open(args.path, 'r', encoding='utf-8', newline='') as f:
+                    return sum(1 for _ in extractor.iter_requirements(iter(lambda: f.read(1 << 16), '')))
+            timed("streaming (file)", size, stream)
+        return
+
+    text = synthetic_rulebook(int(args.size_mb * 1e6))
+    size = len(text.encode('utf-8'))
+    print(f"synthetic rulebook: {size / 1e6:.1f} MB, {text.count(chr(10))} lines")
+    for _ in range(args.repeat):
+        timed("streaming extractor", size, lambda: sum(1 for _ in extractor.iter_requirements([text])))
+        timed("split on '.'", size, lambda: len(split_on_periods(text)))
+
+
+if __name__ == "__main__":
+    main()
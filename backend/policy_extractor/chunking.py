@@ -0,0 +1,164 @@
+"""
+Section-aware chunking of long policy documents
+"""
+import hashlib
+import re
+from typing import Dict, List, Tuple
+
+# Lines that open a new section: markdown headings, "Section 3", "§ 1010.311",
+# "Article 5", "PART II", "Chapter 4", numbered headings such as "4.2 Record
+# keeping", and short all-caps titles
+HEADING_PATTERN = re.compile(
+    r"^\s*(?:"
+    r"#{1,6}\s+\S.*"
+    r"|(?:(?i:section|sec\.|article|part|chapter|title|subpart|schedule|annex|appendix)\s+|§\s*)(?:[\dIVXLCivxlc]+|[A-Z]\b)[\w.\-()]*.*"
+    r"|\d+(?:\.\d+){0,3}\.?\s+[A-Z][^.!?]{0,60}"
+    r"|[A-Z][A-Z0-9 ,&'\-]{3,80}"
+    r")\s*$"
+)
+SENTENCE_END = re.compile(r"(?<=[.!?;])\s+")
+
+
+# Nesting depth of keyword headings; numbered headings nest below sections
+KEYWORD_LEVELS = {
+    'title': 1, 'chapter': 2, 'part': 3, 'subpart': 4, 'article': 5, 'section': 5, 'sec.': 5, '§': 5,
+    'schedule': 2, 'annex': 2, 'appendix': 2,
+}
+
+
+def is_heading(line: str) -> bool:
+    """Whether a line opens a new section; lines ending mid-clause are body text"""
+    stripped = line.strip()
+    return bool(stripped) and len(stripped) <= 120 and bool(HEADING_PATTERN.match(line)) \
+        and not stripped.endswith((',', ';'))
+
+
+def heading_level(line: str) -> int:
+    """Nesting depth of a heading line, used to build section paths"""
+    stripped = line.strip()
+    if stripped.startswith('#'):
+        return len(stripped) - len(stripped.lstrip('#'))
+    numbered = re.match(r"(\d+(?:\.\d+)*)", stripped)
+    if numbered:
+        return numbered.group(1).count('.') + 6
+    for keyword, level in KEYWORD_LEVELS.items():
+        if stripped.lower().startswith(keyword):
+            return level
+    return 1
+
+
+def split_sections(text: str) -> List[Tuple[str, str]]:
+    """Split a document into ``(section path, body)`` pairs at heading lines"""
+    sections: List[Tuple[str, str]] = []
+    path: List[Tuple[int, str]] = []
+    body: List[str] = []
+
+    def flush():
+        content = '\n'.join(body).strip()
+        if content:
+            sections.append((' > '.join(title for _, title in path), content))
+        body.clear()
+
+    for line in text.splitlines():
+        if is_heading(line):
+            flush()
+            level = heading_level(line)
+            while path and path[-1][0] >= level:
+                path.pop()
+            path.append((level, line.strip().lstrip('#').strip()))
+            body.append(line)
+        else:
+            body.append(line)
+    flush()
+    return sections
+
+
+def _split_long(text: str, max_chars: int) -> List[str]:
+    """Split an oversized section on paragraphs, then sentences, then characters"""
+    pieces: List[str] = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in SENTENCE_END.split(paragraph):
+            for start in range(0, len(sentence), max_chars):
+                pieces.append(sentence[start:start + max_chars])
+
+    parts: List[str] = []
+    current = ''
+    for piece in pieces:
+        if current and len(current) + len(piece) + 2 > max_chars:
+            parts.append(current)
+            current = piece
+        else:
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _tail(text: str, overlap_chars: int) -> str:
+    """The last ``overlap_chars`` of a chunk, starting at a sentence boundary"""
+    if overlap_chars <= 0 or len(text) <= overlap_chars:
+        return text if overlap_chars > 0 else ''
+    tail = text[-overlap_chars:]
+    boundary = SENTENCE_END.search(tail)
+    return tail[boundary.end():] if boundary else tail
+
+
+def _is_anchor(text: str, target_chars: int) -> bool:
+    """Whether a chunk ends after this piece of text, decided by its content alone
+
+    A piece is an anchor with probability ``len(text) / target_chars``, so
+    chunks average ``target_chars`` whatever the section sizes, and an edit
+    moves only the boundaries up to the next unchanged anchor.
+    """
+    digest = hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2 ** 64 < len(text) / max(target_chars, 1)
+
+
+def chunk_document(text: str, max_chars: int = 12000, overlap_chars: int = 500) -> List[Dict[str, str]]:
+    """
+    Pack a document's sections into chunks of at most ``max_chars``
+
+    Whole sections are kept together where they fit. Chunks end after
+    content-defined anchor sections (or when full), so amending one section
+    changes the text of the chunk holding it and leaves the others as they
+    were; their analyses and embeddings can be reused. A chunk that splits
+    an oversized section starts with the last ``overlap_chars`` of the
+    previous one, so a requirement straddling the cut is seen whole by one
+    of the two.
+
+    Returns:
+        List of ``{"index", "section", "text"}`` dictionaries
+    """
+    units: List[Tuple[str, str, bool]] = []
+    for section, body in split_sections(text) or [('', text)]:
+        for number, part in enumerate(_split_long(body, max(max_chars - overlap_chars, 1))):
+            units.append((section, part, number > 0))
+
+    chunks: List[Dict[str, str]] = []
+    sections: List[str] = []
+    current = ''
+    anchor = False
+    for section, part, continued in units:
+        if current and (anchor or len(current) + len(part) + 2 > max_chars):
+            chunks.append({'section': '; '.join(dict.fromkeys(s for s in sections if s)), 'text': current})
+            overlap = _tail(current, overlap_chars) if continued else ''
+            current = f"{overlap}\n\n{part}" if overlap else part
+            sections = [section]
+        else:
+            current = f"{current}\n\n{part}" if current else part
+            sections.append(section)
+        anchor = _is_anchor(part, max_chars // 2)
+    if current:
+        chunks.append({'section': '; '.join(dict.fromkeys(s for s in sections if s)), 'text': current})
+
+    for index, chunk in enumerate(chunks):
+        chunk['index'] = index
+    return chunks
+
+
+def requirement_key(text: str) -> str:
+    """Normalized form used to recognise the same requirement from overlapping chunks"""
+    return ' '.join(re.sub(r"[^a-z0-9$%§ ]", ' ', text.lower()).split())
@@ -0,0 +1,233 @@
+"""
+Text extraction for uploaded PDF, DOCX and TXT policy documents
+"""
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Optional, Tuple
+from xml.etree import ElementTree
+
+# Import PyPDF2 for PDF processing
+PDF_PROCESSING_AVAILABLE = False
+try:
+    import importlib
+    PyPDF2 = importlib.import_module('PyPDF2')
+    PDF_PROCESSING_AVAILABLE = True
+except ImportError:
+    PyPDF2 = None
+    print("Warning: PyPDF2 not installed. PDF processing will be disabled.")
+
+# Bump when extraction output changes so cached texts are extracted again
+EXTRACTOR_VERSION = "1"
+
+# Resolved PDF objects are dropped every this many pages to bound memory
+PDF_CACHE_PAGES = 50
+
+WORD_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+def document_kind(filename: str) -> str:
+    """``pdf``, ``docx`` or ``txt`` from a file name"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension not in ('.pdf', '.docx', '.txt'):
+        raise ValueError(f"Unsupported document type: {extension or filename}")
+    return extension[1:]
+
+
+def extract_pdf(path: str, out) -> int:
+    """Write the text of a PDF to ``out`` one page at a time; returns the page count"""
+    if not PDF_PROCESSING_AVAILABLE:
+        raise ValueError("PDF processing is not available: PyPDF2 is not installed")
+    with open(path, 'rb') as f:
+        reader = PyPDF2.PdfReader(f)
+        if reader.is_encrypted and not reader.decrypt(''):
+            raise ValueError("PDF is encrypted")
+        pages = len(reader.pages)
+        for number in range(pages):
+            text = reader.pages[number].extract_text() or ''
+            out.write(text.strip())
+            out.write('\n\n')
+            if number % PDF_CACHE_PAGES == PDF_CACHE_PAGES - 1:
+                reader.resolved_objects.clear()
+    return pages
+
+
+def extract_docx(path: str, out) -> int:
+    """Write the paragraphs of a DOCX to ``out`` as they are parsed; returns the paragraph count
+
+    ``word/document.xml`` is read with ``iterparse`` and each paragraph is
+    discarded once written, so the document tree is never built in full.
+    Heading styles become markdown headings, which the section splitter
+    recognises.
+    """
+    paragraphs = 0
+    with zipfile.ZipFile(path) as archive:
+        try:
+            document = archive.open('word/document.xml')
+        except KeyError:
+            raise ValueError("Not a Word document: word/document.xml is missing")
+        with document:
+            for _, element in ElementTree.iterparse(document, events=('end',)):
+                if element.tag != f"{WORD_NAMESPACE}p":
+                    continue
+                parts = []
+                level = 0
+                for node in element.iter():
+                    if node.tag == f"{WORD_NAMESPACE}t" and node.text:
+                        parts.append(node.text)
+                    elif node.tag == f"{WORD_NAMESPACE}tab":
+                        parts.append('\t')
+                    elif node.tag in (f"{WORD_NAMESPACE}br", f"{WORD_NAMESPACE}cr"):
+                        parts.append('\n')
+                    elif node.tag == f"{WORD_NAMESPACE}pStyle":
+                        style = (node.get(f"{WORD_NAMESPACE}val") or '').lower()
+                        if style.startswith('heading') and style[7:].isdigit():
+                            level = min(int(style[7:]), 6)
+                        elif style == 'title':
+                            level = 1
+                element.clear()
+                text = ''.join(parts).strip()
+                if text:
+                    out.write(f"{'#' * level} {text}\n\n" if level else f"{text}\n\n")
+                    paragraphs += 1
+    return paragraphs
+
+
+def extract_to_file(kind: str, path: str, out_path: str) -> int:
+    """Extract a stored document into a UTF-8 text file; runs in a worker process"""
+    with open(out_path, 'w', encoding='utf-8') as out:
+        if kind == 'pdf':
+            return extract_pdf(path, out)
+        if kind == 'docx':
+            return extract_docx(path, out)
+        raise ValueError(f"Unsupported document type: {kind}")
+
+
+class DocumentTextExtractor:
+    """Extracts document text in a process pool and caches it by file hash
+
+    PDF and DOCX parsing is CPU-bound pure Python, so it runs in worker
+    processes rather than on the upload threads. Extracted text is stored
+    in ``document_texts`` keyed by the SHA-256 of the file and the
+    extractor version, so uploading the same file again skips extraction.
+    """
+
+    def __init__(self, db_path: str, processes: int = 2):
+        self.db_path = db_path
+        self.processes = processes
+        self.init_db()
+        self._pool_lock = threading.Lock()
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        """The worker pool, started on first use
+
+        Workers come from a forkserver (or are spawned) rather than being
+        forked from this process, so a pool started or replaced from an
+        upload thread does not inherit locks held by other threads. Starting
+        it lazily keeps a worker that imports ``main`` from starting its own.
+        """
+        with self._pool_lock:
+            if self.executor is None:
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                if context.get_start_method() == 'forkserver':
+                    # The forkserver would otherwise import __main__, which may be main.py
+                    context.set_forkserver_preload([])
+                self.executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=context)
+            return self.executor
+
+    def _replace_pool(self, broken: ProcessPoolExecutor):
+        """Drop ``broken`` so the next upload starts a new pool, unless another upload already did"""
+        with self._pool_lock:
+            if self.executor is broken:
+                self.executor = None
+        broken.shutdown(wait=False)
+
+    def init_db(self):
+        """Create the extracted text cache table"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS document_texts (
+                file_hash TEXT,
+                extractor_version TEXT,
+                kind TEXT,
+                parts INTEGER,
+                text TEXT,
+                extracted_at TEXT,
+                PRIMARY KEY (file_hash, extractor_version)
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def extract(self, filename: str, document: bytes) -> Tuple[str, bool]:
+        """
+        Text of an uploaded document
+
+        Args:
+            filename: Original file name, which selects the parser
+            document: Raw file contents
+
+        Returns:
+            Tuple of the text and whether it came from the cache
+        """
+        kind = document_kind(filename)
+        if kind == 'txt':
+            try:
+                return document.decode('utf-8-sig'), False
+            except UnicodeDecodeError:
+                raise ValueError(f"{filename} is not UTF-8 text")
+
+        file_hash = hashlib.sha256(document).hexdigest()
+        cached = self._cached(file_hash)
+        if cached is not None:
+            return cached, True
+
+        with tempfile.TemporaryDirectory(prefix='policy-extract-') as workdir:
+            path = os.path.join(workdir, f"document.{kind}")
+            out_path = os.path.join(workdir, 'document.txt')
+            with open(path, 'wb') as f:
+                f.write(document)
+            executor = self._pool()
+            try:
+                parts = executor.submit(extract_to_file, kind, path, out_path).result()
+            except (zipfile.BadZipFile, ElementTree.ParseError) as e:
+                raise ValueError(f"{filename} could not be read: {str(e)}")
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); replace the pool for later uploads
+                self._replace_pool(executor)
+                raise ValueError(f"Extraction of {filename} crashed its worker process")
+            except Exception as e:
+                if PDF_PROCESSING_AVAILABLE and isinstance(e, PyPDF2.errors.PyPdfError):
+                    raise ValueError(f"{filename} could not be read: {str(e)}")
+                raise
+            with open(out_path, 'r', encoding='utf-8') as f:
+                text = f.read().strip()
+
+        if not text:
+            raise ValueError(f"No text could be extracted from {filename}")
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('''
+            INSERT OR REPLACE INTO document_texts (file_hash, extractor_version, kind, parts, text, extracted_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (file_hash, EXTRACTOR_VERSION, kind, parts, text, datetime.utcnow().isoformat()))
+        conn.commit()
+        conn.close()
+        return text, False
+
+    def _cached(self, file_hash: str) -> Optional[str]:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        row = conn.execute(
+            "SELECT text FROM document_texts WHERE file_hash = ? AND extractor_version = ?",
+            (file_hash, EXTRACTOR_VERSION)
+        ).fetchone()
+        conn.close()
+        return row[0] if row else None
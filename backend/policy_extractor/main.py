@@ -1,4 +1,5 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Header
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
 from typing import List, Optional
 import os
@@ -8,9 +9,37 @@ import uvicorn
 import sqlite3
 import json
 import hashlib
+import sys
+import threading
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from urllib.parse import urlencode
+import numpy as np
 import google.generativeai as genai
 
-app = FastAPI(title="Policy Extractor Service", version="1.0.0")
+# Add the current directory and backend/shared (where Docker copies it to /shared) to the path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'shared'))
+
+from chunking import chunk_document, requirement_key
+from document_text import DocumentTextExtractor
+from local_embedder import HashingEmbedder
+from near_duplicates import MinHasher, NearDuplicateIndex
+from policy_index import PolicyIndex, from_blob, to_blob
+from policy_versions import PolicyVersionStore
+from requirement_extractor import RequirementExtractor
+from rule_compiler import COMPILER_VERSION, RuleCompiler, artifact_etag, rule_key
+from upload_pipeline import UploadPipeline
+
+# Background work (see start_background_work) begins when the server starts
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_background_work()
+    yield
+
+app = FastAPI(title="Policy Extractor Service", version="1.0.0", lifespan=lifespan)
 
 # Configure Gemini API
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -26,6 +55,8 @@ else:
 DATABASE_URL = os.getenv("DATABASE_URL", "policies.db")
 conn = sqlite3.connect(DATABASE_URL, check_same_thread=False)
 cursor = conn.cursor()
+# WAL lets upload workers write while requests read
+conn.execute("PRAGMA journal_mode=WAL")
 
 # Create policies table
 cursor.execute('''
@@ -39,8 +70,204 @@ cursor.execute('''
         embeddings TEXT
     )
 ''')
+# Embedding vectors are stored as float32 BLOBs; the embeddings column names
+# the model that produced them
+existing_columns = {column[1] for column in cursor.execute("PRAGMA table_info(policies)").fetchall()}
+if 'embedding' not in existing_columns:
+    cursor.execute("ALTER TABLE policies ADD COLUMN embedding BLOB")
+
+# Analyses keyed by content hash and analyzer version, so unchanged documents
+# are never sent to the model twice
+cursor.execute('''
+    CREATE TABLE IF NOT EXISTS policy_analyses (
+        content_hash TEXT,
+        analyzer_version TEXT,
+        analysis TEXT,
+        created_at TEXT,
+        PRIMARY KEY (content_hash, analyzer_version)
+    )
+''')
+# Per-chunk analyses and embeddings, keyed by chunk hash: after an amendment
+# only the chunks whose text changed are sent to the model again
+cursor.execute('''
+    CREATE TABLE IF NOT EXISTS policy_chunk_analyses (
+        chunk_hash TEXT,
+        analyzer_version TEXT,
+        analysis TEXT,
+        created_at TEXT,
+        PRIMARY KEY (chunk_hash, analyzer_version)
+    )
+''')
+cursor.execute('''
+    CREATE TABLE IF NOT EXISTS chunk_embeddings (
+        chunk_hash TEXT,
+        model TEXT,
+        embedding BLOB,
+        created_at TEXT,
+        PRIMARY KEY (chunk_hash, model)
+    )
+''')
+conn.commit()
+
+# MinHash signatures of policy texts; scheme names the hashing parameters, and
+# signatures from another scheme are recomputed at startup
+cursor.execute('''
+    CREATE TABLE IF NOT EXISTS policy_minhash (
+        policy_id TEXT PRIMARY KEY,
+        scheme TEXT,
+        signature BLOB
+    )
+''')
+conn.commit()
+
+# Rule artifacts compiled from each policy version's analysis; rule_key names the
+# compiler and analyzer versions, and artifacts from older ones are recompiled
+cursor.execute('''
+    CREATE TABLE IF NOT EXISTS policy_rules (
+        policy_id TEXT,
+        version INTEGER,
+        rule_key TEXT,
+        etag TEXT,
+        artifact TEXT,
+        compiled_at TEXT,
+        PRIMARY KEY (policy_id, version)
+    )
+''')
+# Rule ETags are weak; artifacts stored with strong ones keep their content hash
+cursor.execute("UPDATE policy_rules SET etag = 'W/' || etag WHERE etag NOT LIKE 'W/%'")
 conn.commit()
 
+# Listing support: keyset pagination runs on rowid, which every index below
+# also orders by, so a filtered page is an index range scan without a sort;
+# and triggers bump a version number on every visible change so ETags can be
+# checked without reading any policy
+cursor.execute("CREATE INDEX IF NOT EXISTS idx_policies_jurisdiction ON policies(jurisdiction)")
+cursor.execute("CREATE INDEX IF NOT EXISTS idx_policies_category ON policies(category)")
+cursor.execute("CREATE INDEX IF NOT EXISTS idx_policies_jurisdiction_category ON policies(jurisdiction, category)")
+cursor.execute('''
+    CREATE TABLE IF NOT EXISTS policy_listing_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER
+    )
+''')
+cursor.execute("INSERT OR IGNORE INTO policy_listing_version (id, version) VALUES (1, 0)")
+for trigger, event in (("insert", "INSERT"), ("delete", "DELETE"),
+                       ("update", "UPDATE OF title, content, jurisdiction, category, created_at, embeddings")):
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS policies_listing_{trigger} AFTER {event} ON policies
+        BEGIN
+            UPDATE policy_listing_version SET version = version + 1 WHERE id = 1;
+        END
+    ''')
+
+# Full-text index over title and content, kept in sync by triggers; ranking
+# weighs a title match five times a content match
+fts_exists = cursor.execute(
+    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'policies_fts'"
+).fetchone()
+cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS policies_fts USING fts5(
+        title, content, content='policies', content_rowid='rowid',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+''')
+cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS policies_fts_insert AFTER INSERT ON policies
+    BEGIN
+        INSERT INTO policies_fts (rowid, title, content) VALUES (new.rowid, new.title, new.content);
+    END
+''')
+cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS policies_fts_delete AFTER DELETE ON policies
+    BEGIN
+        INSERT INTO policies_fts (policies_fts, rowid, title, content)
+        VALUES ('delete', old.rowid, old.title, old.content);
+    END
+''')
+cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS policies_fts_update AFTER UPDATE OF title, content ON policies
+    BEGIN
+        INSERT INTO policies_fts (policies_fts, rowid, title, content)
+        VALUES ('delete', old.rowid, old.title, old.content);
+        INSERT INTO policies_fts (rowid, title, content) VALUES (new.rowid, new.title, new.content);
+    END
+''')
+if not fts_exists:
+    # Index the policies stored before the search index existed
+    cursor.execute("INSERT INTO policies_fts (policies_fts) VALUES ('rebuild')")
+    cursor.execute("INSERT INTO policies_fts (policies_fts, rank) VALUES ('rank', 'bm25(5.0, 1.0)')")
+conn.commit()
+
+# Background threads (upload workers, analysis, backfill) each get their own
+# connection; one connection shared across threads can be left mid-transaction
+# by another thread's statement and lock out every other writer
+thread_local = threading.local()
+
+def thread_db():
+    if not hasattr(thread_local, "conn"):
+        thread_local.conn = sqlite3.connect(DATABASE_URL, timeout=30)
+    return thread_local.conn
+
+# Embedding configuration: Gemini when a key is set, otherwise (or with
+# EMBEDDING_BACKEND=local) an offline feature-hashing embedder
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "gemini")
+EMBEDDING_MODEL_NAME = "models/embedding-001"
+EMBED_MAX_CHARS = int(os.getenv("EMBED_MAX_CHARS", "8000"))
+# Texts per batch-embed call (the API caps this at 100)
+EMBED_BATCH_LIMIT = 100
+local_embedder = HashingEmbedder(dim=int(os.getenv("LOCAL_EMBEDDING_DIM", "768")))
+USE_REMOTE_EMBEDDINGS = bool(GEMINI_API_KEY) and EMBEDDING_BACKEND != "local"
+ACTIVE_EMBEDDING_MODEL = EMBEDDING_MODEL_NAME if USE_REMOTE_EMBEDDINGS else f"local-hash-{local_embedder.dim}"
+
+# Every policy embedded with the active model, as one in-memory matrix
+policy_index = PolicyIndex()
+
+# Near-duplicate detection: MinHash signatures of 5-word shingles, bucketed by LSH
+# bands in memory. Uploads at least NEAR_DUPLICATE_THRESHOLD similar to a stored
+# policy are flagged, or with on_duplicate=link linked to it instead of analyzed
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.85"))
+DUPLICATE_ACTIONS = ("flag", "link")
+minhasher = MinHasher()
+near_duplicate_index = NearDuplicateIndex()
+
+# Long documents are analyzed section-chunk by chunk; the shared pool caps the
+# number of model calls in flight across all requests
+ANALYSIS_CHUNK_CHARS = int(os.getenv("ANALYSIS_CHUNK_CHARS", "12000"))
+ANALYSIS_CHUNK_OVERLAP = int(os.getenv("ANALYSIS_CHUNK_OVERLAP", "500"))
+ANALYSIS_CONCURRENCY = int(os.getenv("ANALYSIS_CONCURRENCY", "4"))
+analysis_executor = ThreadPoolExecutor(max_workers=ANALYSIS_CONCURRENCY, thread_name_prefix="policy-analysis")
+
+# Rule-based requirement extraction; OBLIGATION_TERMS adds terms as a JSON
+# object of term -> risk level, e.g. {"is forbidden": "high"}
+requirement_extractor = RequirementExtractor(json.loads(os.getenv("OBLIGATION_TERMS", "{}")))
+
+# Requirements are compiled into structured rules once per policy version
+rule_compiler = RuleCompiler()
+
+# Default and largest page sizes of GET /policies
+POLICY_PAGE_SIZE = int(os.getenv("POLICY_PAGE_SIZE", "100"))
+POLICY_PAGE_SIZE_MAX = 1000
+SUMMARY_COLUMNS = ('id', 'title', 'jurisdiction', 'category', 'created_at')
+FULL_COLUMNS = SUMMARY_COLUMNS + ('content', 'embeddings')
+
+# Uploaded documents are processed in the background by this many workers
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+ALLOWED_EXTENSIONS = ('.txt', '.pdf', '.docx')
+
+# PDF and DOCX text is extracted in worker processes, started on the first upload
+EXTRACTION_PROCESSES = int(os.getenv("EXTRACTION_PROCESSES", "2"))
+document_extractor = DocumentTextExtractor(DATABASE_URL, processes=EXTRACTION_PROCESSES)
+
+# Every stored revision of each policy, for history and section diffs
+policy_versions = PolicyVersionStore(DATABASE_URL)
+
+# Bump when prompts, chunking or merging change so stored analyses are recomputed
+ANALYZER_VERSION = "4"
+
+def current_analyzer_version():
+    analyzer = "gemini-1.5-pro-latest" if model else "rules"
+    return f"{ANALYZER_VERSION}:{analyzer}:{ANALYSIS_CHUNK_CHARS}:{ANALYSIS_CHUNK_OVERLAP}"
+
 class Policy(BaseModel):
     id: str
     title: str
@@ -59,28 +286,181 @@ class PolicyResponse(BaseModel):
     created_at: str
     embeddings: Optional[str] = None
 
+class PolicyUpdateResponse(BaseModel):
+    id: str
+    title: str
+    content: str
+    jurisdiction: str
+    category: str
+    created_at: str
+    embeddings: Optional[str] = None
+    version: int
+    changes: Optional[dict] = None
+    stats: dict
+
+class PolicyVersionResponse(BaseModel):
+    policy_id: str
+    version: int
+    title: str
+    jurisdiction: str
+    category: str
+    content_hash: str
+    changes: Optional[dict] = None
+    stats: Optional[dict] = None
+    created_at: str
+    content: Optional[str] = None
+
+class PolicySummaryResponse(BaseModel):
+    id: str
+    title: str
+    jurisdiction: str
+    category: str
+    created_at: str
+
+class PolicySearchResult(BaseModel):
+    id: str
+    title: str
+    jurisdiction: str
+    category: str
+    created_at: str
+    snippet: str
+    score: float
+
+class NearDuplicateResponse(BaseModel):
+    id: str
+    title: str
+    similarity: float
+
+class SimilarPolicyResponse(BaseModel):
+    id: str
+    title: str
+    jurisdiction: str
+    category: str
+    similarity: float
+
 class PolicyAnalysisResponse(BaseModel):
     requirements: List[dict]
     risk_categories: List[str]
     compliance_guidelines: List[str]
     summary: str
+    cached: bool = False
 
 # Health check endpoint
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "policy_extractor", "timestamp": datetime.utcnow()}
 
-# AI-powered policy analysis using Gemini
-def analyze_policy_with_gemini(content: str):
+# Key of a chunk in the per-chunk caches; the section path is part of the prompt
+def chunk_hash(chunk: dict):
+    return hashlib.sha256(f"{chunk['section']}\n{chunk['text']}".encode('utf-8')).hexdigest()
+
+# AI-powered policy analysis using Gemini, one call per section-aware chunk. Chunk
+# analyses are reused from policy_chunk_analyses unless force_refresh is set; stats,
+# when given, receives the number of chunks and how many were sent to the model
+def analyze_policy_with_gemini(content: str, force_refresh: bool = False, stats: Optional[dict] = None):
     if not model:
         # Fallback to simple extraction if Gemini is not available
         return extract_policy_requirements_simple(content)
     
+    chunks = chunk_document(content, ANALYSIS_CHUNK_CHARS, ANALYSIS_CHUNK_OVERLAP)
+    if stats is not None:
+        stats.update(chunks=len(chunks), chunks_analyzed=len(chunks))
+    if len(chunks) <= 1:
+        return analyze_chunk_with_gemini(content)
+    
+    analyzer_version = current_analyzer_version()
+    db = thread_db()
+    hashes = [chunk_hash(chunk) for chunk in chunks]
+    analyses = {}
+    if not force_refresh:
+        for i in range(0, len(hashes), 500):
+            batch = hashes[i:i + 500]
+            analyses.update((row[0], json.loads(row[1])) for row in db.execute(
+                f"SELECT chunk_hash, analysis FROM policy_chunk_analyses WHERE analyzer_version = ? "
+                f"AND chunk_hash IN ({', '.join('?' * len(batch))})", (analyzer_version, *batch)
+            ))
+    futures = {key: analysis_executor.submit(analyze_chunk_with_gemini, chunk['text'], chunk['section'])
+               for key, chunk in zip(hashes, chunks) if key not in analyses}
+    if stats is not None:
+        stats['chunks_analyzed'] = len(futures)
+    for key, future in futures.items():
+        analyses[key] = future.result()
+        # Results that fell back to rules after a model error are not stored
+        if not analyses[key].get("degraded"):
+            db.execute('''
+                INSERT OR REPLACE INTO policy_chunk_analyses (chunk_hash, analyzer_version, analysis, created_at)
+                VALUES (?, ?, ?, ?)
+            ''', (key, analyzer_version, json.dumps(analyses[key]), datetime.utcnow().isoformat()))
+    db.commit()
+    return merge_chunk_analyses([analyses[key] for key in hashes], chunks)
+
+# Analysis for a document, served from policy_analyses unless force_refresh is set;
+# returns the analysis and whether it came from the table
+def get_policy_analysis(content: str, force_refresh: bool = False, stats: Optional[dict] = None):
+    content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+    analyzer_version = current_analyzer_version()
+    db = thread_db()
+    if not force_refresh:
+        row = db.execute(
+            "SELECT analysis FROM policy_analyses WHERE content_hash = ? AND analyzer_version = ?",
+            (content_hash, analyzer_version)
+        ).fetchone()
+        if row:
+            if stats is not None:
+                stats.update(chunks_analyzed=0)
+            return json.loads(row[0]), True
+    
+    analysis = analyze_policy_with_gemini(content, force_refresh, stats)
+    # Results that fell back to rules after a model error are not stored
+    if not analysis.pop("degraded", False):
+        db.execute('''
+            INSERT OR REPLACE INTO policy_analyses (content_hash, analyzer_version, analysis, created_at)
+            VALUES (?, ?, ?, ?)
+        ''', (content_hash, analyzer_version, json.dumps(analysis), datetime.utcnow().isoformat()))
+        db.commit()
+    return analysis, False
+
+# Merge per-chunk analyses, dropping requirements repeated across chunk overlaps
+def merge_chunk_analyses(analyses: List[dict], chunks: List[dict]):
+    requirements = []
+    seen = set()
+    for analysis, chunk in zip(analyses, chunks):
+        for requirement in analysis.get("requirements", []):
+            key = requirement_key(str(requirement.get("text", "")))
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            requirements.append({
+                **requirement,
+                "id": f"req_{len(requirements) + 1}",
+                "section": requirement.get("section") or chunk["section"] or None
+            })
+    
+    guidelines = {}
+    for analysis in analyses:
+        for guideline in analysis.get("compliance_guidelines", []):
+            guidelines.setdefault(requirement_key(str(guideline)), guideline)
+    
+    summaries = [analysis.get("summary", "") for analysis in analyses if analysis.get("summary")]
+    return {
+        "requirements": requirements,
+        "risk_categories": list(dict.fromkeys(
+            category for analysis in analyses for category in analysis.get("risk_categories", [])
+        )),
+        "compliance_guidelines": list(guidelines.values()),
+        "summary": " ".join(dict.fromkeys(summaries))[:1000],
+        "degraded": any(analysis.get("degraded") for analysis in analyses)
+    }
+
+# Analyze one document or chunk with Gemini
+def analyze_chunk_with_gemini(content: str, section: Optional[str] = None):
     try:
+        excerpt = f"This is an excerpt of a longer document, from: {section}\n" if section else ""
+        
         # Create a prompt for the AI to analyze the policy
         prompt = f"""
         Analyze the following regulatory policy document and extract structured information:
-        
+        {excerpt}
         POLICY DOCUMENT:
         {content}
         
@@ -119,128 +499,425 @@ def analyze_policy_with_gemini(content: str):
     except Exception as e:
         print(f"Error analyzing policy with Gemini: {str(e)}")
         # Fallback to simple extraction
-        return extract_policy_requirements_simple(content)
+        return {**extract_policy_requirements_simple(content), "degraded": True}
 
 # Extract policy information from text response
 def extract_policy_info_from_text(text):
-    # Simple extraction logic - in a real implementation, this would be more sophisticated
-    requirements = []
-    risk_categories = []
-    compliance_guidelines = []
-    summary = text[:200]  # First 200 characters as summary
-    
-    # Try to extract requirements from text
-    sentences = text.split('.')
-    for i, sentence in enumerate(sentences[:10]):  # First 10 sentences
-        if 'must' in sentence.lower() or 'shall' in sentence.lower() or 'required' in sentence.lower():
-            requirements.append({
-                "id": f"req_{i}",
-                "text": sentence.strip(),
-                "risk_level": "medium" if "must" in sentence.lower() else "low"
-            })
-    
+    # Requirements from the first 10 sentences of the model's answer
     return {
-        "requirements": requirements,
-        "risk_categories": risk_categories,
-        "compliance_guidelines": compliance_guidelines,
-        "summary": summary
+        "requirements": requirement_extractor.extract(text, max_sentences=10),
+        "risk_categories": [],
+        "compliance_guidelines": [],
+        "summary": text[:200]  # First 200 characters as summary
     }
 
-# Simple policy extraction (fallback)
+# Simple policy extraction (fallback): every sentence with an obligation term,
+# with its character offsets and section
 def extract_policy_requirements_simple(content: str):
-    # This is a placeholder for the actual AI processing
-    # In a real implementation, this would call the Gemini API to extract requirements
-    requirements = []
-    # Simple extraction logic for demonstration
-    sentences = content.split('.')
-    for i, sentence in enumerate(sentences):
-        if 'must' in sentence.lower() or 'shall' in sentence.lower() or 'required' in sentence.lower():
-            requirements.append({
-                "id": f"req_{i}",
-                "text": sentence.strip(),
-                "risk_level": "medium" if "must" in sentence.lower() else "low"
-            })
     return {
-        "requirements": requirements,
+        "requirements": requirement_extractor.extract(content),
         "risk_categories": ["general"],
         "compliance_guidelines": ["Follow policy requirements"],
         "summary": content[:200] if len(content) > 200 else content
     }
 
-# Simulated embedding generation (in a real implementation, this would use a model to generate embeddings)
-def generate_embeddings(content: str):
-    # This is a placeholder for the actual embedding generation
-    # In a real implementation, this would use a model to generate embeddings
-    # For now, we'll just return a simple hash of the content
-    return hashlib.md5(content.encode()).hexdigest()
+# Generate an embedding vector, returning it with the name of the model used
+def generate_embeddings(content: str, task_type: str = "retrieval_document"):
+    if USE_REMOTE_EMBEDDINGS:
+        try:
+            result = genai.embed_content(model=EMBEDDING_MODEL_NAME, content=content[:EMBED_MAX_CHARS],
+                                         task_type=task_type)
+            return result['embedding'], EMBEDDING_MODEL_NAME
+        except Exception as e:
+            print(f"Error generating embeddings with Gemini: {str(e)}")
+    # Offline fallback; vectors from another model are re-embedded at next startup
+    return local_embedder.embed(content), f"local-hash-{local_embedder.dim}"
+
+# Embed many texts in as few requests as the backend allows, returning the vectors
+# with the name of the model used
+def generate_embeddings_batch(texts: List[str], task_type: str = "retrieval_document"):
+    if USE_REMOTE_EMBEDDINGS:
+        try:
+            vectors = []
+            for start in range(0, len(texts), EMBED_BATCH_LIMIT):
+                result = genai.embed_content(model=EMBEDDING_MODEL_NAME,
+                                             content=[text[:EMBED_MAX_CHARS] for text in texts[start:start + EMBED_BATCH_LIMIT]],
+                                             task_type=task_type)
+                vectors.extend(result['embedding'])
+            return vectors, EMBEDDING_MODEL_NAME
+        except Exception as e:
+            print(f"Error generating embeddings with Gemini: {str(e)}")
+    return local_embedder.embed_many(texts).tolist(), f"local-hash-{local_embedder.dim}"
+
+# Query embeddings are cached, since the same searches tend to repeat
+@lru_cache(maxsize=1024)
+def embed_query(text: str):
+    vector, model_name = generate_embeddings(text, task_type="retrieval_query")
+    return tuple(vector), model_name
+
+# A document's embedding: the length-weighted mean of its chunks' embeddings, with
+# chunk vectors reused from chunk_embeddings so only changed chunks are embedded.
+# Returns the vector and model name; stats, when given, receives the chunk counts
+def embed_policy_content(content: str, stats: Optional[dict] = None):
+    chunks = chunk_document(content, EMBED_MAX_CHARS, 0) or [{'section': '', 'text': content}]
+    hashes = [chunk_hash(chunk) for chunk in chunks]
+    db = thread_db()
+    vectors = {}
+    for i in range(0, len(hashes), 500):
+        batch = hashes[i:i + 500]
+        vectors.update((row[0], from_blob(row[1])) for row in db.execute(
+            f"SELECT chunk_hash, embedding FROM chunk_embeddings WHERE model = ? "
+            f"AND chunk_hash IN ({', '.join('?' * len(batch))})", (ACTIVE_EMBEDDING_MODEL, *batch)
+        ))
+    missing = list(dict.fromkeys(key for key in hashes if key not in vectors))
+    model_name = ACTIVE_EMBEDDING_MODEL
+    if missing:
+        texts = {key: chunk['text'] for key, chunk in zip(hashes, chunks)}
+        embedded, model_name = generate_embeddings_batch([texts[key] for key in missing])
+        if model_name == ACTIVE_EMBEDDING_MODEL:
+            now = datetime.utcnow().isoformat()
+            db.executemany(
+                "INSERT OR REPLACE INTO chunk_embeddings (chunk_hash, model, embedding, created_at) VALUES (?, ?, ?, ?)",
+                [(key, model_name, to_blob(vector), now) for key, vector in zip(missing, embedded)]
+            )
+            db.commit()
+            vectors.update((key, np.asarray(vector, dtype=np.float32)) for key, vector in zip(missing, embedded))
+        else:
+            # The active model failed; embed every chunk with the fallback so the mean is not mixed
+            vectors = dict(zip(hashes, local_embedder.embed_many([chunk['text'] for chunk in chunks])))
+    if stats is not None:
+        stats.update(embedding_chunks=len(chunks), chunks_embedded=len(missing))
+    
+    weights = np.array([len(chunk['text']) for chunk in chunks], dtype=np.float32)
+    vector = (np.stack([vectors[key] for key in hashes]) * weights[:, None]).sum(axis=0)
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist(), model_name
+
+# Store a policy's embedding and make it searchable
+def save_policy_embedding(policy_id: str, title: str, jurisdiction: str, category: str, content: str,
+                          stats: Optional[dict] = None):
+    vector, model_name = embed_policy_content(content, stats)
+    db = thread_db()
+    db.execute("UPDATE policies SET embedding = ?, embeddings = ? WHERE id = ?",
+               (to_blob(vector), model_name, policy_id))
+    db.commit()
+    if model_name == ACTIVE_EMBEDDING_MODEL:
+        policy_index.add(policy_id, vector, title, jurisdiction, category)
+    else:
+        policy_index.remove(policy_id)
+    return model_name
+
+# Load stored embeddings into the in-memory index; returns ids that need (re-)embedding
+def load_policy_index():
+    stale = []
+    for policy_id, title, jurisdiction, category, blob, model_name in thread_db().execute(
+        "SELECT id, title, jurisdiction, category, embedding, embeddings FROM policies"
+    ):
+        if blob is not None and model_name == ACTIVE_EMBEDDING_MODEL:
+            policy_index.add(policy_id, from_blob(blob), title, jurisdiction, category)
+        else:
+            stale.append(policy_id)
+    return stale
+
+# Embed policies that have no vector from the active model yet, off the request path
+def backfill_embeddings(policy_ids: List[str]):
+    for policy_id in policy_ids:
+        try:
+            row = thread_db().execute("SELECT title, jurisdiction, category, content FROM policies WHERE id = ?",
+                                      (policy_id,)).fetchone()
+            if row:
+                save_policy_embedding(policy_id, row[0], row[1], row[2], row[3] or "")
+        except Exception as e:
+            print(f"Error embedding policy {policy_id}: {str(e)}")
+
+# Store a policy's MinHash signature and add it to the near-duplicate index
+def save_policy_signature(policy_id: str, title: str, signature):
+    db = thread_db()
+    if signature is None:
+        db.execute("DELETE FROM policy_minhash WHERE policy_id = ?", (policy_id,))
+        near_duplicate_index.remove(policy_id)
+    else:
+        db.execute("INSERT OR REPLACE INTO policy_minhash (policy_id, scheme, signature) VALUES (?, ?, ?)",
+                   (policy_id, minhasher.scheme, signature.tobytes()))
+        near_duplicate_index.add(policy_id, signature, title)
+    db.commit()
+
+# Policies whose text is near-identical to a signature's, most similar first
+def find_near_duplicates(signature, threshold: float = NEAR_DUPLICATE_THRESHOLD, exclude_id: Optional[str] = None):
+    if signature is None:
+        return []
+    return [{"id": policy_id, "title": title, "similarity": round(score, 4)}
+            for policy_id, title, score in near_duplicate_index.query(signature, threshold, exclude_id)]
+
+# Load stored signatures into the LSH index; returns ids that need (re-)signing
+def load_near_duplicate_index():
+    stale = []
+    for policy_id, title, scheme, blob in thread_db().execute('''
+        SELECT p.id, p.title, m.scheme, m.signature FROM policies p LEFT JOIN policy_minhash m ON m.policy_id = p.id
+    '''):
+        if blob is not None and scheme == minhasher.scheme:
+            near_duplicate_index.add(policy_id, np.frombuffer(blob, dtype=np.uint32), title)
+        else:
+            stale.append(policy_id)
+    return stale
+
+# Sign policies stored before near-duplicate detection, off the request path
+def backfill_signatures(policy_ids: List[str]):
+    for policy_id in policy_ids:
+        try:
+            row = thread_db().execute("SELECT title, content FROM policies WHERE id = ?", (policy_id,)).fetchone()
+            if row:
+                save_policy_signature(policy_id, row[0], minhasher.signature(row[1] or ""))
+        except Exception as e:
+            print(f"Error signing policy {policy_id}: {str(e)}")
+
+# Insert or replace a policy record, returning it; an upsert rather than
+# INSERT OR REPLACE, whose implicit delete would skip the search index triggers
+def insert_policy(policy_id: str, title: str, content: str, jurisdiction: str, category: str):
+    policy_data = {
+        'id': policy_id,
+        'title': title,
+        'content': content,
+        'jurisdiction': jurisdiction,
+        'category': category,
+        'created_at': datetime.utcnow().isoformat(),
+        'embeddings': None
+    }
+    db = thread_db()
+    db.execute('''
+        INSERT INTO policies (id, title, content, jurisdiction, category, created_at, embeddings)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET title = excluded.title, content = excluded.content,
+            jurisdiction = excluded.jurisdiction, category = excluded.category,
+            created_at = excluded.created_at, embeddings = excluded.embeddings
+    ''', (
+        policy_data['id'],
+        policy_data['title'],
+        policy_data['content'],
+        policy_data['jurisdiction'],
+        policy_data['category'],
+        policy_data['created_at'],
+        policy_data['embeddings']
+    ))
+    db.commit()
+    return policy_data
+
+# Process one upload job on a pipeline worker: extract, analyze, store and embed
+def process_upload_job(job: dict, set_stage):
+    set_stage("extracting")
+    content, text_cached = document_extractor.extract(job['filename'], job['document'])
+    
+    # Near-duplicates of an already stored policy are linked to it when asked, skipping
+    # analysis and embedding; a resumed job does not match its own policy
+    set_stage("deduplicating")
+    signature = minhasher.signature(content)
+    duplicates = find_near_duplicates(signature, exclude_id=job['id'])
+    if duplicates and job['options'].get('on_duplicate') == "link":
+        return {"policy_id": duplicates[0]['id'], "linked": True, "near_duplicates": duplicates,
+                "text_cached": text_cached}
+    
+    set_stage("analyzing")
+    stats = {}
+    analysis, cached = get_policy_analysis(content, stats=stats)
+    
+    # The policy takes the job's id, so a job resumed after a restart cannot store it twice
+    set_stage("storing")
+    policy_data = insert_policy(job['id'], job['title'], content, job['jurisdiction'], job['category'])
+    version = policy_versions.record(job['id'], job['title'], content, job['jurisdiction'], job['category'])
+    save_policy_signature(job['id'], job['title'], signature)
+    
+    compile_policy_rules(job['id'], version['version'], content, analysis)
+    
+    set_stage("embedding")
+    policy_data['embeddings'] = save_policy_embedding(policy_data['id'], job['title'], job['jurisdiction'],
+                                                      job['category'], content, stats)
+    policy_versions.set_stats(job['id'], version['version'], stats)
+    
+    policy_data.pop('content')
+    return {"policy_id": policy_data['id'], "policy": policy_data, "version": version['version'],
+            "analysis": analysis, "cached": cached, "text_cached": text_cached, "linked": False,
+            "near_duplicates": duplicates}
+
+# Compile a policy version's requirements into a rule artifact and store it; the
+# analysis is looked up (or computed) when not given. Returns the artifact JSON and ETag
+def compile_policy_rules(policy_id: str, version: int, content: str, analysis: Optional[dict] = None):
+    analyzer_version = current_analyzer_version()
+    if analysis is None:
+        analysis, _ = get_policy_analysis(content)
+    compiled = rule_compiler.compile(analysis.get("requirements", []))
+    artifact = {
+        "policy_id": policy_id,
+        "policy_version": version,
+        "compiler_version": COMPILER_VERSION,
+        "analyzer_version": analyzer_version,
+        "content_hash": hashlib.sha256(content.encode('utf-8')).hexdigest(),
+        "rules": compiled["rules"],
+        "uncompiled": compiled["uncompiled"],
+        "compiled_at": datetime.utcnow().isoformat()
+    }
+    etag = artifact_etag(artifact)
+    body = json.dumps(artifact)
+    db = thread_db()
+    db.execute('''
+        INSERT OR REPLACE INTO policy_rules (policy_id, version, rule_key, etag, artifact, compiled_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (policy_id, version, rule_key(analyzer_version), etag, body, artifact["compiled_at"]))
+    db.commit()
+    return body, etag
+
+# Version number whose rules GET /policies/{id}/rules serves: the requested one, or
+# the latest; policies stored before versioning get their current text as version 1
+def resolve_rules_version(policy_id: str, version: Optional[int]):
+    if version is not None:
+        return version
+    latest = policy_versions.latest(policy_id)
+    if latest is None:
+        row = thread_db().execute("SELECT title, content, jurisdiction, category FROM policies WHERE id = ?",
+                                  (policy_id,)).fetchone()
+        if row:
+            latest = policy_versions.record(policy_id, *row)['version']
+    return latest
 
-# Upload policy document
-@app.post("/upload")
+# Whether an If-None-Match header names the ETag, compared weakly (RFC 9110 13.1.2)
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag.removeprefix("W/") in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+# Stored ETag of a version's rules, if compiled by the current compiler and analyzer
+def stored_rules_etag(policy_id: str, version: int):
+    row = thread_db().execute("SELECT etag FROM policy_rules WHERE policy_id = ? AND version = ? AND rule_key = ?",
+                              (policy_id, version, rule_key(current_analyzer_version()))).fetchone()
+    return row[0] if row else None
+
+# A version's rule artifact JSON and ETag, compiled on first request; None if the
+# version does not exist
+def load_policy_rules(policy_id: str, version: int):
+    row = thread_db().execute(
+        "SELECT artifact, etag FROM policy_rules WHERE policy_id = ? AND version = ? AND rule_key = ?",
+        (policy_id, version, rule_key(current_analyzer_version()))
+    ).fetchone()
+    if row:
+        return row[0], row[1]
+    found = policy_versions.version(policy_id, version)
+    if not found:
+        return None
+    return compile_policy_rules(policy_id, version, found['content'])
+
+# Re-analyze and re-embed a changed policy. Unchanged chunks are served from the
+# chunk caches, so the cost follows the size of the change; the counts are kept
+# on the version the first time it is processed
+def refresh_policy(policy_id: str, title: str, content: str, jurisdiction: str, category: str, version: dict):
+    stats = {}
+    analysis, _ = get_policy_analysis(content, stats=stats)
+    compile_policy_rules(policy_id, version['version'], content, analysis)
+    model_name = save_policy_embedding(policy_id, title, jurisdiction, category, content, stats)
+    save_policy_signature(policy_id, title, minhasher.signature(content))
+    if version['stats'] is None:
+        policy_versions.set_stats(policy_id, version['version'], stats)
+    return model_name, stats
+
+upload_pipeline = UploadPipeline(DATABASE_URL, process_upload_job, workers=UPLOAD_WORKERS)
+
+# Load the in-memory indexes, start the backfills and resume unfinished uploads
+# when the server starts rather than on import: extraction worker processes
+# import this module too, and must not re-run uploads another process owns
+def start_background_work():
+    stale_policy_ids = load_policy_index()
+    if stale_policy_ids:
+        threading.Thread(target=backfill_embeddings, args=(stale_policy_ids,), daemon=True).start()
+    unsigned_policy_ids = load_near_duplicate_index()
+    if unsigned_policy_ids:
+        threading.Thread(target=backfill_signatures, args=(unsigned_policy_ids,), daemon=True).start()
+    upload_pipeline.start()
+
+# Title for an uploaded file when none is given
+def default_title(filename: Optional[str]):
+    return filename.rsplit('.', 1)[0] if filename else "Untitled Policy"
+
+# Upload policy document; the document is stored and processed in the background.
+# on_duplicate=link links a near-duplicate of a stored policy to it instead of
+# analyzing it again; the default, flag, processes it and lists the duplicates
+@app.post("/upload", status_code=202)
 async def upload_policy(
     file: UploadFile = File(...),
     title: Optional[str] = None,
     jurisdiction: str = "default",
-    category: str = "general"
+    category: str = "general",
+    on_duplicate: str = "flag"
 ):
-    if not file.filename or not file.filename.endswith(('.txt', '.pdf', '.docx')):
+    if not file.filename or not file.filename.lower().endswith(ALLOWED_EXTENSIONS):
         raise HTTPException(status_code=400, detail="Only TXT, PDF, or DOCX files are allowed")
+    if on_duplicate not in DUPLICATE_ACTIONS:
+        raise HTTPException(status_code=400, detail="on_duplicate must be 'flag' or 'link'")
     
     try:
-        # Read file content
-        content = (await file.read()).decode('utf-8')
-        
-        # Generate title if not provided
-        if not title:
-            title = file.filename.split('.')[0] if file.filename else "Untitled Policy"
-        
-        # Analyze policy using AI
-        analysis = analyze_policy_with_gemini(content)
-        
-        # Generate embeddings for similarity search
-        embeddings = generate_embeddings(content)
-        
-        # Create policy record
-        policy_id = str(uuid.uuid4())
-        created_at = datetime.utcnow().isoformat()
-        
-        policy_data = {
-            'id': policy_id,
-            'title': title,
-            'content': content,
-            'jurisdiction': jurisdiction,
-            'category': category,
-            'created_at': created_at,
-            'embeddings': embeddings
-        }
-        
-        # Insert into database
-        cursor.execute('''
-            INSERT INTO policies (id, title, content, jurisdiction, category, created_at, embeddings)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            policy_data['id'],
-            policy_data['title'],
-            policy_data['content'],
-            policy_data['jurisdiction'],
-            policy_data['category'],
-            policy_data['created_at'],
-            policy_data['embeddings']
-        ))
-        
-        conn.commit()
-        
+        document = await file.read()
+        job = await asyncio.to_thread(upload_pipeline.submit, file.filename, document,
+                                      title or default_title(file.filename), jurisdiction, category,
+                                      options={"on_duplicate": on_duplicate})
         return {
-            "message": "Policy uploaded and processed successfully",
-            "policy": policy_data,
-            "analysis": analysis
+            "message": "Policy queued for processing",
+            "job_id": job['id'],
+            "status_url": f"/jobs/{job['id']}"
         }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error queuing policy: {str(e)}")
+
+# Upload many policy documents as one batch
+@app.post("/upload/batch", status_code=202)
+async def upload_policy_batch(
+    files: List[UploadFile] = File(...),
+    jurisdiction: str = "default",
+    category: str = "general",
+    on_duplicate: str = "flag"
+):
+    rejected = [file.filename for file in files
+                if not file.filename or not file.filename.lower().endswith(ALLOWED_EXTENSIONS)]
+    if rejected:
+        raise HTTPException(status_code=400, detail=f"Only TXT, PDF, or DOCX files are allowed: {', '.join(map(str, rejected))}")
+    if on_duplicate not in DUPLICATE_ACTIONS:
+        raise HTTPException(status_code=400, detail="on_duplicate must be 'flag' or 'link'")
     
+    try:
+        batch_id = str(uuid.uuid4())
+        jobs = []
+        for file in files:
+            document = await file.read()
+            job = await asyncio.to_thread(upload_pipeline.submit, file.filename, document,
+                                          default_title(file.filename), jurisdiction, category, batch_id,
+                                          {"on_duplicate": on_duplicate})
+            jobs.append({"job_id": job['id'], "filename": file.filename})
+        return {
+            "message": f"{len(jobs)} policies queued for processing",
+            "batch_id": batch_id,
+            "jobs": jobs,
+            "status_url": f"/batches/{batch_id}"
+        }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing policy: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error queuing policies: {str(e)}")
+
+# Status of one upload job, with the policy and analysis once completed
+@app.get("/jobs/{job_id}")
+async def get_upload_job(job_id: str):
+    job = await asyncio.to_thread(upload_pipeline.job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# Progress of a batch upload
+@app.get("/batches/{batch_id}")
+async def get_upload_batch(batch_id: str):
+    batch = await asyncio.to_thread(upload_pipeline.batch, batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch
 
 # Analyze existing policy
 @app.post("/analyze/{policy_id}", response_model=PolicyAnalysisResponse)
-async def analyze_policy(policy_id: str):
+async def analyze_policy(policy_id: str, force_refresh: bool = False):
     try:
         # Get policy from database
         cursor.execute("SELECT * FROM policies WHERE id = ?", (policy_id,))
@@ -253,13 +930,14 @@ async def analyze_policy(policy_id: str):
         content = row[2]  # Content is in the third column
         
         # Analyze policy using AI
-        analysis = analyze_policy_with_gemini(content)
+        analysis, cached = await asyncio.to_thread(get_policy_analysis, content, force_refresh)
         
         return PolicyAnalysisResponse(
             requirements=analysis["requirements"],
             risk_categories=analysis["risk_categories"],
             compliance_guidelines=analysis["compliance_guidelines"],
-            summary=analysis["summary"]
+            summary=analysis["summary"],
+            cached=cached
         )
     
     except HTTPException:
@@ -267,26 +945,141 @@ async def analyze_policy(policy_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error analyzing policy: {str(e)}")
 
-# Get all policies
-@app.get("/policies", response_model=List[PolicyResponse])
-async def get_policies():
-    cursor.execute("SELECT * FROM policies")
-    rows = cursor.fetchall()
+# List policies: summary view (no content) by default, filtered and paged by cursor.
+# The body stays a JSON array; the next page is linked from the X-Next-Cursor and
+# Link headers, and If-None-Match is answered from the listing version alone
+@app.get("/policies", response_model=List[PolicySummaryResponse])
+async def get_policies(
+    view: str = "summary",
+    jurisdiction: Optional[str] = None,
+    category: Optional[str] = None,
+    limit: int = POLICY_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None)
+):
+    if view not in ("summary", "full"):
+        raise HTTPException(status_code=400, detail="view must be 'summary' or 'full'")
+    if not 1 <= limit <= POLICY_PAGE_SIZE_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {POLICY_PAGE_SIZE_MAX}")
+    try:
+        after = int(cursor) if cursor else 0
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
-    policies = []
-    for row in rows:
-        policy = PolicyResponse(
-            id=row[0],
-            title=row[1],
-            content=row[2],
-            jurisdiction=row[3],
-            category=row[4],
-            created_at=row[5],
-            embeddings=row[6]
-        )
-        policies.append(policy)
+    db = thread_db()
+    version = db.execute("SELECT version FROM policy_listing_version WHERE id = 1").fetchone()[0]
+    etag = '"' + hashlib.sha1(
+        json.dumps([version, view, jurisdiction, category, limit, after]).encode('utf-8')
+    ).hexdigest()[:20] + '"'
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    columns = SUMMARY_COLUMNS if view == "summary" else FULL_COLUMNS
+    conditions = ["rowid > ?"]
+    params = [after]
+    if jurisdiction is not None:
+        conditions.append("jurisdiction = ?")
+        params.append(jurisdiction)
+    if category is not None:
+        conditions.append("category = ?")
+        params.append(category)
+    # One row past the page tells whether there is a next page
+    rows = db.execute(
+        f"SELECT rowid, {', '.join(columns)} FROM policies WHERE {' AND '.join(conditions)} ORDER BY rowid LIMIT ?",
+        (*params, limit + 1)
+    ).fetchall()
+    
+    headers = {"ETag": etag}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = str(rows[-1][0])
+        query = urlencode([(name, value) for name, value in (
+            ("view", view), ("jurisdiction", jurisdiction), ("category", category),
+            ("limit", limit), ("cursor", next_cursor)
+        ) if value is not None])
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'</policies?{query}>; rel="next"'
+    
+    return JSONResponse(content=[dict(zip(columns, row[1:])) for row in rows], headers=headers)
+
+# Full-text search over policy titles and content, best matches first. Words in q
+# must all appear (a trailing * matches a prefix); raw=true takes FTS5 query syntax
+@app.get("/policies/search", response_model=List[PolicySearchResult])
+async def search_policies(
+    q: str,
+    jurisdiction: Optional[str] = None,
+    category: Optional[str] = None,
+    limit: int = 20,
+    offset: int = 0,
+    raw: bool = False
+):
+    if not 1 <= limit <= 100 or offset < 0:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100 and offset not negative")
+    if raw:
+        query = q
+    else:
+        terms = []
+        for word in q.split():
+            prefix = word.endswith("*") and len(word) > 1
+            word = word.rstrip("*")
+            if word:
+                terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+        query = " ".join(terms)
+    if not query.strip():
+        raise HTTPException(status_code=400, detail="Empty search query")
+    
+    conditions = ["policies_fts MATCH ?"]
+    params = [query]
+    if jurisdiction is not None:
+        conditions.append("p.jurisdiction = ?")
+        params.append(jurisdiction)
+    if category is not None:
+        conditions.append("p.category = ?")
+        params.append(category)
+    try:
+        rows = thread_db().execute(f'''
+            SELECT p.id, p.title, p.jurisdiction, p.category, p.created_at,
+                   snippet(policies_fts, 1, '<mark>', '</mark>', '…', 16), rank
+            FROM policies_fts JOIN policies p ON p.rowid = policies_fts.rowid
+            WHERE {' AND '.join(conditions)}
+            ORDER BY rank LIMIT ? OFFSET ?
+        ''', (*params, limit, offset)).fetchall()
+    except sqlite3.OperationalError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid search query: {str(e)}")
+    
+    return [
+        PolicySearchResult(id=row[0], title=row[1], jurisdiction=row[2], category=row[3], created_at=row[4],
+                           snippet=row[5], score=-row[6])
+        for row in rows
+    ]
+
+# Find the policies most similar to a text or to a stored policy
+@app.get("/policies/similar", response_model=List[SimilarPolicyResponse])
+async def find_similar_policies(
+    text: Optional[str] = None,
+    policy_id: Optional[str] = None,
+    k: int = 5,
+    jurisdiction: Optional[str] = None,
+    category: Optional[str] = None
+):
+    if bool(text) == bool(policy_id):
+        raise HTTPException(status_code=400, detail="Provide either text or policy_id")
+    
+    if policy_id:
+        vector = policy_index.vector(policy_id)
+        if vector is None:
+            raise HTTPException(status_code=404, detail="Policy not found or not embedded yet")
+    else:
+        vector, model_name = embed_query(text)
+        if model_name != ACTIVE_EMBEDDING_MODEL:
+            raise HTTPException(status_code=503, detail="Embedding model unavailable, retry shortly")
     
-    return policies
+    matches = policy_index.search(vector, k, jurisdiction, category, exclude_id=policy_id)
+    return [
+        SimilarPolicyResponse(id=match_id, title=title, jurisdiction=match_jurisdiction,
+                              category=match_category, similarity=similarity)
+        for match_id, title, match_jurisdiction, match_category, similarity in matches
+    ]
 
 # Get policy by ID
 @app.get("/policies/{policy_id}", response_model=PolicyResponse)
@@ -309,6 +1102,83 @@ async def get_policy(policy_id: str):
     
     return policy
 
+# Stored policies whose text is near-identical to a policy's, by MinHash similarity
+@app.get("/policies/{policy_id}/duplicates", response_model=List[NearDuplicateResponse])
+async def get_policy_duplicates(policy_id: str, threshold: float = NEAR_DUPLICATE_THRESHOLD):
+    if not 0 < threshold <= 1:
+        raise HTTPException(status_code=400, detail="threshold must be between 0 and 1")
+    signature = near_duplicate_index.signature(policy_id)
+    if signature is None:
+        raise HTTPException(status_code=404, detail="Policy not found or not indexed yet")
+    return find_near_duplicates(signature, threshold, exclude_id=policy_id)
+
+# Machine-readable rules compiled from a policy version's requirements (the latest
+# version by default): amount thresholds, transaction types, indicator keywords and
+# time windows. Compiled once per version and answered with 304 on a matching ETag
+@app.get("/policies/{policy_id}/rules")
+async def get_policy_rules(
+    policy_id: str,
+    version: Optional[int] = None,
+    if_none_match: Optional[str] = Header(None)
+):
+    version = await asyncio.to_thread(resolve_rules_version, policy_id, version)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Policy not found")
+    
+    etag = await asyncio.to_thread(stored_rules_etag, policy_id, version)
+    if etag and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    try:
+        rules = await asyncio.to_thread(load_policy_rules, policy_id, version)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error compiling policy rules: {str(e)}")
+    if not rules:
+        raise HTTPException(status_code=404, detail="Policy version not found")
+    body, etag = rules
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+# Versions of a policy, oldest first, each with its section change counts against
+# the one before and the chunks that had to be analyzed and embedded for it
+@app.get("/policies/{policy_id}/versions", response_model=List[PolicyVersionResponse])
+async def get_policy_versions(policy_id: str):
+    versions = await asyncio.to_thread(policy_versions.versions, policy_id)
+    if not versions:
+        raise HTTPException(status_code=404, detail="Policy not found or has no versions")
+    return versions
+
+# One version of a policy, with its text
+@app.get("/policies/{policy_id}/versions/{version}", response_model=PolicyVersionResponse)
+async def get_policy_version(policy_id: str, version: int):
+    found = await asyncio.to_thread(policy_versions.version, policy_id, version)
+    if not found:
+        raise HTTPException(status_code=404, detail="Policy version not found")
+    return found
+
+# Section-level diff between two versions; by default the latest against the one before
+@app.get("/policies/{policy_id}/diff")
+async def diff_policy_versions(
+    policy_id: str,
+    base: Optional[int] = None,
+    target: Optional[int] = None,
+    context: int = 3,
+    include_unchanged: bool = False
+):
+    if target is None:
+        target = await asyncio.to_thread(policy_versions.latest, policy_id)
+        if target is None:
+            raise HTTPException(status_code=404, detail="Policy not found or has no versions")
+    if base is None:
+        base = target - 1
+    if not 0 <= context <= 100:
+        raise HTTPException(status_code=400, detail="context must be between 0 and 100")
+    diff = await asyncio.to_thread(policy_versions.diff, policy_id, base, target, context, include_unchanged)
+    if not diff:
+        raise HTTPException(status_code=404, detail="Policy version not found")
+    return diff
+
 # Add a single policy
 @app.post("/policies", response_model=PolicyResponse)
 async def add_policy(policy: Policy):
@@ -327,14 +1197,30 @@ async def add_policy(policy: Policy):
         ))
         
         conn.commit()
+        await asyncio.to_thread(policy_versions.record, policy.id, policy.title, policy.content,
+                                policy.jurisdiction, policy.category)
+        # MinHash of a long text is CPU-bound, so it is computed in the worker thread too
+        await asyncio.to_thread(lambda: save_policy_signature(policy.id, policy.title,
+                                                              minhasher.signature(policy.content)))
+        policy.embeddings = await asyncio.to_thread(save_policy_embedding, policy.id, policy.title,
+                                                    policy.jurisdiction, policy.category, policy.content)
         return policy
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error adding policy: {str(e)}")
 
-# Update a policy
-@app.put("/policies/{policy_id}", response_model=PolicyResponse)
+# Update a policy. The new text is stored as the policy's next version, and only the
+# chunks it changed are analyzed and embedded again
+@app.put("/policies/{policy_id}", response_model=PolicyUpdateResponse)
 async def update_policy(policy_id: str, policy: Policy):
     try:
+        cursor.execute("SELECT title, content, jurisdiction, category FROM policies WHERE id = ?", (policy_id,))
+        existing = cursor.fetchone()
+        if not existing:
+            raise HTTPException(status_code=404, detail="Policy not found")
+        # Policies stored before versioning keep their current text as version 1
+        if await asyncio.to_thread(policy_versions.latest, policy_id) is None:
+            await asyncio.to_thread(policy_versions.record, policy_id, *existing)
+        
         cursor.execute('''
             UPDATE policies 
             SET title = ?, content = ?, jurisdiction = ?, category = ?, created_at = ?, embeddings = ?
@@ -351,10 +1237,13 @@ async def update_policy(policy_id: str, policy: Policy):
         
         conn.commit()
         
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Policy not found")
-        
-        return policy
+        # Section diffing of a long policy takes a while, so it runs in a worker thread
+        version = await asyncio.to_thread(policy_versions.record, policy_id, policy.title, policy.content,
+                                          policy.jurisdiction, policy.category)
+        policy.embeddings, stats = await asyncio.to_thread(refresh_policy, policy_id, policy.title, policy.content,
+                                                           policy.jurisdiction, policy.category, version)
+        return PolicyUpdateResponse(**policy.dict(), version=version['version'], changes=version['changes'],
+                                    stats=stats)
     except HTTPException:
         raise
     except Exception as e:
@@ -370,6 +1259,11 @@ async def delete_policy(policy_id: str):
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Policy not found")
         
+        policy_index.remove(policy_id)
+        policy_versions.delete(policy_id)
+        cursor.execute("DELETE FROM policy_rules WHERE policy_id = ?", (policy_id,))
+        conn.commit()
+        save_policy_signature(policy_id, "", None)
         return {"message": "Policy deleted successfully"}
     except HTTPException:
         raise
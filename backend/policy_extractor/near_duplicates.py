@@ -0,0 +1,151 @@
+"""
+Near-duplicate policy detection with MinHash signatures and LSH banding
+"""
+import re
+import threading
+import zlib
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Shingles are runs of this many words
+SHINGLE_WORDS = 5
+# Signature length, split into BANDS bands of NUM_PERM // BANDS rows for LSH;
+# 16 bands of 8 rows make pairs of 0.85 similarity candidates with probability > 0.99
+# and pairs of 0.5 with probability < 0.07
+NUM_PERM = 128
+BANDS = 16
+# Smallest prime above 2**32; hash values and coefficients stay below 2**32,
+# so a * x + b never overflows 64 bits
+PRIME = (1 << 32) + 15
+# Shingles hashed per permutation pass, to bound the working matrix
+BLOCK_SHINGLES = 8192
+
+
+def shingle_hashes(text: str, words: int = SHINGLE_WORDS) -> np.ndarray:
+    """Distinct 32-bit hashes of the word ``words``-grams of a text
+
+    Each distinct word is hashed once with CRC-32, and the n-gram hashes are
+    built from the word hashes with vectorized polynomial rolling, so the
+    cost is dominated by tokenizing the text.
+    """
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    if not tokens:
+        return np.zeros(0, dtype=np.uint64)
+    vocabulary: Dict[str, int] = {}
+    positions = np.array([vocabulary.setdefault(token, len(vocabulary)) for token in tokens])
+    token_hashes = np.array([zlib.crc32(token.encode('utf-8')) for token in vocabulary], dtype=np.uint64)[positions]
+    width = min(words, len(token_hashes))
+    count = len(token_hashes) - width + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    for offset in range(width):
+        # uint64 arithmetic wraps, which is fine for mixing
+        hashes = hashes * np.uint64(1000003) + token_hashes[offset:offset + count]
+    return np.unique(hashes & np.uint64(0xFFFFFFFF))
+
+
+class MinHasher:
+    """MinHash signatures from ``num_perm`` universal hash permutations
+
+    The fraction of equal positions in two signatures estimates the Jaccard
+    similarity of the texts' shingle sets. Permutations are fixed by
+    ``seed``, so signatures from any process can be compared; ``scheme``
+    names the parameters they were computed with.
+    """
+
+    def __init__(self, num_perm: int = NUM_PERM, words: int = SHINGLE_WORDS, seed: int = 1):
+        self.num_perm = num_perm
+        self.words = words
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 32, num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, num_perm, dtype=np.uint64)
+        self.scheme = f"minhash-{num_perm}-w{words}-s{seed}"
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """``num_perm`` uint32 minimums, or None for a text without words"""
+        shingles = shingle_hashes(text, self.words)
+        if not len(shingles):
+            return None
+        signature = np.full(self.num_perm, PRIME, dtype=np.uint64)
+        for start in range(0, len(shingles), BLOCK_SHINGLES):
+            block = shingles[start:start + BLOCK_SHINGLES, None]
+            np.minimum(signature, ((block * self._a + self._b) % np.uint64(PRIME)).min(axis=0), out=signature)
+        return signature.astype(np.uint32)
+
+
+def similarity(first: np.ndarray, second: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.count_nonzero(first == second)) / len(first)
+
+
+class NearDuplicateIndex:
+    """LSH buckets over MinHash signatures, held in memory
+
+    Each signature is cut into ``bands`` bands; two policies become
+    candidates when any band matches exactly, which takes one dictionary
+    lookup per band whatever the number of policies. Candidates are then
+    checked against the full signatures.
+    """
+
+    def __init__(self, num_perm: int = NUM_PERM, bands: int = BANDS):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.rows = num_perm // bands
+        self.bands = bands
+        self._lock = threading.Lock()
+        self._buckets: List[Dict[bytes, Set[str]]] = [{} for _ in range(bands)]
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._titles: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def _keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def add(self, policy_id: str, signature: np.ndarray, title: str):
+        """Add or replace a policy's signature"""
+        with self._lock:
+            self._discard(policy_id)
+            self._signatures[policy_id] = signature
+            self._titles[policy_id] = title
+            for buckets, key in zip(self._buckets, self._keys(signature)):
+                buckets.setdefault(key, set()).add(policy_id)
+
+    def remove(self, policy_id: str):
+        with self._lock:
+            self._discard(policy_id)
+
+    def _discard(self, policy_id: str):
+        signature = self._signatures.pop(policy_id, None)
+        if signature is None:
+            return
+        self._titles.pop(policy_id, None)
+        for buckets, key in zip(self._buckets, self._keys(signature)):
+            members = buckets.get(key)
+            if members is not None:
+                members.discard(policy_id)
+                if not members:
+                    del buckets[key]
+
+    def signature(self, policy_id: str) -> Optional[np.ndarray]:
+        return self._signatures.get(policy_id)
+
+    def query(self, signature: np.ndarray, threshold: float,
+              exclude_id: Optional[str] = None) -> List[Tuple[str, str, float]]:
+        """
+        Policies whose estimated similarity to a signature is at least ``threshold``
+
+        Returns:
+            ``(policy id, title, similarity)`` tuples, most similar first
+        """
+        with self._lock:
+            candidates: Set[str] = set()
+            for buckets, key in zip(self._buckets, self._keys(signature)):
+                candidates.update(buckets.get(key, ()))
+            candidates.discard(exclude_id)
+            matches = [(policy_id, self._titles[policy_id], similarity(signature, self._signatures[policy_id]))
+                       for policy_id in candidates]
+        return sorted((match for match in matches if match[2] >= threshold), key=lambda match: (-match[2], match[0]))
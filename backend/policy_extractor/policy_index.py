@@ -0,0 +1,127 @@
+"""
+In-memory similarity index over policy embeddings
+"""
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def to_blob(vector) -> bytes:
+    """Compact little-endian float32 bytes for the ``embedding`` BLOB column"""
+    return np.asarray(vector, dtype='<f4').tobytes()
+
+
+def from_blob(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype='<f4')
+
+
+class PolicyIndex:
+    """Unit-normalized policy vectors in one contiguous matrix
+
+    Rows are kept dense: removing a policy moves the last row into its
+    slot, so a query is a single matrix-vector product plus an
+    ``argpartition`` over the live rows. Jurisdiction and category are held
+    alongside as arrays so filters are boolean masks, not SQL queries.
+    """
+
+    def __init__(self, dim: Optional[int] = None):
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._matrix = np.zeros((0, dim or 0), dtype=np.float32)
+        self._size = 0
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._titles: List[str] = []
+        self._jurisdictions: List[str] = []
+        self._categories: List[str] = []
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, policy_id: str) -> bool:
+        return policy_id in self._rows
+
+    def vector(self, policy_id: str) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self._rows.get(policy_id)
+            return None if row is None else self._matrix[row].copy()
+
+    def add(self, policy_id: str, vector, title: str, jurisdiction: str, category: str):
+        """Insert or replace one policy's vector"""
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector = vector / norm
+        with self._lock:
+            if self.dim is None or self._size == 0:
+                if self.dim != len(vector):
+                    self.dim = len(vector)
+                    self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+            elif len(vector) != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional embeddings, got {len(vector)}")
+
+            row = self._rows.get(policy_id)
+            if row is None:
+                if self._size == len(self._matrix):
+                    grown = np.zeros((max(1024, 2 * len(self._matrix)), self.dim), dtype=np.float32)
+                    grown[:self._size] = self._matrix[:self._size]
+                    self._matrix = grown
+                row = self._size
+                self._size += 1
+                self._rows[policy_id] = row
+                self._ids.append(policy_id)
+                self._titles.append(title)
+                self._jurisdictions.append(jurisdiction)
+                self._categories.append(category)
+            else:
+                self._titles[row] = title
+                self._jurisdictions[row] = jurisdiction
+                self._categories[row] = category
+            self._matrix[row] = vector
+
+    def remove(self, policy_id: str) -> bool:
+        with self._lock:
+            row = self._rows.pop(policy_id, None)
+            if row is None:
+                return False
+            last = self._size - 1
+            if row != last:
+                # Move the last policy into the freed row to keep the matrix dense
+                moved = self._ids[last]
+                self._matrix[row] = self._matrix[last]
+                for values in (self._ids, self._titles, self._jurisdictions, self._categories):
+                    values[row] = values[last]
+                self._rows[moved] = row
+            for values in (self._ids, self._titles, self._jurisdictions, self._categories):
+                values.pop()
+            self._size = last
+            return True
+
+    def search(self, vector, k: int = 5, jurisdiction: Optional[str] = None, category: Optional[str] = None,
+               exclude_id: Optional[str] = None) -> List[Tuple[str, str, str, str, float]]:
+        """Top-k ``(id, title, jurisdiction, category, cosine)`` for a query vector"""
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        with self._lock:
+            if self._size == 0 or k <= 0:
+                return []
+            if len(query) != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional query, got {len(query)}")
+            scores = self._matrix[:self._size] @ query
+            if jurisdiction is not None:
+                scores[np.asarray(self._jurisdictions) != jurisdiction] = -np.inf
+            if category is not None:
+                scores[np.asarray(self._categories) != category] = -np.inf
+            if exclude_id is not None and exclude_id in self._rows:
+                scores[self._rows[exclude_id]] = -np.inf
+
+            k = min(k, self._size)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind='stable')]
+            return [
+                (self._ids[row], self._titles[row], self._jurisdictions[row], self._categories[row], float(scores[row]))
+                for row in top if np.isfinite(scores[row])
+            ]
@@ -0,0 +1,231 @@
+"""
+Policy version history and section-level diffs
+"""
+import difflib
+import hashlib
+import json
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from chunking import split_sections
+
+VERSION_COLUMNS = ('policy_id', 'version', 'title', 'jurisdiction', 'category', 'content_hash', 'changes', 'stats',
+                   'created_at')
+CHANGE_STATES = ('added', 'removed', 'modified', 'unchanged')
+
+
+def section_hash(body: str) -> str:
+    """Hash of a section body, ignoring line wrapping and spacing"""
+    return hashlib.sha256(' '.join(body.split()).encode('utf-8')).hexdigest()[:16]
+
+
+def document_sections(content: str) -> List[Tuple[str, str]]:
+    """``(section path, body)`` pairs of a document; text before any heading is one section"""
+    return split_sections(content) or ([('', content.strip())] if content.strip() else [])
+
+
+def diff_sections(old_content: str, new_content: str, context: int = 3,
+                  include_unchanged: bool = False) -> Dict[str, Any]:
+    """
+    Section-level diff of two versions of a document
+
+    Sections are aligned by the hashes of their bodies, so moved or
+    re-wrapped text is not reported as changed. Within a run of differing
+    sections, those with the same section path are paired as modified and
+    the rest are added or removed.
+
+    Args:
+        old_content: Text of the earlier version
+        new_content: Text of the later version
+        context: Lines of context in each unified diff
+        include_unchanged: Also list the unchanged sections
+
+    Returns:
+        ``{"summary", "sections"}``: counts per change state, and one
+        ``{"status", "section", ...}`` entry per section in document order,
+        with a unified ``diff`` for every changed one
+    """
+    old = document_sections(old_content)
+    new = document_sections(new_content)
+    matcher = difflib.SequenceMatcher(None, [section_hash(body) for _, body in old],
+                                      [section_hash(body) for _, body in new], autojunk=False)
+
+    def changed(status: str, old_section: Optional[Tuple[str, str]], new_section: Optional[Tuple[str, str]]):
+        before = old_section[1].splitlines() if old_section else []
+        after = new_section[1].splitlines() if new_section else []
+        entry = {'status': status, 'section': (new_section or old_section)[0]}
+        if status == 'modified' and old_section[0] != new_section[0]:
+            entry['previous_section'] = old_section[0]
+        entry['diff'] = '\n'.join(difflib.unified_diff(before, after, lineterm='', n=context))
+        return entry
+
+    sections = []
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag == 'equal':
+            sections.extend({'status': 'unchanged', 'section': path} for path, _ in new[new_start:new_end])
+            continue
+        removed = list(range(old_start, old_end))
+        for index in range(new_start, new_end):
+            paired = next((i for i in removed if old[i][0] == new[index][0]), None)
+            if paired is None:
+                sections.append(changed('added', None, new[index]))
+            else:
+                removed.remove(paired)
+                sections.append(changed('modified', old[paired], new[index]))
+        sections.extend(changed('removed', old[i], None) for i in removed)
+
+    summary = {state: 0 for state in CHANGE_STATES}
+    for section in sections:
+        summary[section['status']] += 1
+    if not include_unchanged:
+        sections = [section for section in sections if section['status'] != 'unchanged']
+    return {'summary': summary, 'sections': sections}
+
+
+class PolicyVersionStore:
+    """Every stored revision of each policy, in ``policy_versions``
+
+    ``record`` appends a version when a policy's text or metadata changes
+    and keeps the section-level change summary against the version before
+    it; ``diff`` compares any two versions section by section.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def init_db(self):
+        """Create the version table"""
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS policy_versions (
+                policy_id TEXT,
+                version INTEGER,
+                title TEXT,
+                content TEXT,
+                jurisdiction TEXT,
+                category TEXT,
+                content_hash TEXT,
+                changes TEXT,
+                stats TEXT,
+                created_at TEXT,
+                PRIMARY KEY (policy_id, version)
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def record(self, policy_id: str, title: str, content: str, jurisdiction: str, category: str) -> Dict[str, Any]:
+        """
+        Store a policy's current state as its next version
+
+        Nothing is stored when the state equals the latest version, so
+        recording the same upload twice yields one version.
+
+        Returns:
+            The version, without its content
+        """
+        content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        conn = self._connect()
+        try:
+            # The write lock is taken before reading the latest version, so concurrent
+            # records of one policy cannot both pick the same next number
+            conn.execute('BEGIN IMMEDIATE')
+            latest = conn.execute('''
+                SELECT version, title, content, jurisdiction, category, content_hash FROM policy_versions
+                WHERE policy_id = ? ORDER BY version DESC LIMIT 1
+            ''', (policy_id,)).fetchone()
+            if latest and latest[5] == content_hash and (latest[1], latest[3], latest[4]) == (title, jurisdiction, category):
+                return self._row(conn, policy_id, latest[0])
+
+            version = latest[0] + 1 if latest else 1
+            changes = diff_sections(latest[2], content, context=0)['summary'] if latest else None
+            conn.execute('''
+                INSERT INTO policy_versions (policy_id, version, title, content, jurisdiction, category,
+                                             content_hash, changes, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (policy_id, version, title, content, jurisdiction, category, content_hash,
+                  json.dumps(changes) if changes else None, datetime.utcnow().isoformat()))
+            conn.commit()
+            return self._row(conn, policy_id, version)
+        finally:
+            conn.close()
+
+    def set_stats(self, policy_id: str, version: int, stats: Dict[str, Any]):
+        """Attach the cost of (re-)processing a version: chunks analyzed and embedded"""
+        conn = self._connect()
+        conn.execute("UPDATE policy_versions SET stats = ? WHERE policy_id = ? AND version = ?",
+                     (json.dumps(stats), policy_id, version))
+        conn.commit()
+        conn.close()
+
+    def _row(self, conn: sqlite3.Connection, policy_id: str, version: int) -> Optional[Dict[str, Any]]:
+        row = conn.execute(f"SELECT {', '.join(VERSION_COLUMNS)} FROM policy_versions WHERE policy_id = ? AND version = ?",
+                           (policy_id, version)).fetchone()
+        return self._decode(row) if row else None
+
+    @staticmethod
+    def _decode(row: tuple) -> Dict[str, Any]:
+        version = dict(zip(VERSION_COLUMNS, row))
+        version['changes'] = json.loads(version['changes']) if version['changes'] else None
+        version['stats'] = json.loads(version['stats']) if version['stats'] else None
+        return version
+
+    def latest(self, policy_id: str) -> Optional[int]:
+        """Number of a policy's latest version, or None before its first"""
+        conn = self._connect()
+        row = conn.execute("SELECT MAX(version) FROM policy_versions WHERE policy_id = ?", (policy_id,)).fetchone()
+        conn.close()
+        return row[0]
+
+    def versions(self, policy_id: str) -> List[Dict[str, Any]]:
+        """A policy's versions, oldest first, without their content"""
+        conn = self._connect()
+        rows = conn.execute(
+            f"SELECT {', '.join(VERSION_COLUMNS)} FROM policy_versions WHERE policy_id = ? ORDER BY version",
+            (policy_id,)
+        ).fetchall()
+        conn.close()
+        return [self._decode(row) for row in rows]
+
+    def version(self, policy_id: str, version: int) -> Optional[Dict[str, Any]]:
+        """One version of a policy, with its content"""
+        conn = self._connect()
+        found = self._row(conn, policy_id, version)
+        if found:
+            found['content'] = conn.execute(
+                "SELECT content FROM policy_versions WHERE policy_id = ? AND version = ?", (policy_id, version)
+            ).fetchone()[0]
+        conn.close()
+        return found
+
+    def diff(self, policy_id: str, base: int, target: int, context: int = 3,
+             include_unchanged: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Section-level diff between two versions of a policy
+
+        Returns:
+            The ``diff_sections`` result with ``base`` and ``target``, or None
+            if either version does not exist
+        """
+        conn = self._connect()
+        rows = dict(conn.execute(
+            "SELECT version, content FROM policy_versions WHERE policy_id = ? AND version IN (?, ?)",
+            (policy_id, base, target)
+        ).fetchall())
+        conn.close()
+        if base not in rows or target not in rows:
+            return None
+        return {'policy_id': policy_id, 'base': base, 'target': target,
+                **diff_sections(rows[base], rows[target], context, include_unchanged)}
+
+    def delete(self, policy_id: str):
+        """Drop a policy's history"""
+        conn = self._connect()
+        conn.execute("DELETE FROM policy_versions WHERE policy_id = ?", (policy_id,))
+        conn.commit()
+        conn.close()
@@ -0,0 +1,395 @@
+"""
+Streaming rule-based requirement extraction for policy text
+"""
+import re
+from bisect import bisect_left, bisect_right
+from itertools import chain
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from chunking import heading_level, is_heading
+
+# Obligation vocabulary: term -> risk level of a sentence containing it.
+# Multi-word terms match across line wraps; the longest term at a position wins
+OBLIGATION_TERMS = {
+    'must': 'medium',
+    'must not': 'high',
+    'shall': 'low',
+    'shall not': 'medium',
+    'required': 'low',
+    'is prohibited': 'high',
+    'are prohibited': 'high',
+    'may not': 'medium',
+    'is obliged to': 'low',
+    'are obliged to': 'low',
+    'is obligated to': 'low',
+    'are obligated to': 'low',
+    'mandatory': 'medium',
+    'no later than': 'medium',
+}
+RISK_ORDER = {'low': 0, 'medium': 1, 'high': 2}
+
+# Words whose trailing period does not end a sentence
+ABBREVIATIONS = {
+    'e.g', 'i.e', 'cf', 'vs', 'viz', 'al', 'approx', 'no', 'nos', 'sec', 'secs', 'art', 'arts', 'para', 'paras',
+    'subpara', 'ch', 'chap', 'pt', 'cl', 'reg', 'regs', 'fig', 'p', 'pp', 'vol', 'ed', 'mr', 'mrs', 'ms', 'dr',
+    'prof', 'inc', 'ltd', 'co', 'corp', 'plc', 'llc', 'dept', 'govt', 'jan', 'feb', 'mar', 'apr', 'jun', 'jul',
+    'aug', 'sep', 'sept', 'oct', 'nov', 'dec', 'u.s', 'u.k', 'e.u', 'u.s.c', 'c.f.r', 'st', 'ave', 'min', 'max',
+}
+
+
+def _abbreviation_guards(abbreviations: Iterable[str]) -> str:
+    """Lookbehinds rejecting a period just matched after one of the abbreviations as a whole token
+
+    A lookbehind must have a fixed width, so there is one per abbreviation length.
+    """
+    by_length: Dict[int, List[str]] = {}
+    for abbreviation in abbreviations:
+        by_length.setdefault(len(abbreviation), []).append(re.escape(abbreviation))
+    return ''.join(rf"(?<!(?<![^\s(])(?i:{'|'.join(sorted(words))})\.)" for _, words in sorted(by_length.items()))
+
+
+# Sentence ends: terminal punctuation (plus closing quotes/brackets), or a semicolon
+# or colon introducing an inline "(b) ..." clause, followed by what may start a new
+# sentence. A period after an abbreviation or initials such as "U.S." ends nothing.
+# Whether a non-ASCII first letter is a capital, and whether the period closes a
+# clause number opening the sentence, are checked per match
+SENTENCE_BOUNDARY = re.compile(
+    rf"([.!?;:]{_abbreviation_guards(ABBREVIATIONS)}(?<![A-Za-z]\.[A-Za-z]\.)"
+    r"(?:(?<=[.!?])[\"'’”)\]]*|(?<=[;:])(?=\s+\((?:[a-z]|[ivx]{1,4}|\d{1,3})\)\s)))"
+    r"\s+(?=[\"'“‘\[]?(?:[^\W\d_a-z]|[\d§(]))"
+)
+# Opening quotes and brackets that may precede a sentence's first letter
+OPENING_MARKS = "\"'“‘["
+# Lines opening a numbered or lettered clause, or a bullet, start a new sentence
+CLAUSE_MARK = r"(?:\(?(?:\d+(?:\.\d+)+|\d+|[a-z]|[ivxlc]{1,5})[.)]|\((?:\d+|[a-z]|[ivxlc]{1,5})\)|\d+(?:\.\d+)+|[-*•])\s"
+CLAUSE_START = re.compile(rf"^\s*{CLAUSE_MARK}", re.IGNORECASE)
+# A clause number, e.g. "1.", "(a).", "iv."
+CLAUSE_NUMBER = re.compile(r"\(?(?:\d+(?:\.\d+)*|[ivxlc]{1,5}|[a-z])\)?\.", re.IGNORECASE)
+# Longest token, period included, that is checked against the above
+CLAUSE_NUMBER_WINDOW = 12
+# Last characters of a clause number, besides a single letter
+CLAUSE_NUMBER_ENDS = frozenset("0123456789)ivxlcIVXLC")
+
+# Lines that end a paragraph: blank lines, clause starts, and lines that may be a
+# heading or a numbered clause, which are told apart per line; anything else
+# continues the current paragraph. Matched from the line break before the line,
+# which the regex engine finds much faster than line starts
+PARAGRAPH_BREAK = re.compile(
+    r"\n[^\S\n]*(?:(?P<blank>$)"
+    r"|(?P<heading>(?=[#§\d]|(?i:section|sec\.|article|part|chapter|title|subpart|schedule|annex|appendix)\s"
+    r"|[A-Z][A-Z0-9 ,&'\-]{3}))"
+    rf"|(?P<clause>(?i:{CLAUSE_MARK})))",
+    re.MULTILINE
+)
+
+# Text is processed in blocks of about this many characters
+BLOCK_CHARS = 256 * 1024
+# Paragraphs longer than this are segmented before their end is seen
+MAX_PARAGRAPH_CHARS = 64 * 1024
+
+
+# Space between the words of a term: may wrap onto the next line, but not cross a blank line
+WORD_GAP = r"(?:[^\S\n]+\n?|\n)[^\S\n]*"
+
+
+def _trie_pattern(terms: Iterable[str]) -> str:
+    """Regex for a set of terms, built from their character trie
+
+    Terms sharing a prefix share one branch, so the regex engine makes a
+    single left-to-right pass without retrying each term in turn; longer
+    continuations are tried before a shorter term that ends at the node.
+    """
+    trie: Dict[str, Any] = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def emit(node: Dict[str, Any]) -> str:
+        branches = [(WORD_GAP if char == ' ' else re.escape(char)) + emit(child)
+                    for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        return f"(?:{body})?" if '' in node else body
+
+    return emit(trie)
+
+
+class RequirementExtractor:
+    """Single-pass obligation matcher over a sentence-segmented text stream
+
+    Text is consumed in blocks of whole lines from any iterable of string
+    chunks, so a multi-megabyte rulebook never has to be held in full.
+    Heading lines maintain the section path; body lines are grouped into
+    paragraphs. Each block is scanned once for every obligation term
+    together, and only paragraphs containing a term are split into
+    sentences. Each sentence containing a term is yielded with its
+    character offsets in the original text.
+    """
+
+    def __init__(self, terms: Optional[Dict[str, str]] = None):
+        self.terms = {' '.join(term.lower().split()): risk
+                      for term, risk in {**OBLIGATION_TERMS, **(terms or {})}.items()}
+        unknown = set(self.terms.values()) - set(RISK_ORDER)
+        if unknown:
+            raise ValueError(f"Unknown risk levels: {', '.join(sorted(unknown))}")
+        self._matcher = re.compile(rf"\b(?:{_trie_pattern(self.terms)})\b", re.IGNORECASE)
+        # Lower-cased text is matched one pattern per first word: each starts with a
+        # literal, which the regex engine finds far faster than a set of first letters,
+        # and checks the left word boundary with a lookbehind after that word
+        tails: Dict[str, List[str]] = {}
+        for term in self.terms:
+            word, _, rest = term.partition(' ')
+            tails.setdefault(word, []).append(rest)
+        self._word_matchers = []
+        for word, rests in sorted(tails.items()):
+            longer = [rest for rest in rests if rest]
+            tail = f"(?:{WORD_GAP}(?:{_trie_pattern(longer)}))" if longer else ''
+            if longer and '' in rests:
+                tail += '?'
+            literal = re.escape(word)
+            self._word_matchers.append(re.compile(rf"{literal}(?<!\w{literal}){tail}\b"))
+
+    def _is_heading(self, line: str, next_line: str) -> bool:
+        """Whether a line opens a section here: headings state no obligation and do
+        not run on into a next line starting in lower case"""
+        return is_heading(line) and not self._matcher.search(line) and not next_line.lstrip()[:1].islower()
+
+    def _term(self, match: re.Match) -> str:
+        term = match.group().lower()
+        return term if term in self.terms else ' '.join(term.split())
+
+    def _keywords(self, block: str) -> List[Tuple[int, int, str]]:
+        """``(start, end, term)`` of every obligation term in a block, in order"""
+        lowered = block.lower()
+        if len(lowered) == len(block):
+            # Every character lower-cased to one, so offsets and word boundaries carry over
+            found = sorted(chain.from_iterable(
+                [(match.start(), match.end(), match.group()) for match in matcher.finditer(lowered)]
+                for matcher in self._word_matchers
+            ))
+        else:
+            found = [(match.start(), match.end(), match.group().lower()) for match in self._matcher.finditer(block)]
+        terms = self.terms
+        keywords = []
+        last_end = 0
+        for start, end, term in found:
+            # A term inside a longer one found by another first word, e.g. "required"
+            # in "is required", is part of that match
+            if start >= last_end:
+                keywords.append((start, end, term if term in terms else ' '.join(term.split())))
+                last_end = end
+        return keywords
+
+    @staticmethod
+    def _ends_sentence(text: str, end: int, next_start: int, start: int) -> bool:
+        """Whether a ``SENTENCE_BOUNDARY`` match ending the sentence begun at ``start``
+        at ``end`` really does: the next letter is a capital, and the period does
+        not close a clause number such as "1." opening the sentence"""
+        first = text[next_start]
+        if first in OPENING_MARKS:
+            first = text[next_start + 1]
+        if first > '\x7f' and not first.isupper():
+            return False
+        if text[end - 1] == '.':
+            if text[end - 2:end - 1] in CLAUSE_NUMBER_ENDS or not text[end - 3:end - 2].isalpha():
+                token = text[max(start, end - CLAUSE_NUMBER_WINDOW):end].rsplit(None, 1)[-1]
+                if CLAUSE_NUMBER.fullmatch(token) and not text[start:end - len(token)].strip():
+                    return False
+        return True
+
+    def _scan_block(self, block: str, offset: int, paragraphs: List[Tuple[int, int, Optional[str]]],
+                    final: bool, budget: Optional[int]) -> Tuple[List[Dict[str, Any]], int, int]:
+        """
+        Requirements in the paragraphs of one block
+
+        Args:
+            block: Text of the block
+            offset: Position of the block in the document
+            paragraphs: ``(start, end, section)`` of each paragraph, in order
+            final: Whether the last paragraph is complete; if not, its
+                unfinished last sentence is left for the next block
+            budget: Sentences that may still be read, or None for no limit
+
+        Returns:
+            ``(requirements, sentences read, characters consumed)``
+        """
+        keywords = self._keywords(block)
+        starts = [keyword[0] for keyword in keywords]
+        terms = self.terms
+
+        # Sentences only matter around obligation terms, or when they are counted
+        work = []
+        first = 0
+        for index, (paragraph_start, paragraph_end, section) in enumerate(paragraphs):
+            first = bisect_left(starts, paragraph_start, first)
+            limit = bisect_left(starts, paragraph_end, first)
+            unfinished = not final and paragraph_end == len(block)
+            if limit > first or budget is not None or unfinished:
+                work.append((index, paragraph_start, paragraph_end, section, first, limit, unfinished))
+            first = limit
+
+        requirements = []
+        sentences = 0
+        consumed = len(block)
+        run = 0
+        while run < len(work):
+            # Consecutive paragraphs are segmented by one pass of the boundary pattern;
+            # a boundary is kept only if it lies within one paragraph
+            run_end = run + 1
+            while run_end < len(work) and work[run_end][0] == work[run_end - 1][0] + 1:
+                run_end += 1
+            boundaries = [(boundary.end(1), boundary.end())
+                          for boundary in SENTENCE_BOUNDARY.finditer(block, work[run][1], work[run_end - 1][2])]
+            stops = [boundary[0] for boundary in boundaries]
+            for _, paragraph_start, paragraph_end, section, first, limit, unfinished in work[run:run_end]:
+                start = paragraph_start
+                spans = []
+                for stop, next_start in boundaries[bisect_right(stops, paragraph_start):
+                                                   bisect_right(stops, paragraph_end)]:
+                    if next_start >= paragraph_end:
+                        break
+                    # Most boundaries need no further check: the next character is an ASCII
+                    # capital or digit and the period follows a word that cannot be a clause number
+                    first_char = block[next_start]
+                    if first_char > '\x7f' or first_char in OPENING_MARKS or block[stop - 1] == '.' and (
+                            block[stop - 2:stop - 1] in CLAUSE_NUMBER_ENDS or not block[stop - 3:stop - 2].isalpha()):
+                        if not self._ends_sentence(block, stop, next_start, start):
+                            continue
+                    spans.append((start, stop))
+                    start = next_start
+                if start > paragraph_start or block[start:paragraph_end].strip():
+                    spans.append((start, paragraph_end))
+                if unfinished and len(spans) > 1:
+                    consumed = spans.pop()[0]
+                if budget is not None:
+                    spans = spans[:budget - sentences]
+                    sentences += len(spans)
+
+                if limit > first and keywords[limit - 1][1] > paragraph_end:
+                    # A term running past the paragraph counts only as far as it is inside
+                    match = self._matcher.match(block, keywords[limit - 1][0], paragraph_end)
+                    if match:
+                        keywords[limit - 1] = (match.start(), match.end(), self._term(match))
+                    else:
+                        limit -= 1
+                for start, end in spans:
+                    if first == limit:
+                        break
+                    if starts[first] >= end:
+                        continue
+                    stop = bisect_left(starts, end, first, limit)
+                    if stop - first == 1:
+                        found = [keywords[first][2]]
+                        risk_level = terms[found[0]]
+                    else:
+                        found = list(dict.fromkeys([keyword[2] for keyword in keywords[first:stop]]))
+                        risk_level = max([terms[term] for term in found], key=RISK_ORDER.get)
+                    first = stop
+                    raw = block[start:end]
+                    stripped = raw.lstrip()
+                    lead = start + len(raw) - len(stripped)
+                    stripped = stripped.rstrip()
+                    requirements.append({
+                        'text': ' '.join(stripped.split()),
+                        'start': offset + lead,
+                        'end': offset + lead + len(stripped),
+                        'section': section,
+                        'keywords': found,
+                        'risk_level': risk_level,
+                    })
+                if budget is not None and sentences >= budget:
+                    return requirements, sentences, consumed
+            run = run_end
+        return requirements, sentences, consumed
+
+    def iter_requirements(self, chunks: Iterable[str], max_sentences: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield requirement sentences from a stream of text chunks
+
+        Args:
+            chunks: The document as an iterable of strings, e.g. a file object
+            max_sentences: Stop after this many sentences have been read
+
+        Returns:
+            Iterator of ``{"text", "start", "end", "section", "keywords",
+            "risk_level"}`` dictionaries, in document order
+        """
+        path: List[Tuple[int, str]] = []
+        section = None
+        sentences = 0
+        offset = 0
+        pending: List[str] = []
+        pending_chars = 0
+
+        for chunk in chain(chunks, [None]):
+            final = chunk is None
+            if not final:
+                pending.append(chunk)
+                pending_chars += len(chunk)
+                if pending_chars < BLOCK_CHARS:
+                    continue
+            buffer = ''.join(pending)
+            # Only complete lines can be classified as headings or clause starts
+            end = len(buffer) if final else buffer.rfind('\n') + 1
+            if not end and len(buffer) > MAX_PARAGRAPH_CHARS:
+                end = len(buffer)
+
+            # Paragraphs run between blank lines, headings and clause starts;
+            # only lines that could be one of those are looked at individually
+            block = buffer[:end]
+            paragraphs: List[Tuple[int, int, Optional[str]]] = []
+            paragraph = 0
+            # Offsets in '\n' + block are one past those in block
+            for candidate in PARAGRAPH_BREAK.finditer('\n' + block):
+                line_start = candidate.start()
+                if line_start == len(block):
+                    break
+                kind = candidate.lastgroup
+                blank = kind == 'blank'
+                heading = False
+                if blank:
+                    line_end = min(candidate.end(), len(block))
+                elif kind == 'heading':
+                    line_end = block.find('\n', line_start) + 1 or len(block)
+                    line = block[line_start:line_end]
+                    heading = self._is_heading(line, buffer[line_end:buffer.find('\n', line_end) + 1 or None])
+                    if not (heading or CLAUSE_START.match(line)):
+                        continue
+                if block[paragraph:line_start].strip():
+                    paragraphs.append((paragraph, line_start, section))
+                if heading:
+                    level = heading_level(line)
+                    while path and path[-1][0] >= level:
+                        path.pop()
+                    path.append((level, line.strip().lstrip('#').strip()))
+                    section = ' > '.join(title for _, title in path)
+                paragraph = line_end if blank or heading else line_start
+
+            # The last paragraph may continue in the next block
+            consumed = paragraph
+            unfinished = False
+            if block[paragraph:].strip() and (final or len(block) - paragraph > MAX_PARAGRAPH_CHARS):
+                paragraphs.append((paragraph, len(block), section))
+                consumed = len(block)
+                unfinished = not final
+            if paragraphs:
+                budget = None if max_sentences is None else max_sentences - sentences
+                found, count, scanned = self._scan_block(block[:consumed], offset, paragraphs, not unfinished, budget)
+                yield from found
+                sentences += count
+                if max_sentences is not None and sentences >= max_sentences:
+                    return
+                consumed = min(consumed, scanned)
+            offset += consumed
+            pending = [buffer[consumed:]]
+            pending_chars = len(pending[0])
+
+    def extract(self, text: str, max_sentences: Optional[int] = None) -> List[Dict[str, Any]]:
+        """All requirements in a text, numbered ``req_1``, ``req_2``, ..."""
+        return [
+            {'id': f"req_{number}", **requirement}
+            for number, requirement in enumerate(self.iter_requirements([text], max_sentences), start=1)
+        ]
@@ -0,0 +1,262 @@
+"""
+Compilation of extracted policy requirements into machine-readable rules
+"""
+import hashlib
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Bump when the rule format or the extraction below changes so stored
+# artifacts are compiled again
+COMPILER_VERSION = "1"
+
+CURRENCY_SYMBOLS = {'$': 'USD', '€': 'EUR', '£': 'GBP', '¥': 'JPY', '₹': 'INR'}
+CURRENCY_CODES = ('USD', 'EUR', 'GBP', 'JPY', 'INR', 'CHF', 'CAD', 'AUD', 'SGD', 'HKD')
+CURRENCY_WORDS = {'dollar': 'USD', 'euro': 'EUR', 'pound': 'GBP'}
+SCALES = {'thousand': 1e3, 'k': 1e3, 'million': 1e6, 'm': 1e6, 'mn': 1e6, 'billion': 1e9, 'bn': 1e9}
+
+_NUMBER = r"(?P<number>\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?)"
+_SCALE = r"(?:\s*(?P<scale>thousand|million|billion|bn|mn|[km])\b)?"
+# "$10,000", "USD 10,000", "EUR 1.5 million", "10,000 dollars", "15,000 EUR"
+AMOUNT_PATTERN = re.compile(
+    rf"(?:(?P<symbol>[$€£¥₹])\s?|\b(?P<code>{'|'.join(CURRENCY_CODES)})\s?){_NUMBER}{_SCALE}"
+    rf"|\b{_NUMBER.replace('number', 'number2')}{_SCALE.replace('scale', 'scale2')}"
+    rf"\s*(?:(?P<code2>{'|'.join(CURRENCY_CODES)})\b|(?P<word>dollar|euro|pound)s?\b)",
+    re.IGNORECASE
+)
+
+# Comparison implied by the words just before an amount, longest phrases first;
+# "or more" / "or less" just after an amount override them
+COMPARATORS = (
+    ('not less than', '>='), ('no less than', '>='), ('not more than', '<='), ('no more than', '<='),
+    ('not exceeding', '<='), ('not to exceed', '<='), ('in excess of', '>'), ('greater than', '>'),
+    ('more than', '>'), ('exceeding', '>'), ('exceeds', '>'), ('exceed', '>'), ('above', '>'), ('over', '>'),
+    ('at least', '>='), ('minimum of', '>='), ('less than', '<'), ('below', '<'), ('under', '<'),
+    ('up to', '<='), ('maximum of', '<='), ('between', '>='),
+)
+COMPARATOR_AFTER = re.compile(r"^\s*(?:or\s+(?:more|above|greater|higher)|and\s+(?:above|over))\b|^\s*(?P<less>or\s+(?:less|below|lower))\b",
+                              re.IGNORECASE)
+
+NUMBER_WORDS = {
+    'one': 1, 'single': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7, 'eight': 8, 'nine': 9,
+    'ten': 10, 'twelve': 12, 'fifteen': 15, 'twenty': 20, 'thirty': 30, 'forty-five': 45, 'sixty': 60,
+    'ninety': 90, 'hundred eighty': 180,
+}
+UNIT_SECONDS = {'hour': 3600, 'day': 86400, 'week': 7 * 86400, 'month': 30 * 86400, 'year': 365 * 86400}
+# "within 30 days", "thirty (30) calendar days", "5 years", "24 hours", "one business day"
+WINDOW_PATTERN = re.compile(
+    rf"\b(?P<number>\d+|{'|'.join(sorted(NUMBER_WORDS, key=len, reverse=True))})(?:\s*\(\d+\))?[\s-]*"
+    r"(?P<calendar>calendar\s+|business\s+|working\s+|banking\s+)?(?P<unit>hour|day|week|month|year)s?\b",
+    re.IGNORECASE
+)
+WINDOW_CONTEXT = (
+    ('deadline', re.compile(r"\b(?:within|no later than|not later than|before|after|by)\s*$")),
+    ('aggregation', re.compile(r"\b(?:in any|in a|during(?: any)?(?: a)?|per|over(?: a period of)?(?: any)?|rolling|each|same)\s*$")),
+    ('retention', re.compile(r"\b(?:for(?: a period of)?(?: at least)?|at least|minimum of|period of)\s*$")),
+)
+RETENTION_WORDS = re.compile(r"\b(?:retain|retained|retention|maintain|maintained|keep|kept|preserve|stored?)\b",
+                             re.IGNORECASE)
+# Windows named without a number
+DAILY_PATTERN = re.compile(r"\b(?:daily|same[- ]day|(?:in|within|during)\s+(?:a|any|one)\s+(?:single\s+)?(?:business\s+|calendar\s+)?day)\b",
+                           re.IGNORECASE)
+AGGREGATE_PATTERN = re.compile(
+    r"\b(?:aggregate|aggregated|cumulative|cumulatively|in total|combined|multiple transactions|series of|"
+    r"structur(?:e|ed|ing)|split(?:ting)?)\b",
+    re.IGNORECASE
+)
+
+# Canonical transaction types and the phrases naming them
+TRANSACTION_TYPES = {
+    'cash': r"\bcash\b|\bin currency\b|\bcurrency transactions?\b|\bbanknotes?\b",
+    'wire': r"\bwires?\b|\bwire transfers?\b|\bfunds transfers?\b|\bswift\b",
+    'monetary_instrument': r"\bcheques?\b|\bcashier'?s checks?\b|\btraveler'?s checks?\b|\bmoney orders?\b"
+                           r"|\bbank drafts?\b|\bmonetary instruments?\b",
+    'ach': r"\bach\b|\bdirect debits?\b|\bautomated clearing house\b",
+    'card': r"\b(?:credit|debit|prepaid) cards?\b|\bcard (?:payments?|transactions?)\b",
+    'crypto': r"\bcrypto(?:currenc(?:y|ies)|[- ]assets?)?\b|\bvirtual (?:currenc(?:y|ies)|assets?)\b"
+              r"|\bdigital assets?\b|\bbitcoin\b",
+    'international': r"\bcross[- ]border\b|\binternational\b|\bforeign (?:transfers?|transactions?|jurisdictions?)\b"
+                     r"|\boverseas\b",
+    'deposit': r"\bdeposits?\b",
+    'withdrawal': r"\bwithdrawals?\b",
+    'transfer': r"(?<!wire )(?<!funds )\btransfers?\b",
+}
+# Risk indicators a transaction's description or counterparty can be scanned for
+INDICATOR_TERMS = {
+    'structuring': r"\bstructur(?:e|ed|ing)\b|\bsmurfing\b",
+    'suspicious': r"\bsuspicious\b",
+    'sanctions': r"\bsanction(?:s|ed)?\b|\bofac\b|\bembargo(?:ed)?\b",
+    'politically exposed': r"\bpolitically exposed\b|\bpeps?\b",
+    'shell company': r"\bshell (?:compan(?:y|ies)|entit(?:y|ies))\b",
+    'high-risk jurisdiction': r"\bhigh[- ]risk (?:jurisdictions?|countr(?:y|ies))\b",
+    'terrorist financing': r"\bterroris[mt]\b|\bterrorist financing\b",
+    'money laundering': r"\bmoney laundering\b|\blaunder(?:ed|ing)?\b",
+    'fraud': r"\bfraud(?:ulent)?\b",
+    'bribery': r"\bbriber(?:y|ies)\b|\bcorruption\b",
+    'gambling': r"\bgambling\b|\bcasinos?\b",
+    'anonymous': r"\banonymous\b|\bnominee\b",
+    'third party': r"\bthird[- ]part(?:y|ies)\b",
+    'offshore': r"\boffshore\b",
+    'tax evasion': r"\btax evasion\b",
+}
+QUOTED_TERM = re.compile(r"[\"“]([^\"”\n]{3,40})[\"”]")
+
+# What a rule asks for, by the first matching verb pattern
+ACTIONS = (
+    ('prohibit', r"\b(?:must not|shall not|may not|is prohibited|are prohibited|prohibit|forbidden|not permitted|block)"),
+    ('report', r"\b(?:report|file|filing|notify|notification|disclose)"),
+    ('record_keeping', r"\b(?:retain|retention|records?|record-keeping|recordkeeping|maintain|keep)\b"),
+    ('verify', r"\b(?:verify|verification|identify|identification|due diligence|kyc|screen|check\b)"),
+    ('review', r"\b(?:review|monitor|investigate|assess|escalate|approve|approval)"),
+)
+
+
+def _compile_terms(terms: Dict[str, str]) -> List[Tuple[str, re.Pattern]]:
+    return [(name, re.compile(pattern, re.IGNORECASE)) for name, pattern in terms.items()]
+
+
+class RuleCompiler:
+    """Turns free-text requirements into structured, executable rules
+
+    Each requirement is scanned for amount thresholds (with comparison
+    operator and currency), transaction types, indicator keywords and
+    time windows (deadlines, retention periods and aggregation windows).
+    A requirement yielding at least one of these becomes a rule; the
+    others are listed as uncompiled, since no check can be derived from
+    them without reading the text.
+    """
+
+    def __init__(self):
+        self._transaction_types = _compile_terms(TRANSACTION_TYPES)
+        self._indicators = _compile_terms(INDICATOR_TERMS)
+        self._actions = [(action, re.compile(pattern, re.IGNORECASE)) for action, pattern in ACTIONS]
+
+    def thresholds(self, text: str) -> List[Dict[str, Any]]:
+        """Amount conditions, e.g. ``{"field": "amount", "op": ">", "value": 10000, "currency": "USD"}``"""
+        thresholds = []
+        previous_end = 0
+        previous_op = None
+        for match in AMOUNT_PATTERN.finditer(text):
+            number = match.group('number') or match.group('number2')
+            scale = (match.group('scale') or match.group('scale2') or '').lower()
+            value = float(number.replace(',', '')) * SCALES.get(scale, 1)
+            if match.group('symbol'):
+                currency = CURRENCY_SYMBOLS[match.group('symbol')]
+            elif match.group('code') or match.group('code2'):
+                currency = (match.group('code') or match.group('code2')).upper()
+            else:
+                currency = CURRENCY_WORDS[match.group('word').lower()]
+
+            before = ' '.join(text[max(previous_end, match.start() - 40):match.start()].lower().split())
+            op = '>='
+            # "between $3,000 and $10,000": the second amount is the upper bound
+            if previous_op == 'between' and re.fullmatch(r"(?:and|to|-)", before.strip()):
+                op = '<='
+            else:
+                for phrase, comparator in COMPARATORS:
+                    if before.endswith(phrase) or before.endswith(phrase + ' the equivalent of'):
+                        op = comparator
+                        break
+            after = COMPARATOR_AFTER.match(text[match.end():match.end() + 20])
+            if after:
+                op = '<=' if after.group('less') else '>='
+            previous_op = 'between' if before.endswith('between') else None
+            previous_end = match.end()
+            thresholds.append({'field': 'amount', 'op': op, 'value': int(value) if value.is_integer() else value,
+                               'currency': currency})
+        return thresholds
+
+    def windows(self, text: str) -> List[Dict[str, Any]]:
+        """Time windows, e.g. ``{"kind": "deadline", "value": 30, "unit": "day", "seconds": 2592000}``"""
+        windows = []
+        retention = bool(RETENTION_WORDS.search(text))
+        for match in WINDOW_PATTERN.finditer(text):
+            number = match.group('number').lower()
+            value = int(number) if number.isdigit() else NUMBER_WORDS[number]
+            unit = match.group('unit').lower()
+            before = ' '.join(text[max(0, match.start() - 30):match.start()].lower().split())
+            kind = next((name for name, pattern in WINDOW_CONTEXT if pattern.search(before)), None)
+            if kind == 'retention' and not retention:
+                kind = 'deadline' if before.endswith(('within', 'by')) else 'period'
+            window = {'kind': kind or ('retention' if retention and unit in ('month', 'year') else 'period'),
+                      'value': value, 'unit': unit, 'seconds': value * UNIT_SECONDS[unit]}
+            if match.group('calendar') and match.group('calendar').strip().lower() in ('business', 'working', 'banking'):
+                window['business_days'] = True
+            windows.append(window)
+        if not windows and DAILY_PATTERN.search(text):
+            windows.append({'kind': 'aggregation', 'value': 1, 'unit': 'day', 'seconds': UNIT_SECONDS['day']})
+        return windows
+
+    def transaction_types(self, text: str) -> List[str]:
+        """Canonical transaction types named in a text"""
+        return [name for name, pattern in self._transaction_types if pattern.search(text)]
+
+    def keywords(self, text: str) -> List[str]:
+        """Indicator terms and quoted phrases named in a text"""
+        found = [name for name, pattern in self._indicators if pattern.search(text)]
+        found.extend(term.strip().lower() for term in QUOTED_TERM.findall(text))
+        return list(dict.fromkeys(found))
+
+    def action(self, text: str) -> str:
+        return next((action for action, pattern in self._actions if pattern.search(text)), 'comply')
+
+    def compile(self, requirements: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Compile requirements into rules
+
+        Args:
+            requirements: ``{"id", "text", "risk_level", ...}`` dictionaries
+                from a policy analysis
+
+        Returns:
+            ``{"rules", "uncompiled"}``: one rule per requirement with at
+            least one condition, in requirement order, and the ids of the
+            requirements without any
+        """
+        rules = []
+        uncompiled = []
+        for requirement in requirements:
+            text = ' '.join(str(requirement.get('text', '')).split())
+            conditions = {}
+            thresholds = self.thresholds(text)
+            if thresholds:
+                conditions['amount'] = thresholds
+            transaction_types = self.transaction_types(text)
+            if transaction_types:
+                conditions['transaction_types'] = transaction_types
+            keywords = self.keywords(text)
+            if keywords:
+                conditions['keywords'] = keywords
+            windows = self.windows(text)
+            if windows:
+                conditions['windows'] = windows
+            if not conditions:
+                uncompiled.append(requirement.get('id'))
+                continue
+            rules.append({
+                'id': f"rule_{len(rules) + 1}",
+                'requirement_id': requirement.get('id'),
+                'section': requirement.get('section'),
+                'text': text,
+                'risk_level': requirement.get('risk_level', 'medium'),
+                'action': self.action(text),
+                'aggregate': bool(AGGREGATE_PATTERN.search(text)),
+                'conditions': conditions,
+            })
+        return {'rules': rules, 'uncompiled': uncompiled}
+
+
+def artifact_etag(artifact: Dict[str, Any]) -> str:
+    """Weak ETag of an artifact's content
+
+    Weak because ``compiled_at`` is left out of the hash but served in the
+    body, so two compilations with the same tag are equivalent, not
+    byte-identical.
+    """
+    body = {key: value for key, value in artifact.items() if key != 'compiled_at'}
+    return 'W/"' + hashlib.sha256(json.dumps(body, sort_keys=True).encode('utf-8')).hexdigest()[:24] + '"'
+
+
+def rule_key(analyzer_version: str, compiler_version: Optional[str] = None) -> str:
+    """Identifies the analysis and compiler a stored artifact came from"""
+    return f"{compiler_version or COMPILER_VERSION}/{analyzer_version}"
@@ -0,0 +1,31 @@
+"""
+Batch embedding of policy chunks against the remote embedding API
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", os.path.join(tempfile.mkdtemp(prefix="policy-extractor-test-"), "policies.db"))
+
+import main  # noqa: E402
+
+
+def test_batch_embedding_splits_requests_at_the_api_limit(monkeypatch):
+    calls = []
+
+    def embed_content(model, content, task_type):
+        if len(content) > 100:
+            raise ValueError("At most 100 requests can be in one batch")
+        calls.append(len(content))
+        return {'embedding': [[float(len(text)), 0.0] for text in content]}
+
+    monkeypatch.setattr(main, "USE_REMOTE_EMBEDDINGS", True)
+    monkeypatch.setattr(main.genai, "embed_content", embed_content)
+    texts = [f"Chunk {i} of a long policy" for i in range(250)]
+
+    vectors, model_name = main.generate_embeddings_batch(texts)
+
+    assert model_name == main.EMBEDDING_MODEL_NAME
+    assert calls == [100, 100, 50]
+    assert vectors == [[float(len(text)), 0.0] for text in texts]
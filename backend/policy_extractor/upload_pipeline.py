@@ -0,0 +1,191 @@
+"""
+Background processing of uploaded policy documents
+"""
+import json
+import sqlite3
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+JOB_STATES = ('queued', 'processing', 'completed', 'failed')
+
+JOB_COLUMNS = ('id', 'batch_id', 'filename', 'title', 'jurisdiction', 'category', 'size', 'status', 'stage',
+               'policy_id', 'error', 'created_at', 'started_at', 'finished_at')
+
+
+class UploadPipeline:
+    """Durable job queue for policy uploads, worked by a thread pool
+
+    ``submit`` stores the raw document in ``upload_jobs`` and returns at
+    once; ``workers`` threads then run ``process(job, set_stage)`` for each
+    job, which extracts, analyzes and embeds the document and returns a
+    result dictionary holding the ``policy_id`` it was stored as. The job's
+    ``options`` are passed through to ``process`` unchanged. Jobs that were queued
+    or in flight when the service stopped are picked up again by ``start``. The
+    document is dropped once its job completes or fails; only its size is kept.
+    """
+
+    def __init__(self, db_path: str, process: Callable[[Dict[str, Any], Callable[[str], None]], Dict[str, Any]],
+                 workers: int = 4):
+        self.db_path = db_path
+        self.process = process
+        self.init_db()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="policy-upload")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def init_db(self):
+        """Create the job table"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS upload_jobs (
+                id TEXT PRIMARY KEY,
+                batch_id TEXT,
+                filename TEXT,
+                title TEXT,
+                jurisdiction TEXT,
+                category TEXT,
+                document BLOB,
+                size INTEGER,
+                status TEXT,
+                stage TEXT,
+                policy_id TEXT,
+                result TEXT,
+                error TEXT,
+                created_at TEXT,
+                started_at TEXT,
+                finished_at TEXT,
+                options TEXT
+            )
+        ''')
+        columns = {column[1] for column in cursor.execute("PRAGMA table_info(upload_jobs)").fetchall()}
+        if 'options' not in columns:
+            cursor.execute("ALTER TABLE upload_jobs ADD COLUMN options TEXT")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_upload_jobs_batch ON upload_jobs(batch_id)")
+        # Jobs finished before documents were dropped on completion
+        cursor.execute("UPDATE upload_jobs SET document = NULL "
+                       "WHERE status IN ('completed', 'failed') AND document IS NOT NULL")
+        conn.commit()
+        conn.close()
+
+    def start(self):
+        """Re-queue jobs left unfinished by a previous run; call once the service starts"""
+        conn = self._connect()
+        conn.execute("UPDATE upload_jobs SET status = 'queued', stage = NULL WHERE status = 'processing'")
+        conn.commit()
+        job_ids = [row[0] for row in conn.execute(
+            "SELECT id FROM upload_jobs WHERE status = 'queued' ORDER BY created_at"
+        )]
+        conn.close()
+        for job_id in job_ids:
+            self.executor.submit(self._run, job_id)
+
+    def submit(self, filename: str, document: bytes, title: str, jurisdiction: str, category: str,
+               batch_id: Optional[str] = None, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Store a raw document and queue it for processing
+
+        Returns:
+            The queued job, without the document
+        """
+        job = {
+            'id': str(uuid.uuid4()),
+            'batch_id': batch_id,
+            'filename': filename,
+            'title': title,
+            'jurisdiction': jurisdiction,
+            'category': category,
+            'size': len(document),
+            'status': 'queued',
+            'stage': None,
+            'policy_id': None,
+            'error': None,
+            'created_at': datetime.utcnow().isoformat(),
+            'started_at': None,
+            'finished_at': None,
+        }
+        conn = self._connect()
+        conn.execute('''
+            INSERT INTO upload_jobs (id, batch_id, filename, title, jurisdiction, category, document, size,
+                                     status, created_at, options)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (job['id'], batch_id, filename, title, jurisdiction, category, document, job['size'],
+              'queued', job['created_at'], json.dumps(options or {})))
+        conn.commit()
+        conn.close()
+        self.executor.submit(self._run, job['id'])
+        return job
+
+    def _update(self, job_id: str, **values):
+        assignments = ', '.join(f"{column} = ?" for column in values)
+        conn = self._connect()
+        conn.execute(f"UPDATE upload_jobs SET {assignments} WHERE id = ?", (*values.values(), job_id))
+        conn.commit()
+        conn.close()
+
+    def _run(self, job_id: str):
+        conn = self._connect()
+        # Claim the job, so a job queued twice is still processed once
+        claimed = conn.execute(
+            "UPDATE upload_jobs SET status = 'processing', started_at = ? WHERE id = ? AND status = 'queued'",
+            (datetime.utcnow().isoformat(), job_id)
+        ).rowcount
+        conn.commit()
+        row = conn.execute(
+            "SELECT id, filename, title, jurisdiction, category, document, options FROM upload_jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        conn.close()
+        if not claimed or not row:
+            return
+
+        job = dict(zip(('id', 'filename', 'title', 'jurisdiction', 'category', 'document'), row))
+        job['options'] = json.loads(row[6]) if row[6] else {}
+        try:
+            result = self.process(job, lambda stage: self._update(job_id, stage=stage))
+            self._update(job_id, status='completed', stage=None, policy_id=result.get('policy_id'),
+                         result=json.dumps(result), finished_at=datetime.utcnow().isoformat(), document=None)
+        except Exception as e:
+            print(f"Error processing upload {job_id}: {str(e)}")
+            self._update(job_id, status='failed', error=str(e), finished_at=datetime.utcnow().isoformat(),
+                         document=None)
+
+    def job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """A job's status, with the processing result once it has completed"""
+        conn = self._connect()
+        row = conn.execute(f"SELECT {', '.join(JOB_COLUMNS)}, result FROM upload_jobs WHERE id = ?",
+                           (job_id,)).fetchone()
+        conn.close()
+        if not row:
+            return None
+        job = dict(zip(JOB_COLUMNS, row[:-1]))
+        job['result'] = json.loads(row[-1]) if row[-1] else None
+        return job
+
+    def batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """Progress of a batch upload and the status of each of its jobs"""
+        conn = self._connect()
+        rows = conn.execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM upload_jobs WHERE batch_id = ? ORDER BY created_at, filename",
+            (batch_id,)
+        ).fetchall()
+        conn.close()
+        if not rows:
+            return None
+
+        jobs: List[Dict[str, Any]] = [dict(zip(JOB_COLUMNS, row)) for row in rows]
+        counts = {state: 0 for state in JOB_STATES}
+        for job in jobs:
+            counts[job['status']] += 1
+        finished = counts['completed'] + counts['failed']
+        return {
+            'batch_id': batch_id,
+            'total': len(jobs),
+            'counts': counts,
+            'progress': round(finished / len(jobs), 4),
+            'done': finished == len(jobs),
+            'jobs': jobs,
+        }
@@ -1,14 +1,21 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 import sqlite3
 import os
+import sys
 import uuid
 from datetime import datetime
 import uvicorn
-import json
 import google.generativeai as genai
 
+# Add the current directory to the path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from report_stream import SectionSplitter, sse_event
+from retrieval import select_context
+
 app = FastAPI(title="RAG Generator Service", version="1.0.0")
 
 # Configure Gemini API
@@ -21,6 +28,10 @@ else:
     model = None
     print("Warning: GEMINI_API_KEY not set. AI features will be disabled.")
 
+# Estimated tokens of data placed in a report prompt: the highest-ranked violations
+# with their transactions and policy passages, after aggregates over everything
+REPORT_CONTEXT_TOKENS = int(os.getenv("REPORT_CONTEXT_TOKENS", "24000"))
+
 # Database setup for reports
 REPORTS_DATABASE_URL = os.getenv("REPORTS_DATABASE_URL", "reports.db")
 conn = sqlite3.connect(REPORTS_DATABASE_URL, check_same_thread=False)
@@ -59,6 +70,39 @@ class GenerateReportRequest(BaseModel):
 async def health_check():
     return {"status": "healthy", "service": "rag_generator", "timestamp": datetime.utcnow()}
 
+# Prompt asking the model for a comprehensive compliance report. Only the records
+# chosen by select_context are included, one minified JSON object per line; the
+# aggregates cover all of the data
+def build_report_prompt(violations_data, transactions_data, policies_data):
+    context = select_context(violations_data, transactions_data, policies_data, REPORT_CONTEXT_TOKENS)
+    stats = context["stats"]
+    newline = "\n"
+    return f"""Generate a comprehensive financial compliance report based on the following data.
+
+AGGREGATES (over all {len(transactions_data)} transactions, {len(policies_data)} policies and {len(violations_data)} violations):
+{context["aggregates"]}
+
+VIOLATIONS ({stats["violations"]}, highest risk first):
+{newline.join(context["violations"]) or "none"}
+
+TRANSACTIONS REFERENCED BY THESE VIOLATIONS ({stats["transactions"]}):
+{newline.join(context["transactions"]) or "none"}
+
+RELEVANT POLICY PASSAGES ({stats["passages"]}):
+{newline.join(context["passages"]) or "none"}
+
+Please provide:
+1. An executive summary of the compliance analysis
+2. Key findings with risk categorization
+3. Detailed analysis of each violation listed
+4. Specific recommendations for addressing violations
+5. Overall compliance score (0-100)
+6. Actionable insights for improving compliance
+
+Base totals and distributions on the aggregates, not on the listed records alone.
+Format the response as a professional compliance report with clear sections and actionable insights.
+"""
+
 # Enhanced report generation function using Gemini API
 def generate_report_with_gemini(violations_data, transactions_data, policies_data):
     if not model:
@@ -66,32 +110,8 @@ def generate_report_with_gemini(violations_data, transactions_data, policies_dat
         return generate_report_template(violations_data, transactions_data, policies_data)
     
     try:
-        # Create a prompt for the AI to generate a comprehensive compliance report
-        prompt = f"""
-        Generate a comprehensive financial compliance report based on the following data:
-        
-        TRANSACTION DATA:
-        {json.dumps(transactions_data, indent=2)}
-        
-        POLICY DATA:
-        {json.dumps(policies_data, indent=2)}
-        
-        VIOLATIONS DETECTED:
-        {json.dumps(violations_data, indent=2)}
-        
-        Please provide:
-        1. An executive summary of the compliance analysis
-        2. Key findings with risk categorization
-        3. Detailed analysis of each violation
-        4. Specific recommendations for addressing violations
-        5. Overall compliance score (0-100)
-        6. Actionable insights for improving compliance
-        
-        Format the response as a professional compliance report with clear sections and actionable insights.
-        """
-        
         # Generate content using Gemini
-        response = model.generate_content(prompt)
+        response = model.generate_content(build_report_prompt(violations_data, transactions_data, policies_data))
         return response.text
     
     except Exception as e:
@@ -144,6 +164,45 @@ Report generated on: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC
     
     return report_content
 
+# Report text as the model produces it, chunk by chunk. Falls back to the template
+# if the model is unavailable or fails before producing any text; a failure after
+# that is raised, since the text already sent cannot be taken back
+def stream_report_text(violations_data, transactions_data, policies_data):
+    if model:
+        produced = False
+        try:
+            response = model.generate_content(build_report_prompt(violations_data, transactions_data, policies_data),
+                                               stream=True)
+            for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # A chunk without text parts, e.g. only safety ratings
+                    continue
+                if text:
+                    produced = True
+                    yield text
+            if produced:
+                return
+        except Exception as e:
+            if produced:
+                raise
+            print(f"Error streaming report with Gemini: {str(e)}")
+    yield generate_report_template(violations_data, transactions_data, policies_data)
+
+# Save a generated report, returning when it was generated
+def save_report(report_id: str, report_content: str):
+    user_id = "default_user"  # In a real implementation, this would come from auth
+    generated_at = datetime.utcnow().isoformat()
+    db = sqlite3.connect(REPORTS_DATABASE_URL, timeout=30)
+    db.execute('''
+        INSERT INTO reports (id, user_id, content, generated_at)
+        VALUES (?, ?, ?, ?)
+    ''', (report_id, user_id, report_content, generated_at))
+    db.commit()
+    db.close()
+    return generated_at
+
 # Generate compliance report
 @app.post("/generate")
 async def generate_compliance_report(request: GenerateReportRequest):
@@ -157,20 +216,7 @@ async def generate_compliance_report(request: GenerateReportRequest):
         
         # Save report to database
         report_id = str(uuid.uuid4())
-        user_id = "default_user"  # In a real implementation, this would come from auth
-        generated_at = datetime.utcnow().isoformat()
-        
-        cursor.execute('''
-            INSERT INTO reports (id, user_id, content, generated_at)
-            VALUES (?, ?, ?, ?)
-        ''', (
-            report_id,
-            user_id,
-            report_content,
-            generated_at
-        ))
-        
-        conn.commit()
+        save_report(report_id, report_content)
         
         return {
             "message": "Report generated successfully",
@@ -181,6 +227,39 @@ async def generate_compliance_report(request: GenerateReportRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating report: {str(e)}")
 
+# Generate a compliance report as Server-Sent Events: "start" with the report id at
+# once, "delta" with each piece of text as the model produces it, "section" with each
+# section once it is complete, and "done" after the whole report has been saved (or
+# "error", in which case nothing is saved)
+@app.post("/generate/stream")
+async def stream_compliance_report(request: GenerateReportRequest):
+    report_id = str(uuid.uuid4())
+    
+    # A plain generator: the blocking model stream is iterated in the threadpool
+    def events():
+        yield sse_event("start", {"report_id": report_id})
+        parts = []
+        splitter = SectionSplitter()
+        try:
+            for text in stream_report_text(request.violations_data, request.transactions_data,
+                                           request.policies_data):
+                parts.append(text)
+                yield sse_event("delta", {"text": text})
+                for title, content in splitter.feed(text):
+                    yield sse_event("section", {"index": splitter.count - 1, "title": title, "content": content})
+            for title, content in splitter.close():
+                yield sse_event("section", {"index": splitter.count - 1, "title": title, "content": content})
+            
+            report_content = "".join(parts)
+            generated_at = save_report(report_id, report_content)
+            yield sse_event("done", {"report_id": report_id, "generated_at": generated_at,
+                                     "sections": splitter.count, "length": len(report_content)})
+        except Exception as e:
+            yield sse_event("error", {"report_id": report_id, "detail": f"Error generating report: {str(e)}"})
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # Get all reports
 @app.get("/reports", response_model=List[ReportResponse])
 async def get_reports():
@@ -0,0 +1,60 @@
+"""
+Server-Sent Events framing and section splitting for streamed reports
+"""
+import json
+import re
+from typing import Any, Iterator, List, Optional, Tuple
+
+# Markdown headings, and whole-line bold titles such as "**1. Executive Summary**"
+SECTION_HEADING = re.compile(r"^(?:#{1,3}\s+(?P<title>\S.*?)|\*\*(?P<bold>[^*\n]{2,80})\*\*:?)\s*$")
+
+
+def sse_event(event: str, data: Any) -> str:
+    """One Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class SectionSplitter:
+    """Cuts a report arriving in arbitrary text chunks into its sections
+
+    A section runs from one heading line to the next; it is complete once
+    the following heading has been seen, so each section is released as
+    soon as the model has moved past it. Text before the first heading is
+    a section without a title.
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._title: Optional[str] = None
+        self._lines: List[str] = []
+        self.count = 0
+
+    def _complete(self) -> Optional[Tuple[Optional[str], str]]:
+        content = '\n'.join(self._lines).strip()
+        self._lines = []
+        if not content and self._title is None:
+            return None
+        self.count += 1
+        return self._title, content
+
+    def feed(self, chunk: str) -> Iterator[Tuple[Optional[str], str]]:
+        """Add text; yields ``(title, content)`` of every section it completes"""
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split('\n')
+        for line in lines:
+            heading = SECTION_HEADING.match(line.strip())
+            if heading:
+                section = self._complete()
+                if section:
+                    yield section
+                self._title = (heading.group('title') or heading.group('bold')).strip().rstrip(':')
+            else:
+                self._lines.append(line)
+
+    def close(self) -> Iterator[Tuple[Optional[str], str]]:
+        """Flush the last section once the report has ended"""
+        yield from self.feed('\n')
+        section = self._complete()
+        if section:
+            yield section
+
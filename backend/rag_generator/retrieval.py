@@ -0,0 +1,240 @@
+"""
+Token-budgeted retrieval of report context from violations, transactions and policies
+"""
+import json
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+# Rough size of a token for English text and JSON; estimates stay on the safe
+# side of what the model's tokenizer counts
+CHARS_PER_TOKEN = 3.5
+
+RISK_WEIGHTS = {'critical': 4, 'high': 3, 'medium': 2, 'low': 1}
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    'the', 'a', 'an', 'and', 'or', 'of', 'to', 'in', 'on', 'for', 'by', 'with', 'is', 'are', 'be', 'was', 'this',
+    'that', 'it', 'as', 'at', 'from', 'any', 'all', 'if', 'not', 'no', 'may', 'shall', 'must', 'should', 'has',
+    'have', 'which', 'such', 'its', 'their', 'other', 'than', 'into', 'per', 'each',
+}
+
+# Longest string kept in a serialized record; longer ones are cut with an ellipsis
+MAX_FIELD_CHARS = 300
+# Policy passages are paragraphs of at most this many characters
+PASSAGE_CHARS = 900
+PASSAGES_PER_VIOLATION = 1
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def compact(record: Dict[str, Any], max_chars: int = MAX_FIELD_CHARS) -> str:
+    """One record as minified JSON, without empty fields and with long strings cut"""
+    kept = {}
+    for key, value in record.items():
+        if value is None or value == '' or value == [] or value == {}:
+            continue
+        if isinstance(value, (dict, list)):
+            serialized = json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+            # Nested values are kept as they are unless too long, then cut as text
+            value = value if len(serialized) <= max_chars else serialized
+        if isinstance(value, str) and len(value) > max_chars:
+            value = value[:max_chars - 1] + '…'
+        kept[key] = value
+    return json.dumps(kept, separators=(',', ':'), ensure_ascii=False)
+
+
+def _terms(text: str) -> List[str]:
+    return [term for term in TOKEN_PATTERN.findall(text.lower()) if term not in STOPWORDS and len(term) > 1]
+
+
+def _amount(transaction: Optional[Dict[str, Any]]) -> float:
+    try:
+        return abs(float((transaction or {}).get('amount') or 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def violation_score(violation: Dict[str, Any], transaction: Optional[Dict[str, Any]]) -> float:
+    """Rank of a violation: risk level first, then confidence and the amount involved"""
+    risk = RISK_WEIGHTS.get(str(violation.get('risk_level', '')).lower(), 0)
+    try:
+        confidence = float(violation.get('confidence') or 0) / 100
+    except (TypeError, ValueError):
+        confidence = 0.0
+    return risk * 10 + min(confidence, 1.0) * 2 + math.log10(1 + _amount(transaction))
+
+
+def split_passages(policy: Dict[str, Any], max_chars: int = PASSAGE_CHARS) -> List[str]:
+    """A policy's text cut into paragraph-aligned passages"""
+    text = policy.get('content') or policy.get('text') or policy.get('summary') or ''
+    if not isinstance(text, str):
+        text = json.dumps(text, separators=(',', ':'))
+    passages: List[str] = []
+    current = ''
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = ' '.join(paragraph.split())
+        while len(paragraph) > max_chars:
+            cut = paragraph.rfind('. ', 0, max_chars) + 1 or max_chars
+            passages.append(paragraph[:cut].strip())
+            paragraph = paragraph[cut:].strip()
+        if current and len(current) + len(paragraph) + 1 > max_chars:
+            passages.append(current)
+            current = paragraph
+        else:
+            current = f"{current} {paragraph}".strip()
+    if current:
+        passages.append(current)
+    return passages
+
+
+class PassageIndex:
+    """BM25 over policy passages, so each violation gets the policy text it touches
+
+    Postings lists map each term to the passages containing it, so a search
+    touches only the passages sharing a term with the query.
+    """
+
+    def __init__(self, policies: List[Dict[str, Any]], k1: float = 1.2, b: float = 0.75):
+        self.passages: List[Tuple[str, str, str]] = []
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths: List[int] = []
+        for policy in policies:
+            policy_id = str(policy.get('id', ''))
+            title = str(policy.get('title', ''))
+            for passage in split_passages(policy):
+                counts = Counter(_terms(passage))
+                for term, frequency in counts.items():
+                    postings.setdefault(term, []).append((len(self.passages), frequency))
+                lengths.append(sum(counts.values()))
+                self.passages.append((policy_id, title, passage))
+        average = sum(lengths) / len(lengths) if lengths else 1.0
+        total = len(self.passages)
+        # Term weights per passage are fixed, so they are computed once here
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+        for term, entries in postings.items():
+            idf = math.log(1 + (total - len(entries) + 0.5) / (len(entries) + 0.5))
+            self.postings[term] = [
+                (index, idf * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * lengths[index] / (average or 1))))
+                for index, frequency in entries
+            ]
+
+    def search(self, query: str, k: int, policy_id: Optional[str] = None,
+               exclude: Optional[set] = None) -> List[int]:
+        """Indexes of the ``k`` best passages for a query, within one policy when given"""
+        scores: Dict[int, float] = {}
+        for term in set(_terms(query)):
+            for index, weight in self.postings.get(term, ()):
+                scores[index] = scores.get(index, 0.0) + weight
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [index for index, _ in ranked
+                if (policy_id is None or self.passages[index][0] == policy_id)
+                and not (exclude and index in exclude)][:k]
+
+
+def aggregate(violations: List[Dict[str, Any]], transactions: List[Dict[str, Any]],
+              policies: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Totals over all of the data, standing in for the records left out of the prompt"""
+    amounts = sorted(_amount(transaction) for transaction in transactions)
+    by_type: Dict[str, List[float]] = {}
+    for transaction in transactions:
+        by_type.setdefault(str(transaction.get('type') or 'unknown').lower(), []).append(_amount(transaction))
+    dates = sorted(str(transaction['date']) for transaction in transactions if transaction.get('date'))
+    policy_titles = {str(policy.get('id')): policy.get('title') for policy in policies}
+    by_policy = Counter(str(violation.get('policy_id')) for violation in violations)
+    flagged = {str(violation.get('transaction_id')) for violation in violations if violation.get('transaction_id')}
+    return {
+        'violations': {
+            'total': len(violations),
+            'by_risk': dict(Counter(str(violation.get('risk_level', 'unknown')).lower() for violation in violations)),
+            'by_policy': [{'policy_id': policy_id, 'title': policy_titles.get(policy_id), 'count': count}
+                          for policy_id, count in by_policy.most_common(10)],
+            'flagged_transactions': len(flagged),
+        },
+        'transactions': {
+            'total': len(transactions),
+            'total_amount': round(sum(amounts), 2),
+            'amount_min': round(amounts[0], 2) if amounts else None,
+            'amount_median': round(amounts[len(amounts) // 2], 2) if amounts else None,
+            'amount_max': round(amounts[-1], 2) if amounts else None,
+            'by_type': {name: {'count': len(values), 'amount': round(sum(values), 2)}
+                        for name, values in sorted(by_type.items(), key=lambda item: -sum(item[1]))[:10]},
+            'date_range': [dates[0], dates[-1]] if dates else None,
+        },
+        'policies': {
+            'total': len(policies),
+            'titles': [title for title in policy_titles.values() if title][:20],
+        },
+    }
+
+
+def select_context(violations: List[Dict[str, Any]], transactions: List[Dict[str, Any]],
+                   policies: List[Dict[str, Any]], budget_tokens: int) -> Dict[str, Any]:
+    """
+    Choose what goes into a report prompt within a token budget
+
+    Aggregates over all the data always go in. Violations are then taken
+    in rank order, each with the transaction it references and its best
+    matching policy passage, for as long as they fit; a violation whose
+    passage does not fit is taken without it.
+
+    Returns:
+        ``{"aggregates", "violations", "transactions", "passages", "stats"}``
+        with the selected records already serialized one per line
+    """
+    transactions_by_id = {str(transaction.get('id')): transaction for transaction in transactions}
+    index = PassageIndex(policies)
+    aggregates = json.dumps(aggregate(violations, transactions, policies), separators=(',', ':'), ensure_ascii=False)
+    used = estimate_tokens(aggregates)
+
+    ranked = sorted(violations, key=lambda violation: -violation_score(
+        violation, transactions_by_id.get(str(violation.get('transaction_id')))))
+    selected_violations: List[str] = []
+    selected_transactions: Dict[str, str] = {}
+    selected_passages: Dict[int, str] = {}
+    for violation in ranked:
+        line = compact(violation)
+        cost = estimate_tokens(line) + 1
+        transaction_id = str(violation.get('transaction_id'))
+        transaction_line = None
+        if transaction_id in transactions_by_id and transaction_id not in selected_transactions:
+            transaction_line = compact(transactions_by_id[transaction_id])
+            cost += estimate_tokens(transaction_line) + 1
+        if used + cost > budget_tokens:
+            continue
+
+        transaction = transactions_by_id.get(transaction_id) or {}
+        query = ' '.join(str(part) for part in (violation.get('description'), violation.get('recommendation'),
+                                                transaction.get('type'), transaction.get('description')) if part)
+        policy_id = str(violation['policy_id']) if violation.get('policy_id') is not None else None
+        matches = index.search(query, PASSAGES_PER_VIOLATION, policy_id, exclude=set(selected_passages))
+        if not matches and policy_id is not None:
+            matches = index.search(query, PASSAGES_PER_VIOLATION, exclude=set(selected_passages))
+        for match in matches:
+            passage_policy, title, passage = index.passages[match]
+            passage_line = compact({'policy_id': passage_policy, 'title': title, 'text': passage}, max_chars=PASSAGE_CHARS)
+            passage_cost = estimate_tokens(passage_line) + 1
+            if used + cost + passage_cost <= budget_tokens:
+                selected_passages[match] = passage_line
+                cost += passage_cost
+
+        used += cost
+        selected_violations.append(line)
+        if transaction_line:
+            selected_transactions[transaction_id] = transaction_line
+
+    return {
+        'aggregates': aggregates,
+        'violations': selected_violations,
+        'transactions': list(selected_transactions.values()),
+        'passages': [selected_passages[match] for match in sorted(selected_passages)],
+        'stats': {
+            'budget_tokens': budget_tokens,
+            'estimated_tokens': used,
+            'violations': f"{len(selected_violations)}/{len(violations)}",
+            'transactions': f"{len(selected_transactions)}/{len(transactions)}",
+            'passages': f"{len(selected_passages)}/{len(index.passages)}",
+        },
+    }
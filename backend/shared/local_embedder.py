@@ -0,0 +1,69 @@
+"""
+Offline, deterministic text embeddings shared by the policy extractor and vector database services
+"""
+import hashlib
+import math
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import List, Tuple
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.'()][a-z0-9]+)*")
+
+# Relative weights of the feature families, keyed by feature prefix
+FAMILY_WEIGHTS = {'w': 1.0, 'b': 0.7, 'c': 0.35}
+
+
+@lru_cache(maxsize=1 << 20)
+def _bucket(feature: str, dim: int) -> Tuple[int, float]:
+    """Stable bucket and sign for a feature (unlike ``hash``, not salted per process)"""
+    digest = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+    return digest % dim, 1.0 if (digest >> 63) & 1 else -1.0
+
+
+class HashingEmbedder:
+    """Signed feature-hashing projection of words, word bigrams and character n-grams
+
+    Each text becomes a sparse bag of features weighted by sublinear term
+    frequency, hashed into ``dim`` signed buckets and L2-normalized. Texts
+    sharing terms land close together, identical texts map to identical
+    vectors in every process, and no network or model files are needed.
+    """
+
+    def __init__(self, dim: int = 768, char_ngram: int = 4):
+        self.dim = dim
+        self.char_ngram = char_ngram
+
+    def _features(self, text: str) -> Counter:
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        features: Counter = Counter()
+        for token in tokens:
+            features['w:' + token] += 1
+            padded = f"<{token}>"
+            if len(padded) > self.char_ngram:
+                for i in range(len(padded) - self.char_ngram + 1):
+                    features['c:' + padded[i:i + self.char_ngram]] += 1
+        for first, second in zip(tokens, tokens[1:]):
+            features[f"b:{first} {second}"] += 1
+        return features
+
+    def embed_many(self, texts: List[str]) -> np.ndarray:
+        """Embed a batch of texts into a ``(len(texts), dim)`` float32 matrix"""
+        cells, values = [], []
+        for row, text in enumerate(texts):
+            offset = row * self.dim
+            for feature, count in self._features(text).items():
+                bucket, sign = _bucket(feature, self.dim)
+                cells.append(offset + bucket)
+                values.append(sign * FAMILY_WEIGHTS[feature[0]] * (1.0 + math.log(count)))
+
+        # Scatter-add every (text, bucket) contribution in one vectorized pass
+        matrix = np.bincount(np.asarray(cells, dtype=np.int64), weights=np.asarray(values),
+                             minlength=len(texts) * self.dim).astype(np.float32).reshape(len(texts), self.dim)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return np.divide(matrix, norms, out=matrix, where=norms != 0)
+
+    def embed(self, text: str) -> List[float]:
+        return self.embed_many([text])[0].tolist()
@@ -0,0 +1,254 @@
+"""
+Nearest known-fraud case lookup for the FinLex platform
+"""
+import json
+import math
+import sqlite3
+from typing import Any, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+TRANSACTION_TYPES = ['PAYMENT', 'TRANSFER', 'CASH_OUT', 'DEBIT', 'CASH_IN']
+
+FEATURE_NAMES = (
+    ['log_amount']
+    + [f"type_{transaction_type}" for transaction_type in TRANSACTION_TYPES]
+    + [
+        'log_old_balance_orig',
+        'amount_to_balance_orig',
+        'orig_drained',
+        'orig_balance_error',
+        'dest_balance_error',
+        'dest_empty',
+        'dest_is_merchant',
+        'hour_sin',
+        'hour_cos',
+        'log_orig_transactions',
+        'log_dest_transactions',
+    ]
+)
+
+# Counterparty names are only indexed for rows whose metadata is valid JSON
+NAME_ORIG_SQL = "CASE WHEN json_valid(metadata) THEN json_extract(metadata, '$.nameOrig') END"
+NAME_DEST_SQL = "CASE WHEN json_valid(metadata) THEN json_extract(metadata, '$.nameDest') END"
+
+
+class FraudCaseIndex:
+    """Feature-vector index of labelled PaySim transactions kept in vector_db
+
+    Every transaction whose metadata carries an ``isFraud`` label becomes a
+    standardized vector of amount, type, balance-delta and counterparty
+    features in the vector_db collection ``collection``. Lookups embed the
+    query transaction the same way and ask vector_db for its nearest
+    ``isFraud = 1`` neighbours, so no LLM call is involved. Rebuilds fill
+    ``<collection>_staging`` and swap it in, so lookups never see a partial index.
+    """
+
+    def __init__(self, db_path: str, vector_db_url: str, collection: str = "fraud_cases", timeout: float = 10.0):
+        self.db_path = db_path
+        self.vector_db_url = vector_db_url.rstrip('/')
+        self.collection = collection
+        self.client = httpx.Client(timeout=timeout)
+        self.init_db()
+        self._scaler = self._load_scaler()
+
+    def init_db(self):
+        """Create the scaler table and the counterparty lookup indexes"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fraud_index_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                features TEXT,
+                means TEXT,
+                scales TEXT,
+                indexed INTEGER,
+                fraud_cases INTEGER,
+                built_at TEXT
+            )
+        ''')
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_transactions_name_orig ON transactions({NAME_ORIG_SQL})")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_transactions_name_dest ON transactions({NAME_DEST_SQL})")
+        conn.commit()
+        conn.close()
+
+    def _load_scaler(self) -> Optional[Dict[str, Any]]:
+        conn = sqlite3.connect(self.db_path)
+        row = conn.execute("SELECT features, means, scales, indexed, fraud_cases, built_at FROM fraud_index_state").fetchone()
+        conn.close()
+        if not row or json.loads(row[0]) != FEATURE_NAMES:
+            return None
+        return {
+            'means': np.asarray(json.loads(row[1]), dtype=np.float32),
+            'scales': np.asarray(json.loads(row[2]), dtype=np.float32),
+            'indexed': row[3],
+            'fraud_cases': row[4],
+            'built_at': row[5],
+        }
+
+    @staticmethod
+    def features(transaction: Dict[str, Any], metadata: Dict[str, Any],
+                 orig_transactions: int, dest_transactions: int) -> List[float]:
+        """Raw feature vector of one transaction, in ``FEATURE_NAMES`` order"""
+        amount = float(transaction.get('amount') or 0.0)
+        old_orig = float(metadata.get('oldbalanceOrg') or 0.0)
+        new_orig = float(metadata.get('newbalanceOrig') or 0.0)
+        old_dest = float(metadata.get('oldbalanceDest') or 0.0)
+        new_dest = float(metadata.get('newbalanceDest') or 0.0)
+        transaction_type = str(transaction.get('type') or '').upper()
+        hour = int(metadata.get('step') or 0) % 24
+        denominator = max(amount, 1.0)
+
+        return (
+            [math.log1p(max(amount, 0.0))]
+            + [1.0 if transaction_type == known else 0.0 for known in TRANSACTION_TYPES]
+            + [
+                math.log1p(max(old_orig, 0.0)),
+                min(amount / max(old_orig, 1.0), 10.0),
+                1.0 if old_orig > 0 and new_orig == 0 else 0.0,
+                # PaySim fraud often leaves the balances inconsistent with the amount
+                max(-5.0, min(5.0, (old_orig - amount - new_orig) / denominator)),
+                max(-5.0, min(5.0, (old_dest + amount - new_dest) / denominator)),
+                1.0 if old_dest == 0 and new_dest == 0 else 0.0,
+                1.0 if str(metadata.get('nameDest', '')).startswith('M') else 0.0,
+                math.sin(2 * math.pi * hour / 24),
+                math.cos(2 * math.pi * hour / 24),
+                math.log1p(orig_transactions),
+                math.log1p(dest_transactions),
+            ]
+        )
+
+    def _counterparty_counts(self, conn: sqlite3.Connection, column_sql: str, names: List[str]) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        names = [name for name in set(names) if name]
+        for start in range(0, len(names), 500):
+            group = names[start:start + 500]
+            placeholders = ','.join('?' * len(group))
+            counts.update(conn.execute(
+                f"SELECT {column_sql}, COUNT(*) FROM transactions WHERE {column_sql} IN ({placeholders}) GROUP BY 1",
+                group
+            ).fetchall())
+        return counts
+
+    def _feature_matrix(self, conn: sqlite3.Connection, rows: List[tuple]) -> np.ndarray:
+        """Raw features for ``(id, amount, type, metadata)`` rows, with counterparty counts batched"""
+        metadata = [json.loads(row[3]) for row in rows]
+        orig_counts = self._counterparty_counts(conn, NAME_ORIG_SQL, [m.get('nameOrig') for m in metadata])
+        dest_counts = self._counterparty_counts(conn, NAME_DEST_SQL, [m.get('nameDest') for m in metadata])
+        return np.asarray([
+            self.features({'amount': row[1], 'type': row[2]}, meta,
+                          orig_counts.get(meta.get('nameOrig'), 0), dest_counts.get(meta.get('nameDest'), 0))
+            for row, meta in zip(rows, metadata)
+        ], dtype=np.float32)
+
+    def _vector_db(self, method: str, path: str, collection: Optional[str] = None, **kwargs):
+        response = self.client.request(
+            method, f"{self.vector_db_url}/collections/{collection or self.collection}{path}", **kwargs
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def build(self, batch_size: int = 1000) -> Dict[str, Any]:
+        """
+        Rebuild the index from every labelled transaction in the database
+
+        Args:
+            batch_size: Vectors sent to vector_db per request
+
+        Returns:
+            Dictionary with the number of indexed transactions and fraud cases
+        """
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute('''
+            SELECT id, amount, type, metadata FROM transactions
+            WHERE json_valid(metadata) AND json_extract(metadata, '$.isFraud') IS NOT NULL
+        ''').fetchall()
+        if not rows:
+            conn.close()
+            return {'indexed': 0, 'fraud_cases': 0}
+
+        raw = self._feature_matrix(conn, rows)
+        labels = [int(json.loads(row[3])['isFraud']) for row in rows]
+        means = raw.mean(axis=0)
+        scales = raw.std(axis=0)
+        scales[scales == 0] = 1.0
+        vectors = (raw - means) / scales
+
+        # Fill a staging collection while lookups keep using the live one
+        staging = f"{self.collection}_staging"
+        self._vector_db('DELETE', '', collection=staging)
+        for start in range(0, len(rows), batch_size):
+            self._vector_db('POST', '/vectors', collection=staging, json={'items': [
+                {
+                    'id': row[0],
+                    'vector': vector.tolist(),
+                    'metadata': {'isFraud': label, 'type': row[2], 'amount': row[1]},
+                }
+                for row, vector, label in zip(rows[start:start + batch_size], vectors[start:start + batch_size],
+                                              labels[start:start + batch_size])
+            ]})
+        self._vector_db('POST', '/swap', json={'source': staging})
+
+        fraud_cases = sum(labels)
+        conn.execute('''
+            INSERT OR REPLACE INTO fraud_index_state (id, features, means, scales, indexed, fraud_cases, built_at)
+            VALUES (1, ?, ?, ?, ?, ?, datetime('now'))
+        ''', (json.dumps(FEATURE_NAMES), json.dumps(means.tolist()), json.dumps(scales.tolist()),
+              len(rows), fraud_cases))
+        conn.commit()
+        conn.close()
+        self._scaler = self._load_scaler()
+        return {'indexed': len(rows), 'fraud_cases': fraud_cases, 'features': FEATURE_NAMES}
+
+    def similar_fraud_cases(self, transaction_id: str, k: int = 5) -> Optional[List[Dict[str, Any]]]:
+        """
+        The ``k`` confirmed-fraud transactions most similar to a stored transaction
+
+        Returns:
+            List of matches with similarity and transaction fields, or None
+            when the transaction does not exist
+        """
+        if self._scaler is None:
+            raise RuntimeError("Fraud case index has not been built yet")
+
+        conn = sqlite3.connect(self.db_path)
+        row = conn.execute("SELECT id, amount, type, metadata FROM transactions WHERE id = ?",
+                           (transaction_id,)).fetchone()
+        if not row:
+            conn.close()
+            return None
+        try:
+            metadata = json.loads(row[3]) if row[3] else {}
+        except json.JSONDecodeError:
+            metadata = {}
+        row = (row[0], row[1], row[2], json.dumps(metadata if isinstance(metadata, dict) else {}))
+        raw = self._feature_matrix(conn, [row])
+        conn.close()
+
+        vector = (raw[0] - self._scaler['means']) / self._scaler['scales']
+        # One extra neighbour in case the transaction itself is a fraud case
+        results = self._vector_db('POST', '/search', json={
+            'vectors': [vector.tolist()], 'k': k + 1, 'filters': {'isFraud': 1}
+        })
+        matches = [match for match in results[0]['matches'] if match['id'] != transaction_id][:k]
+        return [
+            {
+                'transaction_id': match['id'],
+                'similarity': match['similarity'],
+                'type': (match.get('metadata') or {}).get('type'),
+                'amount': (match.get('metadata') or {}).get('amount'),
+            }
+            for match in matches
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        if self._scaler is None:
+            return {'built': False}
+        return {
+            'built': True,
+            'indexed': self._scaler['indexed'],
+            'fraud_cases': self._scaler['fraud_cases'],
+            'built_at': self._scaler['built_at'],
+            'features': FEATURE_NAMES,
+        }
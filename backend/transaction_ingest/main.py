@@ -9,12 +9,15 @@ from datetime import datetime
 import uvicorn
 import sys
 import json
+import asyncio
+import time
 import google.generativeai as genai
 
 # Add the current directory to the path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from data_processor import DataProcessor
+from fraud_index import FraudCaseIndex
 
 # Import PyPDF2 for PDF processing
 PDF_PROCESSING_AVAILABLE = False
@@ -60,6 +63,10 @@ conn.commit()
 # Initialize data processor
 data_processor = DataProcessor(DATABASE_URL)
 
+# Feature-vector index of labelled transactions, stored in the vector database
+VECTOR_DB_URL = os.getenv("VECTOR_DB_URL", "http://localhost:8010")
+fraud_index = FraudCaseIndex(DATABASE_URL, VECTOR_DB_URL)
+
 class Transaction(BaseModel):
     id: str
     user_id: str
@@ -358,6 +365,41 @@ async def analyze_transaction(transaction_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error analyzing transaction: {str(e)}")
 
+# Rebuild the known-fraud case index from every labelled (PaySim) transaction
+@app.post("/fraud-index/build")
+async def build_fraud_index():
+    try:
+        result = await asyncio.to_thread(fraud_index.build)
+        return {"message": f"Indexed {result['indexed']} labelled transactions", **result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error building fraud case index: {str(e)}")
+
+# Fraud case index status
+@app.get("/fraud-index")
+async def get_fraud_index():
+    return fraud_index.stats()
+
+# Find the confirmed-fraud cases most similar to a transaction
+@app.get("/transactions/{transaction_id}/similar-fraud")
+async def get_similar_fraud_cases(transaction_id: str, k: int = 5):
+    try:
+        started = time.perf_counter()
+        matches = await asyncio.to_thread(fraud_index.similar_fraud_cases, transaction_id, k)
+        if matches is None:
+            raise HTTPException(status_code=404, detail="Transaction not found")
+        
+        return {
+            "transaction_id": transaction_id,
+            "matches": matches,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+    except HTTPException:
+        raise
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error finding similar fraud cases: {str(e)}")
+
 # Get all transactions
 @app.get("/transactions", response_model=List[TransactionResponse])
 async def get_transactions():
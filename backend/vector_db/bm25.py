@@ -0,0 +1,92 @@
+"""
+Incremental BM25 lexical index for hybrid retrieval
+"""
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Keeps regulatory identifiers such as "314(a)", "u.s.c" or "1010.311" whole
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.'/-][a-z0-9]+|\([a-z0-9]+\))*")
+PART_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Lowercased terms; compound identifiers also emit their multi-character parts"""
+    if not text:
+        return []
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        terms.append(token)
+        if not token.isalnum():
+            terms.extend(part for part in PART_PATTERN.findall(token) if len(part) > 1)
+    return terms
+
+
+class BM25Index:
+    """Okapi BM25 over an inverted index that is updated per document
+
+    Postings map each term to ``{id: term frequency}``; document lengths and
+    their total are maintained on add/remove, so scores stay exact without
+    rebuilding.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._lengths: Dict[str, int] = {}
+        self._total_length = 0
+
+    def add(self, doc_id: str, text: Optional[str]):
+        terms = tokenize(text)
+        self._lengths[doc_id] = len(terms)
+        self._total_length += len(terms)
+        for term, count in Counter(terms).items():
+            self._postings[term][doc_id] = count
+
+    def remove(self, doc_id: str, text: Optional[str]):
+        if doc_id not in self._lengths:
+            return
+        self._total_length -= self._lengths.pop(doc_id)
+        for term in set(tokenize(text)):
+            docs = self._postings.get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self._postings[term]
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def search(self, query: str, limit: int, allowed: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        """Top ``limit`` documents for ``query``, optionally restricted to ``allowed`` ids"""
+        if not self._lengths or limit <= 0:
+            return []
+        doc_count = len(self._lengths)
+        average_length = self._total_length / doc_count or 1.0
+        scores: Dict[str, float] = defaultdict(float)
+        for term, query_count in Counter(tokenize(query)).items():
+            docs = self._postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1.0 + (doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, count in docs.items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                norm = self.k1 * (1.0 - self.b + self.b * self._lengths[doc_id] / average_length)
+                scores[doc_id] += query_count * idf * count * (self.k1 + 1.0) / (count + norm)
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+    def stats(self) -> Dict[str, int]:
+        return {'documents': len(self._lengths), 'terms': len(self._postings)}
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[Tuple[str, float]]], k: int = 60) -> Dict[str, float]:
+    """Sum of ``1 / (k + rank)`` over every ranking a document appears in"""
+    fused: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, (doc_id, _) in enumerate(ranking, start=1):
+            fused[doc_id] += 1.0 / (k + rank)
+    return fused
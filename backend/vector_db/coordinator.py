@@ -0,0 +1,316 @@
+"""
+Scatter-gather coordinator for a sharded vector database
+
+Run one vector_db process per shard (each with its own VECTOR_DATA_DIR) and
+point this app at them with VECTOR_SHARDS, e.g.
+
+    VECTOR_SHARDS=http://localhost:8020,http://localhost:8021 uvicorn coordinator:app --port 8010
+
+Writes are routed to the shard that owns the id; similarity queries are
+embedded once, fanned out to every shard concurrently and merged with a heap.
+"""
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+from typing import Any, Dict, List
+from datetime import datetime
+import asyncio
+import itertools
+import json
+import os
+import sys
+import uvicorn
+import httpx
+
+# Add the current directory to the path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sharding import ShardRouter, merge_top_k
+
+app = FastAPI(title="Vector Database Coordinator", version="1.0.0")
+
+# The shard list is persisted so a restart keeps routing ids where they live
+COORDINATOR_DATA_DIR = os.getenv("COORDINATOR_DATA_DIR", "data")
+SHARDS_FILE = os.path.join(COORDINATOR_DATA_DIR, "shards.json")
+SHARD_TIMEOUT = float(os.getenv("SHARD_TIMEOUT", "30"))
+REBALANCE_BATCH = int(os.getenv("REBALANCE_BATCH", "500"))
+
+
+def load_shards() -> List[str]:
+    if os.path.exists(SHARDS_FILE):
+        with open(SHARDS_FILE, 'r') as f:
+            return json.load(f)
+    return os.getenv("VECTOR_SHARDS", "http://localhost:8020").split(",")
+
+
+def save_shards(shards: List[str]):
+    os.makedirs(COORDINATOR_DATA_DIR, exist_ok=True)
+    tmp_path = SHARDS_FILE + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(shards, f)
+    os.replace(tmp_path, SHARDS_FILE)
+
+
+router = ShardRouter(load_shards())
+client = httpx.AsyncClient(timeout=SHARD_TIMEOUT)
+rebalance_lock = asyncio.Lock()
+rebalance_status: Dict[str, Any] = {"running": False}
+# Shards dropped from the topology that still hold ids until drained
+draining_shards: List[str] = []
+# Topologies replaced since the last rebalance that finished draining, oldest first
+previous_routers: List[ShardRouter] = []
+embed_rotation = itertools.count()
+
+
+def query_shards() -> List[str]:
+    return list(dict.fromkeys(router.shards + draining_shards))
+
+
+# Shards that may hold an id: its owners under earlier topologies while a
+# rebalance has not finished, oldest first, then its owner. Drains copy before
+# deleting, so an id moved between two lookups is still found by the later one
+def id_shards(embedding_id: str) -> List[str]:
+    return list(dict.fromkeys([previous.owner(embedding_id) for previous in previous_routers]
+                              + [router.owner(embedding_id)]))
+
+
+class ShardsRequest(BaseModel):
+    urls: List[str]
+
+
+# Call one shard and return its JSON body, surfacing shard errors as-is
+async def call_shard(method: str, shard: str, path: str, **kwargs):
+    try:
+        response = await client.request(method, f"{shard}{path}", **kwargs)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Shard {shard} unreachable: {str(e)}")
+    if response.status_code >= 400:
+        try:
+            detail = response.json().get("detail", response.text)
+        except ValueError:
+            detail = response.text
+        raise HTTPException(status_code=response.status_code, detail=detail)
+    return response.json()
+
+
+# Call every shard concurrently, including ones still being drained
+async def fan_out(method: str, path: str, **kwargs):
+    return await asyncio.gather(*(call_shard(method, shard, path, **kwargs) for shard in query_shards()))
+
+
+def reject_writes_while_rebalancing():
+    if rebalance_status["running"]:
+        raise HTTPException(status_code=503, detail="Shard rebalance in progress, retry shortly")
+
+
+# Embed query texts once on a shard instead of once per shard
+async def embed_queries(texts: List[str]) -> List[List[float]]:
+    shard = router.shards[next(embed_rotation) % len(router.shards)]
+    return (await call_shard("POST", shard, "/embed", json={"texts": texts}))["vectors"]
+
+
+# Health check endpoint
+@app.get("/health")
+async def health_check():
+    results = await asyncio.gather(
+        *(call_shard("GET", shard, "/health") for shard in router.shards), return_exceptions=True
+    )
+    shards = {shard: "healthy" if not isinstance(result, Exception) else "unreachable"
+              for shard, result in zip(router.shards, results)}
+    status = "healthy" if all(state == "healthy" for state in shards.values()) else "degraded"
+    return {"status": status, "service": "vector_db_coordinator", "shards": shards, "timestamp": datetime.utcnow()}
+
+
+# Store an embedding on the shard that owns its id
+@app.post("/embeddings")
+async def store_embedding(request: Dict[str, Any]):
+    reject_writes_while_rebalancing()
+    if "id" not in request:
+        raise HTTPException(status_code=400, detail="id is required")
+    return await call_shard("POST", router.owner(request["id"]), "/embeddings", json=request)
+
+
+# Split a batch by owner and ingest every part concurrently
+@app.post("/embeddings/batch")
+async def store_embeddings_batch(request: Dict[str, Any]):
+    reject_writes_while_rebalancing()
+    items = request.get("items") or []
+    if not items:
+        raise HTTPException(status_code=400, detail="No items provided")
+
+    groups: Dict[str, List[dict]] = {}
+    for item in items:
+        groups.setdefault(router.owner(item["id"]), []).append(item)
+    options = {key: value for key, value in request.items() if key not in ("items", "stream")}
+    responses = await asyncio.gather(*(
+        call_shard("POST", shard, "/embeddings/batch", json={**options, "items": group})
+        for shard, group in groups.items()
+    ))
+
+    results = [result for response in responses for result in response["results"]]
+    stored = sum(response["stored"] for response in responses)
+    return {
+        "message": f"Stored {stored} of {len(results)} embeddings",
+        "stored": stored,
+        "failed": len(results) - stored,
+        "shards": len(groups),
+        "results": results
+    }
+
+
+# Get an embedding by ID
+@app.get("/embeddings/{embedding_id}")
+async def get_embedding(embedding_id: str):
+    shards = id_shards(embedding_id)
+    for shard in shards[:-1]:
+        try:
+            return await call_shard("GET", shard, f"/embeddings/{embedding_id}")
+        except HTTPException as e:
+            if e.status_code != 404:
+                raise
+    return await call_shard("GET", shards[-1], f"/embeddings/{embedding_id}")
+
+
+# Delete an embedding from every shard that may hold it, so a copy left on the
+# previous owner by an unfinished rebalance goes too
+@app.delete("/embeddings/{embedding_id}")
+async def delete_embedding(embedding_id: str):
+    reject_writes_while_rebalancing()
+    deleted = None
+    for shard in id_shards(embedding_id):
+        try:
+            deleted = await call_shard("DELETE", shard, f"/embeddings/{embedding_id}")
+        except HTTPException as e:
+            if e.status_code != 404:
+                raise
+    if deleted is None:
+        raise HTTPException(status_code=404, detail="Embedding not found")
+    return deleted
+
+
+# Scatter a similarity query to every shard and merge the per-shard top-k
+@app.post("/similarity")
+async def find_similar_embeddings(request: Dict[str, Any]):
+    if "text" not in request:
+        raise HTTPException(status_code=400, detail="text is required")
+    k = int(request.get("k", 5))
+
+    if request.get("mode", "dense") == "dense":
+        # Embed once, then let every shard score the same vector
+        vector = (await embed_queries([request["text"]]))[0]
+        body = {key: value for key, value in request.items() if key not in ("text", "mode")}
+        responses = await fan_out("POST", "/similarity/batch", json={**body, "vectors": [vector], "k": k})
+        return merge_top_k((response[0]["matches"] for response in responses), k)
+
+    # Lexical and hybrid scores depend on the query text, so forward it as-is;
+    # BM25 statistics are per shard, which is close enough for ranking
+    responses = await fan_out("POST", "/similarity", json=request)
+    return merge_top_k(responses, k)
+
+
+# Batch similarity: embed every query once and merge per query across shards
+@app.post("/similarity/batch")
+async def find_similar_embeddings_batch(request: Dict[str, Any]):
+    texts, vectors = request.get("texts"), request.get("vectors")
+    if bool(texts) == bool(vectors):
+        raise HTTPException(status_code=400, detail="Provide either texts or vectors")
+    k = int(request.get("k", 5))
+    if texts:
+        vectors = await embed_queries(texts)
+
+    body = {key: value for key, value in request.items() if key not in ("texts", "vectors")}
+    responses = await fan_out("POST", "/similarity/batch", json={**body, "vectors": vectors})
+    return [
+        {"query": i, "matches": merge_top_k((response[i]["matches"] for response in responses), k)}
+        for i in range(len(vectors))
+    ]
+
+
+# Shard topology and per-shard statistics
+@app.get("/shards")
+async def get_shards():
+    stats = await asyncio.gather(
+        *(call_shard("GET", shard, "/stats") for shard in router.shards), return_exceptions=True
+    )
+    return {
+        "shards": [
+            {"url": shard, "stats": result if not isinstance(result, Exception) else None}
+            for shard, result in zip(router.shards, stats)
+        ],
+        "rebalance": rebalance_status
+    }
+
+
+# Move every id whose owner changed from ``source`` to its new owner
+async def drain_shard(source: str):
+    ids: List[str] = []
+    offset = 0
+    while True:
+        page = await call_shard("GET", source, "/embeddings", params={"offset": offset, "limit": 10000})
+        ids.extend(page["ids"])
+        offset += len(page["ids"])
+        if not page["ids"] or offset >= page["total"]:
+            break
+
+    moved = 0
+    for target, target_ids in router.moves(source, ids).items():
+        for start in range(0, len(target_ids), REBALANCE_BATCH):
+            batch = target_ids[start:start + REBALANCE_BATCH]
+            exported = await call_shard("POST", source, "/embeddings/export", json={"ids": batch})
+            # Copy before deleting, so a failure never loses an embedding
+            await call_shard("POST", target, "/embeddings/import", json={"items": exported["items"]})
+            await call_shard("POST", source, "/embeddings/delete", json={"ids": batch})
+            moved += len(batch)
+            rebalance_status["moved"] = rebalance_status.get("moved", 0) + len(batch)
+    return moved
+
+
+# Replace the shard list and move ids to their new owners
+@app.post("/shards")
+async def set_shards(request: ShardsRequest):
+    global router
+    if rebalance_lock.locked():
+        raise HTTPException(status_code=409, detail="A rebalance is already running")
+
+    async with rebalance_lock:
+        try:
+            new_router = ShardRouter(request.urls)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        old_shards = query_shards()
+        rebalance_status.update({"running": True, "moved": 0, "started_at": datetime.utcnow().isoformat()})
+        try:
+            # Route to the new topology first; queries fan out to old and new
+            # shards alike until the removed ones have been drained
+            previous_routers.append(router)
+            router = new_router
+            draining_shards[:] = [shard for shard in old_shards if shard not in router.shards]
+            save_shards(router.shards)
+            moved = 0
+            for source in dict.fromkeys(old_shards + router.shards):
+                moved += await drain_shard(source)
+            draining_shards.clear()
+            previous_routers.clear()
+            rebalance_status.update({"running": False, "finished_at": datetime.utcnow().isoformat()})
+            return {"message": f"Rebalanced {moved} embeddings", "moved": moved, "shards": router.shards}
+        except Exception as e:
+            rebalance_status.update({"running": False, "error": str(e)})
+            if isinstance(e, HTTPException):
+                raise
+            raise HTTPException(status_code=500, detail=f"Error rebalancing shards: {str(e)}")
+
+
+# Aggregate statistics across shards
+@app.get("/stats")
+async def get_stats():
+    shards = query_shards()
+    stats = await fan_out("GET", "/stats")
+    return {
+        "shards": len(shards),
+        "live_vectors": sum(shard["live_vectors"] for shard in stats),
+        "per_shard": dict(zip(shards, stats))
+    }
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=8010)
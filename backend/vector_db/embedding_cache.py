@@ -0,0 +1,104 @@
+"""
+Content-hash keyed embedding cache for the vector database service
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """LRU cache of embedding vectors keyed by a hash of model name and text
+
+    Vectors are held as float32 arrays (about 3 KB for 768 dimensions, where
+    a list of Python floats takes about 25 KB) and handed out as lists. Each
+    entry remembers how long the embedding took to compute, so every
+    hit adds that latency to ``saved_seconds``. When ``persist_path`` is set,
+    entries are written through to SQLite and the most recently used ones
+    are reloaded on startup.
+    """
+
+    def __init__(self, capacity: int = 50000, persist_path: Optional[str] = None):
+        self.capacity = capacity
+        self.persist_path = persist_path
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._conn = None
+
+        if persist_path:
+            self._conn = sqlite3.connect(persist_path, check_same_thread=False)
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    key TEXT PRIMARY KEY,
+                    vector BLOB,
+                    compute_seconds REAL,
+                    last_used REAL
+                )
+            ''')
+            self._conn.commit()
+            rows = self._conn.execute(
+                "SELECT key, vector, compute_seconds FROM embedding_cache ORDER BY last_used DESC LIMIT ?",
+                (capacity,)
+            ).fetchall()
+            for key, blob, compute_seconds in reversed(rows):
+                self._entries[key] = (np.frombuffer(blob, dtype=np.float32), compute_seconds)
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\x00{text}".encode('utf-8')).hexdigest()
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = self.key(model, text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += entry[1]
+        return entry[0].tolist()
+
+    def put(self, model: str, text: str, vector, compute_seconds: float = 0.0):
+        self.put_many(model, [(text, vector)], compute_seconds)
+
+    def put_many(self, model: str, pairs, compute_seconds: float = 0.0):
+        """Cache ``(text, vector)`` pairs; ``compute_seconds`` is per item"""
+        rows = []
+        with self._lock:
+            for text, vector in pairs:
+                key = self.key(model, text)
+                vector = np.array(vector, dtype=np.float32)
+                self._entries[key] = (vector, compute_seconds)
+                self._entries.move_to_end(key)
+                rows.append((key, vector.tobytes(), compute_seconds, time.time()))
+            evicted = []
+            while len(self._entries) > self.capacity:
+                evicted.append(self._entries.popitem(last=False)[0])
+            if self._conn is not None:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embedding_cache (key, vector, compute_seconds, last_used) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                if evicted:
+                    self._conn.executemany("DELETE FROM embedding_cache WHERE key = ?", [(key,) for key in evicted])
+                self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'capacity': self.capacity,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'saved_seconds': round(self.saved_seconds, 3),
+            'persistent': self._conn is not None,
+        }
@@ -1,12 +1,28 @@
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, conint
+from typing import Any, Dict, List, Optional
 import os
 import uuid
 from datetime import datetime
 import uvicorn
+import sys
+import json
+import time
+import asyncio
+import re
+import shutil
 import numpy as np
 
+# Add the current directory and backend/shared (where Docker copies it to /shared) to the path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'shared'))
+
+from storage import VectorStore
+from embedding_cache import EmbeddingCache
+from local_embedder import HashingEmbedder
+from reindex import ReindexManager
+
 # FAISS import with error handling
 FAISS_AVAILABLE = False
 faiss = None
@@ -35,22 +51,134 @@ else:
     embedding_model = None
     print("Warning: GEMINI_API_KEY not set. AI embeddings will be disabled.")
 
-# In-memory storage for embeddings (in a real implementation, this would be FAISS)
-embeddings_store = {}
+# Offline embedder used without a key, or everywhere with EMBEDDING_BACKEND=local
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "gemini")
+local_embedder = HashingEmbedder(dim=int(os.getenv("LOCAL_EMBEDDING_DIM", "768")))
+if EMBEDDING_BACKEND == "local":
+    embedding_model = None
+
+# Persistent storage for embeddings: vectors live in a memory-mapped append-only
+# file and metadata/deletes in a write-ahead log, so restarts don't re-embed
+VECTOR_DATA_DIR = os.getenv("VECTOR_DATA_DIR", "data")
+VECTOR_COMPACT_EVERY = int(os.getenv("VECTOR_COMPACT_EVERY", "10000"))
+VECTOR_FSYNC = os.getenv("VECTOR_FSYNC", "true").lower() == "true"
+# Compressed in-memory search codes: none, float16, int8 or pq
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+VECTOR_RERANK = int(os.getenv("VECTOR_RERANK", "4"))
+PQ_SUBSPACES = int(os.getenv("PQ_SUBSPACES", "96"))
+# With several workers every process maps the same files; writes are
+# serialized by a file lock and each worker tails the WAL for the others' writes
+VECTOR_WORKERS = int(os.getenv("VECTOR_WORKERS", "1"))
+VECTOR_SHARED = os.getenv("VECTOR_SHARED", "true" if VECTOR_WORKERS > 1 else "false").lower() == "true"
+embeddings_store = VectorStore(
+    VECTOR_DATA_DIR,
+    compact_every=VECTOR_COMPACT_EVERY,
+    fsync=VECTOR_FSYNC,
+    quantization=VECTOR_QUANTIZATION,
+    rerank=VECTOR_RERANK,
+    pq_subspaces=PQ_SUBSPACES,
+    shared=VECTOR_SHARED
+)
+
+# Cache of remote embeddings keyed by content hash, so repeated queries and
+# duplicate texts skip the embedding call
+EMBEDDING_MODEL_NAME = "models/embedding-001"
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "50000"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH") or None
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_PATH)
+
+# Most neighbours a similarity query may ask for
+MAX_RESULTS = int(os.getenv("MAX_RESULTS", "1000"))
 
 class EmbeddingRequest(BaseModel):
     id: str
     text: str
     metadata: Optional[dict] = None
 
+class BatchEmbeddingRequest(BaseModel):
+    items: List[EmbeddingRequest]
+    batch_size: int = 100  # Texts per batch-embed call (the API caps this at 100)
+    concurrency: int = 4  # Batch-embed calls in flight at once
+    stream: bool = False  # Stream per-item status as NDJSON while batches complete
+
 class SimilarityRequest(BaseModel):
     text: str
-    k: int = 5  # Number of similar items to return
+    k: conint(ge=1, le=MAX_RESULTS) = 5  # Number of similar items to return
+    # Metadata filters: {"jurisdiction": "US"} for equality or
+    # {"category": ["aml", "kyc"]} for set membership; keys are ANDed
+    filters: Optional[Dict[str, Any]] = None
+    # Candidates re-ranked exactly per result when quantization is on (0 disables)
+    rerank: Optional[int] = None
+    # Retrieval mode: dense (cosine), lexical (BM25) or hybrid (both, fused)
+    mode: str = "dense"
+    fusion: str = "rrf"  # Hybrid fusion: rrf or weighted
+    alpha: float = 0.5  # Dense weight for weighted fusion
+    lexical_prefilter: bool = False  # Only score documents sharing a query term densely
 
 class SimilarityResponse(BaseModel):
     id: str
     similarity: float
     metadata: Optional[dict] = None
+    dense_score: Optional[float] = None
+    lexical_score: Optional[float] = None
+
+class ImportedEmbedding(BaseModel):
+    id: str
+    vector: List[float]
+    text: Optional[str] = None
+    metadata: Optional[dict] = None
+    created_at: Optional[str] = None
+
+class ImportEmbeddingsRequest(BaseModel):
+    items: List[ImportedEmbedding]
+
+class EmbeddingIdsRequest(BaseModel):
+    ids: List[str]
+
+class EmbedTextsRequest(BaseModel):
+    texts: List[str]
+
+class BatchSimilarityRequest(BaseModel):
+    texts: Optional[List[str]] = None  # Query texts, embedded together
+    vectors: Optional[List[List[float]]] = None  # Or raw query vectors
+    k: conint(ge=1, le=MAX_RESULTS) = 5
+    filters: Optional[Dict[str, Any]] = None
+    rerank: Optional[int] = None
+
+class BatchSimilarityResult(BaseModel):
+    query: int  # Position of the query in the request
+    matches: List[SimilarityResponse]
+
+class CollectionSearchRequest(BaseModel):
+    vectors: List[List[float]]
+    k: conint(ge=1, le=MAX_RESULTS) = 5
+    filters: Optional[Dict[str, Any]] = None
+
+class CollectionSwapRequest(BaseModel):
+    # Collection built separately whose contents replace this one; it is removed
+    source: str
+
+class ReindexRequest(BaseModel):
+    # Re-embed every stored text with this backend (gemini or local); when
+    # omitted, only the search codes are rebuilt from the stored vectors
+    embedding_backend: Optional[str] = None
+    quantization: Optional[str] = None  # none, float16, int8 or pq
+    pq_subspaces: Optional[int] = None
+    rerank: Optional[int] = None
+    batch_size: int = 100  # Texts re-embedded per call
+    force: bool = False  # Start even if the memory/disk headroom check fails
+
+# Embed new writes and queries with the backend the index was last built with,
+# which a re-index (possibly in another worker) publishes with its generation
+@app.middleware("http")
+async def follow_index_settings(request, call_next):
+    global EMBEDDING_BACKEND, embedding_model
+    embeddings_store.refresh()
+    backend = embeddings_store.settings.get("embedding_backend")
+    if backend and backend != EMBEDDING_BACKEND:
+        EMBEDDING_BACKEND = backend
+        embedding_model = genai.embed_content if backend == "gemini" and GEMINI_API_KEY else None
+    return await call_next(request)
 
 # Health check endpoint
 @app.get("/health")
@@ -63,21 +191,124 @@ def generate_embeddings_with_gemini(text: str):
         # Fallback to simple embedding generation
         return generate_simple_embeddings(text)
     
+    cached = embedding_cache.get(EMBEDDING_MODEL_NAME, text)
+    if cached is not None:
+        return cached
+    
     try:
         # Generate embeddings using Gemini
-        result = genai.embed_content(model="models/embedding-001", content=text)
+        started = time.perf_counter()
+        result = genai.embed_content(model=EMBEDDING_MODEL_NAME, content=text)
+        embedding_cache.put(EMBEDDING_MODEL_NAME, text, result['embedding'], time.perf_counter() - started)
         return result['embedding']
     except Exception as e:
         print(f"Error generating embeddings with Gemini: {str(e)}")
         # Fallback to simple embedding generation
         return generate_simple_embeddings(text)
 
-# Simple embedding generation (fallback)
+# Generate embeddings for many texts with one batch-embed call
+def generate_batch_embeddings_with_gemini(texts: List[str]):
+    if not embedding_model or not GEMINI_API_KEY:
+        return local_embedder.embed_many(texts).tolist()
+    
+    # Errors propagate so the caller can retry the whole batch
+    started = time.perf_counter()
+    result = genai.embed_content(model=EMBEDDING_MODEL_NAME, content=texts)
+    vectors = result['embedding']
+    if len(vectors) == len(texts):
+        elapsed = (time.perf_counter() - started) / max(len(texts), 1)
+        embedding_cache.put_many(EMBEDDING_MODEL_NAME, zip(texts, vectors), elapsed)
+    return vectors
+
+# Split texts into cached vectors and the unique texts that still need embedding
+def lookup_cached_embeddings(texts: List[str]):
+    if not embedding_model or not GEMINI_API_KEY:
+        return {}, list(dict.fromkeys(texts))
+    
+    found, missing = {}, []
+    for text in dict.fromkeys(texts):
+        vector = embedding_cache.get(EMBEDDING_MODEL_NAME, text)
+        if vector is not None:
+            found[text] = vector
+        else:
+            missing.append(text)
+    return found, missing
+
+# Named collections of caller-supplied vectors (e.g. transaction feature vectors),
+# each its own store under VECTOR_DATA_DIR/collections with its own dimension
+COLLECTION_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+collections: Dict[str, VectorStore] = {}
+
+def get_collection(name: str) -> VectorStore:
+    if not COLLECTION_NAME_PATTERN.match(name):
+        raise HTTPException(status_code=400, detail="Collection names may only contain letters, digits, '_' and '-'")
+    if name not in collections:
+        collections[name] = VectorStore(
+            os.path.join(VECTOR_DATA_DIR, "collections", name),
+            compact_every=VECTOR_COMPACT_EVERY,
+            fsync=VECTOR_FSYNC,
+            shared=VECTOR_SHARED
+        )
+    return collections[name]
+
+# Background re-indexing: the live generation keeps serving until the swap
+reindex_manager = ReindexManager(embeddings_store)
+
+# Batch embedding limits
+MAX_BATCH_ITEMS = int(os.getenv("MAX_BATCH_ITEMS", "10000"))
+EMBED_BATCH_LIMIT = 100
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "3"))
+
+# Embed one group of items off the event loop, retrying with exponential backoff
+async def embed_batch_with_retry(texts: List[str], semaphore: asyncio.Semaphore):
+    async with semaphore:
+        for attempt in range(EMBED_MAX_RETRIES + 1):
+            try:
+                return await asyncio.to_thread(generate_batch_embeddings_with_gemini, texts)
+            except Exception as e:
+                if attempt == EMBED_MAX_RETRIES:
+                    raise
+                print(f"Batch embedding attempt {attempt + 1} failed: {str(e)}")
+                await asyncio.sleep(0.5 * (2 ** attempt))
+
+# Embed and store one group, returning per-item statuses
+async def ingest_batch(items: List[EmbeddingRequest], semaphore: asyncio.Semaphore):
+    try:
+        texts = [item.text for item in items]
+        by_text, missing = lookup_cached_embeddings(texts)
+        if missing:
+            fresh = await embed_batch_with_retry(missing, semaphore)
+            if len(fresh) != len(missing):
+                raise ValueError(f"Expected {len(missing)} embeddings, got {len(fresh)}")
+            by_text.update(zip(missing, fresh))
+        vectors = [by_text[text] for text in texts]
+        created_at = datetime.utcnow().isoformat()
+        embeddings_store.put_many(
+            (item.id, vector, item.text, item.metadata, created_at)
+            for item, vector in zip(items, vectors)
+        )
+        return [{"id": item.id, "status": "stored"} for item in items]
+    except Exception as e:
+        return [{"id": item.id, "status": "error", "error": str(e)} for item in items]
+
+# Embed many query texts together, reusing cached vectors
+def generate_query_embeddings(texts: List[str]):
+    by_text, missing = lookup_cached_embeddings(texts)
+    for start in range(0, len(missing), EMBED_BATCH_LIMIT):
+        group = missing[start:start + EMBED_BATCH_LIMIT]
+        try:
+            by_text.update(zip(group, generate_batch_embeddings_with_gemini(group)))
+        except Exception as e:
+            print(f"Error generating batch embeddings with Gemini: {str(e)}")
+            # Fallback to local embedding generation, like the single-text path
+            by_text.update(zip(group, local_embedder.embed_many(group).tolist()))
+    return [by_text[text] for text in texts]
+
+# Local embedding generation (fallback)
 def generate_simple_embeddings(text: str):
-    # This is a simple fallback that creates a fixed-size vector
-    # In a real implementation, you would use a proper embedding model
-    np.random.seed(hash(text) % (2**32))  # Seed based on text for consistency
-    return np.random.rand(768).tolist()  # 768-dimensional vector (similar to many embedding models)
+    # Hashed word/bigram/character n-gram projection: deterministic across
+    # processes and meaningful for similarity, with no network calls
+    return local_embedder.embed(text)
 
 # Store an embedding
 @app.post("/embeddings")
@@ -86,11 +317,7 @@ async def store_embedding(request: EmbeddingRequest):
         # Generate embeddings using AI
         vector = generate_embeddings_with_gemini(request.text)
         
-        # In a real implementation with FAISS:
-        # 1. Add the vector to the FAISS index
-        # 2. Store metadata in a separate database
-        
-        # For this example, we'll store in memory
+        # Append the vector to the mapped file and log its metadata
         embeddings_store[request.id] = {
             "vector": vector,
             "text": request.text,
@@ -103,6 +330,84 @@ async def store_embedding(request: EmbeddingRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error storing embedding: {str(e)}")
 
+# Store many embeddings with batched, concurrent embedding calls
+@app.post("/embeddings/batch")
+async def store_embeddings_batch(request: BatchEmbeddingRequest):
+    if not request.items:
+        raise HTTPException(status_code=400, detail="No items provided")
+    if len(request.items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_ITEMS} items are allowed per request")
+    
+    started = time.perf_counter()
+    batch_size = max(1, min(request.batch_size, EMBED_BATCH_LIMIT))
+    semaphore = asyncio.Semaphore(max(1, request.concurrency))
+    groups = [request.items[i:i + batch_size] for i in range(0, len(request.items), batch_size)]
+    tasks = [asyncio.create_task(ingest_batch(group, semaphore)) for group in groups]
+    
+    if request.stream:
+        async def stream_results():
+            for task in asyncio.as_completed(tasks):
+                for result in await task:
+                    yield json.dumps(result) + "\n"
+        
+        return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+    
+    results = [result for group in await asyncio.gather(*tasks) for result in group]
+    stored = sum(1 for result in results if result["status"] == "stored")
+    
+    return {
+        "message": f"Stored {stored} of {len(results)} embeddings",
+        "stored": stored,
+        "failed": len(results) - stored,
+        "batches": len(groups),
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+        "results": results
+    }
+
+# List stored embedding ids, page by page
+@app.get("/embeddings")
+async def list_embeddings(offset: int = 0, limit: int = 10000):
+    ids = list(embeddings_store)
+    return {"ids": ids[offset:offset + limit], "total": len(ids)}
+
+# Export stored embeddings with their vectors (used to move ids between shards)
+@app.post("/embeddings/export")
+async def export_embeddings(request: EmbeddingIdsRequest):
+    items = []
+    for embedding_id in request.ids:
+        data = embeddings_store.get(embedding_id)
+        if data is not None:
+            items.append({"id": embedding_id, **data})
+    return {"items": items}
+
+# Store precomputed vectors without embedding their text again
+@app.post("/embeddings/import")
+async def import_embeddings(request: ImportEmbeddingsRequest):
+    try:
+        stored = embeddings_store.put_many(
+            (item.id, item.vector, item.text, item.metadata, item.created_at) for item in request.items
+        )
+        return {"message": f"Imported {stored} embeddings", "stored": stored}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error importing embeddings: {str(e)}")
+
+# Delete many embeddings at once
+@app.post("/embeddings/delete")
+async def delete_embeddings(request: EmbeddingIdsRequest):
+    deleted = embeddings_store.delete_many(request.ids)
+    return {"message": f"Deleted {deleted} embeddings", "deleted": deleted}
+
+# Embed texts without storing them (lets a coordinator embed a query once)
+@app.post("/embed")
+async def embed_texts(request: EmbedTextsRequest):
+    try:
+        vectors = await asyncio.to_thread(generate_query_embeddings, request.texts)
+        return {"vectors": vectors}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating embeddings: {str(e)}")
+
 # Get an embedding by ID
 @app.get("/embeddings/{embedding_id}")
 async def get_embedding(embedding_id: str):
@@ -118,34 +423,86 @@ async def find_similar_embeddings(request: SimilarityRequest):
         if not embeddings_store:
             return []
         
-        # Generate embedding for the query text
-        query_vector = np.array(generate_embeddings_with_gemini(request.text))
+        if request.mode not in ("dense", "lexical", "hybrid"):
+            raise HTTPException(status_code=400, detail="mode must be one of dense, lexical or hybrid")
+        if request.fusion not in ("rrf", "weighted"):
+            raise HTTPException(status_code=400, detail="fusion must be rrf or weighted")
         
-        # Calculate similarities (cosine similarity)
-        similarities = []
-        for id, data in embeddings_store.items():
-            stored_vector = np.array(data["vector"])
-            
-            # Calculate cosine similarity
-            dot_product = np.dot(query_vector, stored_vector)
-            norm_query = np.linalg.norm(query_vector)
-            norm_stored = np.linalg.norm(stored_vector)
+        if request.mode == "lexical":
+            # BM25 over stored texts needs no query embedding
+            matches = [
+                (id, score, None, score)
+                for id, score in embeddings_store.lexical_search(request.text, request.k, request.filters)
+            ]
+        else:
+            # Generate embedding for the query text
+            query_vector = np.array(generate_embeddings_with_gemini(request.text))
             
-            if norm_query == 0 or norm_stored == 0:
-                similarity = 0
+            if request.mode == "hybrid":
+                matches = embeddings_store.hybrid_search(
+                    query_vector, request.text, request.k, request.filters,
+                    fusion=request.fusion, alpha=request.alpha, lexical_prefilter=request.lexical_prefilter
+                )
             else:
-                similarity = dot_product / (norm_query * norm_stored)
-            
+                # Cosine similarity in one pass over the mapping, restricted to the
+                # metadata index's candidates when filters are given
+                matches = [
+                    (id, similarity, similarity, None)
+                    for id, similarity in embeddings_store.search(query_vector, request.k, request.filters, request.rerank)
+                ]
+        
+        similarities = []
+        for id, similarity, dense_score, lexical_score in matches:
+            entry = embeddings_store.entry(id)
             similarities.append({
                 "id": id,
-                "similarity": float(similarity),
-                "metadata": data.get("metadata")
+                "similarity": similarity,
+                "metadata": entry.get("metadata") if entry else None,
+                "dense_score": dense_score,
+                "lexical_score": lexical_score
             })
         
-        # Sort by similarity (descending) and return top k
-        similarities.sort(key=lambda x: x["similarity"], reverse=True)
-        return similarities[:request.k]
+        return similarities
     
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error finding similar embeddings: {str(e)}")
+
+# Find similar embeddings for many queries with one matrix-matrix product per chunk
+@app.post("/similarity/batch", response_model=List[BatchSimilarityResult])
+async def find_similar_embeddings_batch(request: BatchSimilarityRequest):
+    if bool(request.texts) == bool(request.vectors):
+        raise HTTPException(status_code=400, detail="Provide either texts or vectors")
+    
+    try:
+        if request.texts:
+            query_vectors = await asyncio.to_thread(generate_query_embeddings, request.texts)
+        else:
+            query_vectors = request.vectors
+        
+        if not embeddings_store:
+            return [{"query": i, "matches": []} for i in range(len(query_vectors))]
+        if embeddings_store.dim and any(len(vector) != embeddings_store.dim for vector in query_vectors):
+            raise HTTPException(status_code=400, detail=f"Query vectors must be {embeddings_store.dim}-dimensional")
+        
+        neighbours = await asyncio.to_thread(
+            embeddings_store.search_many, query_vectors, request.k, request.filters, request.rerank
+        )
+        
+        results = []
+        for i, matches in enumerate(neighbours):
+            results.append({
+                "query": i,
+                "matches": [
+                    {"id": id, "similarity": similarity, "metadata": (embeddings_store.entry(id) or {}).get("metadata")}
+                    for id, similarity in matches
+                ]
+            })
+        return results
+    
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error finding similar embeddings: {str(e)}")
 
@@ -158,5 +515,165 @@ async def delete_embedding(embedding_id: str):
     del embeddings_store[embedding_id]
     return {"message": "Embedding deleted successfully"}
 
+# Store precomputed vectors in a named collection
+@app.post("/collections/{name}/vectors")
+async def import_collection_vectors(name: str, request: ImportEmbeddingsRequest):
+    store = get_collection(name)
+    try:
+        stored = store.put_many(
+            (item.id, item.vector, item.text, item.metadata, item.created_at) for item in request.items
+        )
+        return {"message": f"Imported {stored} vectors into {name}", "stored": stored}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error importing vectors: {str(e)}")
+
+# Top-k neighbours in a collection for many query vectors, using the same scan as /similarity/batch
+@app.post("/collections/{name}/search", response_model=List[BatchSimilarityResult])
+async def search_collection(name: str, request: CollectionSearchRequest):
+    store = get_collection(name)
+    if store.dim and any(len(vector) != store.dim for vector in request.vectors):
+        raise HTTPException(status_code=400, detail=f"Query vectors must be {store.dim}-dimensional")
+    
+    try:
+        neighbours = await asyncio.to_thread(store.search_many, request.vectors, request.k, request.filters)
+        results = []
+        for i, matches in enumerate(neighbours):
+            results.append({
+                "query": i,
+                "matches": [
+                    {"id": match_id, "similarity": similarity, "metadata": (store.entry(match_id) or {}).get("metadata")}
+                    for match_id, similarity in matches
+                ]
+            })
+        return results
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching collection: {str(e)}")
+
+# Collection statistics
+@app.get("/collections/{name}")
+async def get_collection_stats(name: str):
+    return get_collection(name).stats()
+
+# Empty a collection, e.g. before rebuilding it
+@app.delete("/collections/{name}")
+async def delete_collection(name: str):
+    store = get_collection(name)
+    deleted = store.delete_many(list(store))
+    store.compact()
+    return {"message": f"Deleted {deleted} vectors from {name}", "deleted": deleted}
+
+# Replace a collection with one built separately under another name, so
+# searches see the old contents or the new, never a partly rebuilt collection
+@app.post("/collections/{name}/swap")
+async def swap_collection(name: str, request: CollectionSwapRequest):
+    if request.source == name:
+        raise HTTPException(status_code=400, detail="A collection cannot be swapped with itself")
+    store = get_collection(name)
+    staging = get_collection(request.source)
+    try:
+        await asyncio.to_thread(store.adopt, staging, same_texts=False)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error swapping collections: {str(e)}")
+    del collections[request.source]
+    shutil.rmtree(staging.data_dir, ignore_errors=True)
+    return {"message": f"Replaced {name} with {request.source}", "live_vectors": len(store)}
+
+# Storage statistics
+@app.get("/stats")
+async def get_stats():
+    stats = embeddings_store.stats()
+    stats["embedding_cache"] = embedding_cache.stats()
+    stats["embedding_backend"] = EMBEDDING_BACKEND
+    stats["reindex"] = reindex_manager.current_status().get("state")
+    return stats
+
+# Measure recall and memory of the configured quantization against exact search
+@app.get("/quantization/evaluate")
+async def evaluate_quantization(k: int = 10, samples: int = 100):
+    try:
+        return await asyncio.to_thread(embeddings_store.evaluate_quantization, k, samples)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error evaluating quantization: {str(e)}")
+
+# Fold the write-ahead log into a new snapshot generation
+@app.post("/compact")
+async def compact_store():
+    try:
+        embeddings_store.compact()
+        return {"message": "Store compacted successfully", "stats": embeddings_store.stats()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error compacting store: {str(e)}")
+
+# Embed texts with a specific backend for re-indexing, raising on errors
+def embed_with_backend(backend: str, texts: List[str]):
+    if backend == "local":
+        return local_embedder.embed_many(texts).tolist()
+    
+    # Called directly rather than through the helpers above, which follow the
+    # backend currently serving requests
+    by_text = {}
+    missing = []
+    for text in dict.fromkeys(texts):
+        vector = embedding_cache.get(EMBEDDING_MODEL_NAME, text)
+        if vector is not None:
+            by_text[text] = vector
+        else:
+            missing.append(text)
+    for start in range(0, len(missing), EMBED_BATCH_LIMIT):
+        group = missing[start:start + EMBED_BATCH_LIMIT]
+        for attempt in range(EMBED_MAX_RETRIES + 1):
+            try:
+                started = time.perf_counter()
+                vectors = genai.embed_content(model=EMBEDDING_MODEL_NAME, content=group)['embedding']
+                if len(vectors) != len(group):
+                    raise ValueError(f"Expected {len(group)} embeddings, got {len(vectors)}")
+                break
+            except Exception as e:
+                if attempt == EMBED_MAX_RETRIES:
+                    raise
+                print(f"Re-index embedding attempt {attempt + 1} failed: {str(e)}")
+                time.sleep(0.5 * (2 ** attempt))
+        elapsed = (time.perf_counter() - started) / len(group)
+        embedding_cache.put_many(EMBEDDING_MODEL_NAME, zip(group, vectors), elapsed)
+        by_text.update(zip(group, vectors))
+    return [by_text[text] for text in texts]
+
+# Start a background re-index; queries keep using the current index until it is swapped
+@app.post("/reindex", status_code=202)
+async def start_reindex(request: ReindexRequest):
+    backend = request.embedding_backend
+    if backend is not None and backend not in ("gemini", "local"):
+        raise HTTPException(status_code=400, detail="embedding_backend must be 'gemini' or 'local'")
+    if backend == "gemini" and not GEMINI_API_KEY:
+        raise HTTPException(status_code=400, detail="GEMINI_API_KEY is required for the gemini backend")
+    
+    try:
+        return reindex_manager.start(
+            quantization=request.quantization,
+            pq_subspaces=request.pq_subspaces,
+            rerank=request.rerank,
+            embed=(lambda texts: embed_with_backend(backend, texts)) if backend else None,
+            batch_size=max(1, min(request.batch_size, EMBED_BATCH_LIMIT)),
+            force=request.force,
+            target={"embedding_backend": backend} if backend else None
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except MemoryError as e:
+        raise HTTPException(status_code=507, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Progress of the current or last re-index job
+@app.get("/reindex")
+async def get_reindex_status():
+    return reindex_manager.current_status()
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8010)
\ No newline at end of file
+    if VECTOR_WORKERS > 1:
+        # Workers re-import the app, so pass it by import string
+        uvicorn.run("main:app", host="0.0.0.0", port=8010, workers=VECTOR_WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8010)
\ No newline at end of file
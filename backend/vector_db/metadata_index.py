@@ -0,0 +1,73 @@
+"""
+Inverted index over embedding metadata for filtered similarity search
+"""
+import json
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Optional, Set
+
+
+def _index_values(value: Any) -> Iterable[str]:
+    """Canonical posting keys for a metadata value; lists index every element"""
+    if isinstance(value, (list, tuple, set)):
+        return [json.dumps(v, sort_keys=True) for v in value]
+    return [json.dumps(value, sort_keys=True)]
+
+
+class MetadataIndex:
+    """Maps ``(key, value)`` pairs to the ids whose metadata contains them
+
+    Filters are ``{key: value}`` for equality or ``{key: [v1, v2]}`` for set
+    membership; keys are ANDed together and the values of one key are ORed.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, Set[str]]] = defaultdict(lambda: defaultdict(set))
+
+    def add(self, embedding_id: str, metadata: Optional[dict]):
+        if not metadata:
+            return
+        for key, value in metadata.items():
+            for posting in _index_values(value):
+                self._postings[key][posting].add(embedding_id)
+
+    def remove(self, embedding_id: str, metadata: Optional[dict]):
+        if not metadata:
+            return
+        for key, value in metadata.items():
+            values = self._postings.get(key)
+            if values is None:
+                continue
+            for posting in _index_values(value):
+                ids = values.get(posting)
+                if ids is not None:
+                    ids.discard(embedding_id)
+                    if not ids:
+                        del values[posting]
+            if not values:
+                del self._postings[key]
+
+    def candidates(self, filters: Dict[str, Any]) -> Set[str]:
+        """Ids matching every filter, intersecting the smallest posting sets first"""
+        per_key = []
+        for key, wanted in filters.items():
+            values = self._postings.get(key, {})
+            wanted = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+            matched: Set[str] = set()
+            for value in wanted:
+                matched |= values.get(json.dumps(value, sort_keys=True), set())
+            if not matched:
+                return set()
+            per_key.append(matched)
+
+        if not per_key:
+            return set()
+        per_key.sort(key=len)
+        result = set(per_key[0])
+        for ids in per_key[1:]:
+            result &= ids
+            if not result:
+                break
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        return {key: len(values) for key, values in self._postings.items()}
@@ -0,0 +1,208 @@
+"""
+Compressed vector representations for the vector database service
+"""
+from typing import Any, Dict, Union
+
+import numpy as np
+
+SCORE_CHUNK_ROWS = 65536
+
+# Row selector accepted by ``score``: None for all rows, a slice, or row numbers
+Rows = Union[None, slice, np.ndarray]
+
+
+class _GrowableArray:
+    """Row-appendable numpy array with amortized O(1) appends"""
+
+    def __init__(self, width: int, dtype):
+        self._data = np.zeros((1024, width) if width else 1024, dtype=dtype)
+        self._size = 0
+
+    def append(self, rows: np.ndarray):
+        needed = self._size + len(rows)
+        if needed > len(self._data):
+            capacity = max(needed, 2 * len(self._data))
+            grown = np.zeros((capacity,) + self._data.shape[1:], dtype=self._data.dtype)
+            grown[:self._size] = self._data[:self._size]
+            self._data = grown
+        self._data[self._size:needed] = rows
+        self._size = needed
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._data[:self._size]
+
+    def __len__(self) -> int:
+        return self._size
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length so inner products are cosine similarities"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms != 0)
+
+
+class Float16Codes:
+    """Unit vectors stored as float16: half the memory, near-exact scores"""
+
+    name = 'float16'
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self._codes = _GrowableArray(dim, np.float16)
+
+    def append(self, unit_vectors: np.ndarray):
+        self._codes.append(unit_vectors.astype(np.float16))
+
+    def score(self, queries: np.ndarray, rows: Rows = None) -> np.ndarray:
+        """Approximate cosine scores of shape ``(rows, queries)`` for unit queries"""
+        codes = self._codes.values if rows is None else self._codes.values[rows]
+        out = np.empty((len(codes), len(queries)), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_CHUNK_ROWS):
+            chunk = codes[start:start + SCORE_CHUNK_ROWS].astype(np.float32)
+            out[start:start + len(chunk)] = chunk @ queries.T
+        return out
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def bytes_per_vector(self) -> int:
+        return self.dim * 2
+
+
+class Int8Codes:
+    """Unit vectors scalar-quantized to int8 with one float32 scale per vector"""
+
+    name = 'int8'
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self._codes = _GrowableArray(dim, np.int8)
+        self._scales = _GrowableArray(0, np.float32)
+
+    def append(self, unit_vectors: np.ndarray):
+        scales = np.abs(unit_vectors).max(axis=1) / 127.0
+        safe = np.where(scales == 0, 1.0, scales)
+        codes = np.clip(np.rint(unit_vectors / safe[:, None]), -127, 127).astype(np.int8)
+        self._codes.append(codes)
+        self._scales.append(scales.astype(np.float32))
+
+    def score(self, queries: np.ndarray, rows: Rows = None) -> np.ndarray:
+        """Approximate cosine scores of shape ``(rows, queries)`` for unit queries"""
+        codes = self._codes.values if rows is None else self._codes.values[rows]
+        scales = self._scales.values if rows is None else self._scales.values[rows]
+        out = np.empty((len(codes), len(queries)), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_CHUNK_ROWS):
+            chunk = codes[start:start + SCORE_CHUNK_ROWS].astype(np.float32)
+            out[start:start + len(chunk)] = chunk @ queries.T
+        return out * scales[:, None]
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def bytes_per_vector(self) -> int:
+        return self.dim + 4
+
+
+class ProductQuantizedCodes:
+    """Product quantization: ``subspaces`` codebooks of 256 centroids each
+
+    Every vector becomes one byte per subspace. Queries are scored with
+    asymmetric distance computation: a per-query lookup table of subspace
+    inner products, summed over each vector's codes.
+    """
+
+    name = 'pq'
+
+    def __init__(self, dim: int, subspaces: int = 96, train_size: int = 20000, iterations: int = 10):
+        if dim % subspaces != 0:
+            raise ValueError(f"PQ subspaces ({subspaces}) must divide the dimension ({dim})")
+        self.dim = dim
+        self.subspaces = subspaces
+        self.sub_dim = dim // subspaces
+        self.train_size = train_size
+        self.iterations = iterations
+        self.codebooks = None  # (subspaces, centroids, sub_dim)
+        self._codes = _GrowableArray(subspaces, np.uint8)
+
+    def fit(self, unit_vectors: np.ndarray):
+        """Train codebooks with k-means on a sample of the vectors"""
+        rng = np.random.default_rng(0)
+        if len(unit_vectors) > self.train_size:
+            sample = unit_vectors[np.sort(rng.choice(len(unit_vectors), self.train_size, replace=False))]
+        else:
+            sample = np.asarray(unit_vectors)
+        centroids = min(256, len(sample))
+        codebooks = np.zeros((self.subspaces, centroids, self.sub_dim), dtype=np.float32)
+        for j in range(self.subspaces):
+            data = sample[:, j * self.sub_dim:(j + 1) * self.sub_dim]
+            centers = data[rng.choice(len(data), centroids, replace=False)].copy()
+            for _ in range(self.iterations):
+                assignment = self._nearest(data, centers)
+                sums = np.zeros_like(centers)
+                np.add.at(sums, assignment, data)
+                counts = np.bincount(assignment, minlength=centroids)
+                filled = counts > 0
+                centers[filled] = sums[filled] / counts[filled, None]
+            codebooks[j] = centers
+        self.codebooks = codebooks
+
+    @staticmethod
+    def _nearest(data: np.ndarray, centers: np.ndarray) -> np.ndarray:
+        distances = (centers ** 2).sum(axis=1)[None, :] - 2.0 * data @ centers.T
+        return distances.argmin(axis=1)
+
+    def append(self, unit_vectors: np.ndarray):
+        if self.codebooks is None:
+            self.fit(unit_vectors)
+        codes = np.empty((len(unit_vectors), self.subspaces), dtype=np.uint8)
+        for j in range(self.subspaces):
+            data = unit_vectors[:, j * self.sub_dim:(j + 1) * self.sub_dim]
+            codes[:, j] = self._nearest(data, self.codebooks[j])
+        self._codes.append(codes)
+
+    def score(self, queries: np.ndarray, rows: Rows = None) -> np.ndarray:
+        """Approximate cosine scores of shape ``(rows, queries)`` for unit queries"""
+        codes = self._codes.values if rows is None else self._codes.values[rows]
+        # table[j, c, q] = <subvector j of query q, centroid c of subspace j>
+        table = np.einsum('jcd,qjd->jcq', self.codebooks,
+                          queries.reshape(len(queries), self.subspaces, self.sub_dim))
+        out = np.zeros((len(codes), len(queries)), dtype=np.float32)
+        for j in range(self.subspaces):
+            out += table[j][codes[:, j]]
+        return out
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def bytes_per_vector(self) -> int:
+        return self.subspaces
+
+
+QUANTIZATION_MODES = ('none', 'float16', 'int8', 'pq')
+
+
+def make_codes(mode: str, dim: int, pq_subspaces: int = 96):
+    """Build the compressed representation for ``mode``; ``none`` returns None"""
+    if mode == 'none':
+        return None
+    if mode == 'float16':
+        return Float16Codes(dim)
+    if mode == 'int8':
+        return Int8Codes(dim)
+    if mode == 'pq':
+        return ProductQuantizedCodes(dim, subspaces=pq_subspaces)
+    raise ValueError(f"Unknown quantization mode '{mode}', expected one of {', '.join(QUANTIZATION_MODES)}")
+
+
+def describe_codes(codes, dim: int) -> Dict[str, Any]:
+    float32_bytes = dim * 4
+    bytes_per_vector = codes.bytes_per_vector() if codes is not None else float32_bytes
+    return {
+        'mode': codes.name if codes is not None else 'none',
+        'bytes_per_vector': bytes_per_vector,
+        'float32_bytes_per_vector': float32_bytes,
+        'compression_ratio': round(float32_bytes / bytes_per_vector, 2) if bytes_per_vector else None,
+        'encoded_vectors': len(codes) if codes is not None else 0,
+    }
@@ -0,0 +1,250 @@
+"""
+Online re-indexing for the vector database service
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from quantization import make_codes
+from storage import VectorStore
+
+# Required free memory/disk as a multiple of the estimated new index size
+HEADROOM_FACTOR = 1.5
+# Writes that arrived during embedding are re-embedded outside the store lock
+# until at most FINAL_DELTA remain; only those are embedded while writers wait
+FINAL_DELTA = 32
+# Passes before giving up when writes keep arriving faster than they are re-embedded
+MAX_CATCH_UP_ROUNDS = 50
+# Writes that embedded with the old model may land just after the swap
+SETTLE_SECONDS = 1.0
+
+
+def available_memory_bytes() -> Optional[int]:
+    """MemAvailable from /proc/meminfo, or None where it cannot be read"""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class ReindexManager:
+    """Builds a new index generation in the background and swaps it in atomically
+
+    Two kinds of job exist. A ``codes`` job re-encodes the stored vectors
+    for new quantization settings and swaps the codes in under the store
+    lock. A ``full`` job re-embeds every stored text into a staging store,
+    replays writes that arrived meanwhile, and then has the live store adopt
+    the staging files as its next generation. Either way the old index keeps
+    serving queries until the swap, and only one job runs at a time.
+
+    Status is also written to ``REINDEX`` in the data directory, so every
+    process sharing the store reports the same job.
+    """
+
+    def __init__(self, store: VectorStore):
+        self.store = store
+        self.staging_dir = os.path.join(store.data_dir, 'reindex')
+        self.status_path = os.path.join(store.data_dir, 'REINDEX')
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.status: Dict[str, Any] = {'state': 'idle'}
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def current_status(self) -> Dict[str, Any]:
+        """This process's job, or the last one recorded by any process"""
+        if self.running() or not os.path.exists(self.status_path):
+            return self.status
+        try:
+            with open(self.status_path, 'r') as f:
+                status = json.load(f)
+        except (OSError, ValueError):
+            return self.status
+        if status.get('state') == 'running':
+            try:
+                os.kill(status['pid'], 0)
+            except (OSError, KeyError):
+                status.update({'state': 'failed', 'error': 'Re-index process exited before finishing'})
+        return status
+
+    def _update(self, **values):
+        self.status.update(values)
+        tmp_path = self.status_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.status, f)
+        os.replace(tmp_path, self.status_path)
+
+    def headroom(self, quantization: str, pq_subspaces: int, full: bool) -> Dict[str, Any]:
+        """Estimated size of the new index against free memory and disk"""
+        dim = self.store.dim or 0
+        live = len(self.store)
+        codes = make_codes(quantization, dim, pq_subspaces) if dim else None
+        memory_needed = live * codes.bytes_per_vector() if codes is not None else 0
+        disk_needed = live * dim * 4 if full else 0
+        memory_available = available_memory_bytes()
+        disk_available = shutil.disk_usage(self.store.data_dir).free
+        return {
+            'memory_needed_bytes': memory_needed,
+            'memory_available_bytes': memory_available,
+            'disk_needed_bytes': disk_needed,
+            'disk_available_bytes': disk_available,
+            'ok': (memory_available is None or memory_needed * HEADROOM_FACTOR <= memory_available)
+            and disk_needed * HEADROOM_FACTOR <= disk_available,
+        }
+
+    def start(self, quantization: Optional[str] = None, pq_subspaces: Optional[int] = None,
+              rerank: Optional[int] = None, embed: Optional[Callable[[List[str]], List[List[float]]]] = None,
+              batch_size: int = 100, force: bool = False,
+              target: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Start a job; ``embed`` makes it a full re-embed, otherwise codes only
+
+        ``target`` holds extra settings (e.g. the embedding backend) that are
+        published with the new generation once it is swapped in.
+
+        Raises RuntimeError when a job is already running and MemoryError
+        when the headroom check fails without ``force``.
+        """
+        quantization = quantization or self.store.quantization
+        pq_subspaces = pq_subspaces or self.store.pq_subspaces
+        make_codes(quantization, self.store.dim or pq_subspaces, pq_subspaces)  # validate settings
+
+        with self._lock:
+            if self.running() or self.current_status().get('state') == 'running':
+                raise RuntimeError("A re-index job is already running")
+            headroom = self.headroom(quantization, pq_subspaces, embed is not None)
+            if not headroom['ok'] and not force:
+                raise MemoryError("Not enough free memory or disk for the new index generation")
+            self.status = {
+                'state': 'running',
+                'pid': os.getpid(),
+                'kind': 'full' if embed is not None else 'codes',
+                'phase': 'starting',
+                'processed': 0,
+                'total': len(self.store),
+                'target': {**(target or {}), 'quantization': quantization,
+                           'pq_subspaces': pq_subspaces, 'rerank': rerank},
+                'headroom': headroom,
+                'generation_before': self.store.generation,
+            }
+            self._update(started_at=datetime.utcnow().isoformat())
+            if embed is not None:
+                job = lambda: self._reembed(embed, quantization, pq_subspaces, rerank, batch_size, target or {})
+            else:
+                job = lambda: self._rebuild_codes(quantization, pq_subspaces, rerank)
+            self._thread = threading.Thread(target=self._run, args=(job,), name='vector-reindex', daemon=True)
+            self._thread.start()
+            return dict(self.status)
+
+    def _run(self, job: Callable[[], None]):
+        try:
+            job()
+            self._update(state='completed', phase='done', generation_after=self.store.generation,
+                         finished_at=datetime.utcnow().isoformat())
+        except Exception as e:
+            print(f"Error re-indexing vector store: {str(e)}")
+            self._update(state='failed', error=str(e), finished_at=datetime.utcnow().isoformat())
+            self.store.take_changes(stop=True)
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    def _progress(self, processed: int, total: int):
+        self._update(processed=processed, total=total)
+
+    def _rebuild_codes(self, quantization: str, pq_subspaces: int, rerank: Optional[int]):
+        for attempt in range(2):
+            self._update(phase='encoding')
+            codes, epoch = self.store.build_codes(quantization, pq_subspaces, self._progress)
+            self._update(phase='swapping')
+            try:
+                self.store.swap_codes(codes, epoch, quantization, pq_subspaces, rerank)
+                break
+            except RuntimeError:
+                # A compaction renumbered the rows mid-build; encode once more
+                if attempt == 1:
+                    raise
+        self.store.update_settings(quantization=quantization, pq_subspaces=pq_subspaces, rerank=self.store.rerank)
+
+    def _reembed(self, embed, quantization: str, pq_subspaces: int, rerank: Optional[int],
+                 batch_size: int, target: Dict[str, Any]):
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        staging = VectorStore(self.staging_dir, compact_every=1 << 30, fsync=self.store.fsync,
+                              quantization=quantization, rerank=self.store.rerank if rerank is None else rerank,
+                              pq_subspaces=pq_subspaces)
+        self.store.track_changes()
+        ids = list(self.store)
+        self._update(phase='embedding', total=len(ids), carried_over=0, dropped=0)
+        for start in range(0, len(ids), batch_size):
+            self._copy(staging, ids[start:start + batch_size], embed)
+            self._progress(min(start + batch_size, len(ids)), len(ids))
+
+        # Replay writes that arrived while embedding. Each pass embeds without
+        # the store lock; the lock is only taken once the remaining delta is
+        # small, and if more has arrived by then it is released for another pass
+        self._update(phase='catching_up')
+        staging._sync_codes(build=True)
+        pending = set()
+        for _ in range(MAX_CATCH_UP_ROUNDS):
+            pending |= self.store.take_changes()
+            if len(pending) > FINAL_DELTA:
+                ids = list(pending)
+                for start in range(0, len(ids), batch_size):
+                    self._copy(staging, ids[start:start + batch_size], embed)
+                pending = set()
+                continue
+            with self.store._exclusive():
+                pending |= self.store.take_changes()
+                if len(pending) <= FINAL_DELTA:
+                    self._update(phase='swapping')
+                    self._copy(staging, list(pending), embed)
+                    self.store.adopt(staging, settings={**target, 'quantization': quantization,
+                                                        'pq_subspaces': pq_subspaces, 'rerank': staging.rerank})
+                    break
+        else:
+            raise RuntimeError("Writes kept arriving faster than they could be re-embedded; retry later")
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+        # Re-embed anything written with the old model by requests in flight at the swap
+        time.sleep(SETTLE_SECONDS)
+        late = [i for i in self.store.take_changes(stop=True) if i in self.store]
+        for start in range(0, len(late), batch_size):
+            group = [(i, self.store.entry(i)) for i in late[start:start + batch_size]]
+            group = [(i, entry) for i, entry in group if entry is not None and entry['text']]
+            vectors = embed([entry['text'] for _, entry in group])
+            self.store.put_many((i, vector, entry['text'], entry['metadata'], entry['created_at'])
+                                for (i, entry), vector in zip(group, vectors))
+
+    def _copy(self, staging: VectorStore, ids: List[str], embed):
+        """Bring ``ids`` in the staging store up to date with the live store"""
+        items, texts, gone, textless = [], [], [], []
+        for embedding_id in ids:
+            entry = self.store.entry(embedding_id)
+            if entry is None:
+                gone.append(embedding_id)
+            elif entry['text']:
+                items.append((embedding_id, entry))
+                texts.append(entry['text'])
+            else:
+                textless.append((embedding_id, entry))
+        if gone:
+            staging.delete_many(gone)
+        if items:
+            vectors = embed(texts)
+            staging.put_many((embedding_id, vector, entry['text'], entry['metadata'], entry['created_at'])
+                             for (embedding_id, entry), vector in zip(items, vectors))
+        for embedding_id, entry in textless:
+            # Imported vectors without text cannot be re-embedded; keep them
+            # as-is when the dimension still matches
+            stored = self.store.get(embedding_id)
+            if stored is not None and staging.dim in (None, len(stored['vector'])):
+                staging.put(embedding_id, stored['vector'], None, entry['metadata'], entry['created_at'])
+                self.status['carried_over'] += 1
+            else:
+                self.status['dropped'] += 1
@@ -0,0 +1,56 @@
+"""
+Run a sharded vector database on one machine: N shard processes plus a coordinator
+
+    python run_sharded.py --shards 4
+
+Shard i listens on base_port + 10 + i with its data in data/shard-i; the
+coordinator listens on base_port. Ctrl-C stops every process.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run vector_db shards and a coordinator locally")
+    parser.add_argument("--shards", type=int, default=2, help="Number of shard processes")
+    parser.add_argument("--base-port", type=int, default=8010, help="Coordinator port")
+    parser.add_argument("--data-dir", default="data", help="Parent directory for shard data")
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    processes = []
+    shard_urls = []
+    for i in range(args.shards):
+        port = args.base_port + 10 + i
+        env = dict(os.environ, VECTOR_DATA_DIR=os.path.join(args.data_dir, f"shard-{i}"))
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+            cwd=here, env=env
+        ))
+        shard_urls.append(f"http://127.0.0.1:{port}")
+
+    env = dict(os.environ, VECTOR_SHARDS=",".join(shard_urls),
+               COORDINATOR_DATA_DIR=os.path.join(args.data_dir, "coordinator"))
+    processes.append(subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "coordinator:app", "--host", "0.0.0.0", "--port", str(args.base_port)],
+        cwd=here, env=env
+    ))
+    print(f"Coordinator on port {args.base_port}, shards: {', '.join(shard_urls)}")
+
+    try:
+        while all(process.poll() is None for process in processes):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
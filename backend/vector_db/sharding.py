@@ -0,0 +1,55 @@
+"""
+Hash partitioning of embedding ids across vector_db shard processes
+"""
+import hashlib
+import heapq
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+
+def _weight(shard: str, embedding_id: str) -> int:
+    digest = hashlib.blake2b(f"{shard}\x00{embedding_id}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class ShardRouter:
+    """Assigns every id to one shard by rendezvous (highest random weight) hashing
+
+    Each id goes to the shard with the highest hash of ``(shard, id)``, so
+    adding a shard only moves the ~1/N of ids that now hash highest on it,
+    and removing one only moves the ids it owned.
+    """
+
+    def __init__(self, shards: Iterable[str]):
+        self.shards: List[str] = [shard.rstrip('/') for shard in shards if shard.strip()]
+        if not self.shards:
+            raise ValueError("At least one shard URL is required")
+
+    def owner(self, embedding_id: str) -> str:
+        return max(self.shards, key=lambda shard: _weight(shard, embedding_id))
+
+    def partition(self, embedding_ids: Iterable[str]) -> Dict[str, List[str]]:
+        groups: Dict[str, List[str]] = defaultdict(list)
+        for embedding_id in embedding_ids:
+            groups[self.owner(embedding_id)].append(embedding_id)
+        return groups
+
+    def moves(self, shard: str, embedding_ids: Iterable[str]) -> Dict[str, List[str]]:
+        """Ids currently on ``shard`` grouped by the shard that should own them instead"""
+        groups: Dict[str, List[str]] = defaultdict(list)
+        for embedding_id in embedding_ids:
+            owner = self.owner(embedding_id)
+            if owner != shard:
+                groups[owner].append(embedding_id)
+        return groups
+
+
+def merge_top_k(shard_results: Iterable[List[dict]], k: int, key: str = 'similarity') -> List[dict]:
+    """Global top-k from per-shard top-k lists, keeping the best copy of any id"""
+    best: Dict[str, Tuple[float, dict]] = {}
+    for results in shard_results:
+        for result in results:
+            current = best.get(result['id'])
+            if current is None or result[key] > current[0]:
+                best[result['id']] = (result[key], result)
+    return [result for _, result in heapq.nlargest(k, best.values(), key=lambda item: item[0])]
@@ -0,0 +1,856 @@
+"""
+Persistent vector storage for the vector database service
+"""
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from bm25 import BM25Index, reciprocal_rank_fusion
+from metadata_index import MetadataIndex
+from quantization import QUANTIZATION_MODES, ProductQuantizedCodes, describe_codes, make_codes, normalize_rows
+
+VECTOR_DTYPE = np.dtype('<f4')
+PQ_MIN_TRAIN_ROWS = 1024
+SCAN_CHUNK_ROWS = 16384
+
+
+class VectorStore:
+    """Append-only, memory-mapped vector store with a write-ahead log
+
+    Files kept in ``data_dir`` for the live generation ``N``:
+
+    - ``CURRENT``: name of the live generation
+    - ``vectors.N.f32``: raw float32 rows, only ever appended to
+    - ``snapshot.N.json``: compacted id -> row/text/metadata state
+    - ``wal.N.jsonl``: put/delete records applied on top of the snapshot
+
+    Startup maps the vector file instead of reading it, so restart time
+    depends on the metadata size only. Compaction writes generation ``N+1``
+    with the live rows and switches ``CURRENT`` atomically.
+
+    With ``quantization`` set, searches scan compressed codes held in memory
+    and re-rank the best ``k * rerank`` candidates against the float32 rows.
+
+    With ``shared`` set, several processes (e.g. uvicorn workers) may open
+    the same ``data_dir``. Writers take an exclusive ``flock`` on ``LOCK``,
+    so there is one writer at a time and only it publishes generations;
+    every process maps the same vector file read-only, sharing its pages,
+    and tails the WAL before each read to pick up other processes' writes.
+    """
+
+    def __init__(self, data_dir: str, compact_every: int = 10000, fsync: bool = True,
+                 quantization: str = 'none', rerank: int = 4, pq_subspaces: int = 96,
+                 shared: bool = False):
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode '{quantization}', expected one of {', '.join(QUANTIZATION_MODES)}")
+        self.data_dir = data_dir
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.quantization = quantization
+        self.rerank = rerank
+        self.pq_subspaces = pq_subspaces
+        self._lock = threading.RLock()
+        # Bumped whenever row numbers change, which invalidates built codes
+        self.row_epoch = 0
+        self._codes_thread: Optional[threading.Thread] = None
+        # Ids written or deleted since track_changes(), for re-index catch-up
+        self._changes: Optional[set] = None
+        os.makedirs(data_dir, exist_ok=True)
+        self.shared = shared
+        self._lock_file = open(os.path.join(data_dir, 'LOCK'), 'a') if shared else None
+        self._lock_depth = 0
+        with self._file_lock(fcntl.LOCK_SH):
+            self._load()
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    def _path(self, kind: str, generation: int) -> str:
+        suffix = {'vectors': 'f32', 'snapshot': 'json', 'wal': 'jsonl'}[kind]
+        return os.path.join(self.data_dir, f"{kind}.{generation}.{suffix}")
+
+    def _load(self):
+        """Map the live generation and replay its write-ahead log"""
+        current_path = os.path.join(self.data_dir, 'CURRENT')
+        self.generation = 0
+        self._current_stamp = self._stamp(current_path)
+        if os.path.exists(current_path):
+            with open(current_path, 'r') as f:
+                self.generation = int(f.read().strip() or 0)
+
+        self.dim: Optional[int] = None
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        # Index parameters published with the generation, e.g. by a re-index
+        self.settings: Dict[str, Any] = {}
+
+        snapshot_path = self._path('snapshot', self.generation)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            self.dim = snapshot.get('dim')
+            self._entries = snapshot.get('entries', {})
+            self.settings = snapshot.get('settings', {})
+        for key in ('quantization', 'pq_subspaces', 'rerank'):
+            if key in self.settings:
+                setattr(self, key, self.settings[key])
+
+        vectors_path = self._path('vectors', self.generation)
+        self._vector_file = open(vectors_path, 'ab')
+        self._rows = self._rows_on_disk()
+
+        self._wal_records = 0
+        self._wal_offset = 0
+        wal_path = self._path('wal', self.generation)
+        if os.path.exists(wal_path):
+            with open(wal_path, 'rb') as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError("unterminated record")
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn final line from a crash mid-write
+                        break
+                    self._apply(record)
+                    self._wal_records += 1
+                    self._wal_offset += len(line)
+        self._wal_file = open(wal_path, 'a', encoding='utf-8')
+
+        self._row_ids: List[Optional[str]] = [None] * self._rows
+        for embedding_id, entry in list(self._entries.items()):
+            if entry['row'] >= self._rows:
+                # The WAL record survived but its vector bytes did not
+                del self._entries[embedding_id]
+                continue
+            self._row_ids[entry['row']] = embedding_id
+
+        self.metadata_index = MetadataIndex()
+        for embedding_id, entry in self._entries.items():
+            self.metadata_index.add(embedding_id, entry['metadata'])
+
+        self._mapped: Optional[np.ndarray] = None
+        self._live_cache: Optional[Tuple[List[str], np.ndarray]] = None
+        self._codes = None
+        self._bm25: Optional[BM25Index] = None
+
+    @staticmethod
+    def _stamp(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    @contextmanager
+    def _file_lock(self, mode: int):
+        """Cross-process lock on ``LOCK``; a no-op unless the store is shared"""
+        if not self.shared:
+            yield
+            return
+        with self._lock:
+            if self._lock_depth:
+                # Already held by this thread, e.g. compaction inside a write
+                yield
+                return
+            fcntl.flock(self._lock_file, mode)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _exclusive(self):
+        """Hold the store lock and, when shared, be the only writing process"""
+        with self._lock, self._file_lock(fcntl.LOCK_EX):
+            self.refresh()
+            yield
+
+    def refresh(self):
+        """Catch up with writes made by other processes sharing ``data_dir``
+
+        A new generation is reloaded; otherwise only the unseen tail of the
+        WAL is applied. Runs under the shared file lock, so no other process
+        can switch generations and remove the WAL while it is read. Costs a
+        lock round trip and two ``stat`` calls when nothing changed.
+        """
+        if not self.shared:
+            return
+        with self._lock, self._file_lock(fcntl.LOCK_SH):
+            if self._stamp(os.path.join(self.data_dir, 'CURRENT')) != self._current_stamp:
+                self._vector_file.close()
+                self._wal_file.close()
+                self._load()
+                self.row_epoch += 1
+                return
+            wal_path = self._path('wal', self.generation)
+            if os.path.getsize(wal_path) <= self._wal_offset:
+                return
+            with open(wal_path, 'rb') as f:
+                f.seek(self._wal_offset)
+                data = f.read()
+            # Only whole records; a writer may be mid-line
+            data = data[:data.rfind(b'\n') + 1]
+            if not data:
+                return
+            self._rows = self._rows_on_disk()
+            self._row_ids.extend([None] * (self._rows - len(self._row_ids)))
+            for line in data.splitlines():
+                record = json.loads(line)
+                if record['op'] == 'put':
+                    if self.dim is None:
+                        self.dim = record['dim']
+                        self._rows = self._rows_on_disk()
+                        self._row_ids.extend([None] * (self._rows - len(self._row_ids)))
+                    self._index_put(record['id'], {
+                        'row': record['row'],
+                        'text': record.get('text'),
+                        'metadata': record.get('metadata'),
+                        'created_at': record.get('created_at'),
+                    })
+                elif record['id'] in self._entries:
+                    self._index_delete(record['id'], self._entries.pop(record['id']))
+                if self._changes is not None:
+                    self._changes.add(record['id'])
+            self._wal_offset += len(data)
+            self._wal_records += data.count(b'\n')
+            self._live_cache = None
+
+    def _index_put(self, embedding_id: str, entry: Dict[str, Any]):
+        """Point an id at its new row in every in-memory index"""
+        previous = self._entries.get(embedding_id)
+        if previous is not None:
+            self._row_ids[previous['row']] = None
+            self.metadata_index.remove(embedding_id, previous['metadata'])
+            if self._bm25 is not None:
+                self._bm25.remove(embedding_id, previous['text'])
+        self.metadata_index.add(embedding_id, entry['metadata'])
+        if self._bm25 is not None:
+            self._bm25.add(embedding_id, entry['text'])
+        self._entries[embedding_id] = entry
+        self._row_ids[entry['row']] = embedding_id
+
+    def _index_delete(self, embedding_id: str, entry: Dict[str, Any]):
+        """Drop an already-removed entry from the in-memory indexes"""
+        self._row_ids[entry['row']] = None
+        self.metadata_index.remove(embedding_id, entry['metadata'])
+        if self._bm25 is not None:
+            self._bm25.remove(embedding_id, entry['text'])
+
+    def _rows_on_disk(self) -> int:
+        if not self.dim:
+            return 0
+        size = os.path.getsize(self._path('vectors', self.generation))
+        return size // (self.dim * VECTOR_DTYPE.itemsize)
+
+    def _apply(self, record: Dict[str, Any]):
+        if record['op'] == 'put':
+            if self.dim is None:
+                self.dim = record['dim']
+                self._rows = self._rows_on_disk()
+            self._entries[record['id']] = {
+                'row': record['row'],
+                'text': record.get('text'),
+                'metadata': record.get('metadata'),
+                'created_at': record.get('created_at'),
+            }
+        elif record['op'] == 'delete':
+            self._entries.pop(record['id'], None)
+
+    # ------------------------------------------------------------------
+    # Mapping-style access
+    # ------------------------------------------------------------------
+
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self._entries)
+
+    def __contains__(self, embedding_id: str) -> bool:
+        self.refresh()
+        return embedding_id in self._entries
+
+    def __iter__(self):
+        self.refresh()
+        return iter(list(self._entries))
+
+    def __getitem__(self, embedding_id: str) -> Dict[str, Any]:
+        self.refresh()
+        entry = self._entries[embedding_id]
+        return {
+            'vector': self._view()[entry['row']].tolist(),
+            'text': entry['text'],
+            'metadata': entry['metadata'],
+            'created_at': entry['created_at'],
+        }
+
+    def __setitem__(self, embedding_id: str, value: Dict[str, Any]):
+        self.put_many([(embedding_id, value['vector'], value.get('text'),
+                        value.get('metadata'), value.get('created_at'))])
+
+    def __delitem__(self, embedding_id: str):
+        if not self.delete(embedding_id):
+            raise KeyError(embedding_id)
+
+    def get(self, embedding_id: str, default=None):
+        if embedding_id not in self._entries:
+            return default
+        return self[embedding_id]
+
+    def entry(self, embedding_id: str) -> Optional[Dict[str, Any]]:
+        """Return the stored text/metadata for an id without touching its vector"""
+        self.refresh()
+        return self._entries.get(embedding_id)
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def put_many(self, items: Iterable[Tuple[str, Any, Optional[str], Optional[dict], Optional[str]]]) -> int:
+        """Append vectors and their WAL records, syncing once for the whole batch
+
+        Each item is ``(id, vector, text, metadata, created_at)``.
+        """
+        items = list(items)
+        if not items:
+            return 0
+
+        with self._exclusive():
+            vectors = np.asarray([item[1] for item in items], dtype=VECTOR_DTYPE)
+            if vectors.ndim != 2:
+                raise ValueError("Vectors must all have the same dimension")
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+
+            # Vector bytes go to disk before the WAL records that point at them. Rows
+            # are counted from the file: another process may have appended vectors
+            # and died before writing their WAL records, which refresh() never sees
+            first_row = self._rows_on_disk()
+            self._vector_file.write(vectors.tobytes())
+            self._vector_file.flush()
+            if self.fsync:
+                os.fsync(self._vector_file.fileno())
+
+            now = datetime.utcnow().isoformat()
+            created = [item[4] or now for item in items]
+            self._write_wal([json.dumps({
+                'op': 'put',
+                'id': embedding_id,
+                'row': first_row + offset,
+                'dim': self.dim,
+                'text': text,
+                'metadata': metadata,
+                'created_at': created[offset],
+            }) for offset, (embedding_id, _, text, metadata, _) in enumerate(items)])
+
+            self._rows = first_row + len(items)
+            self._row_ids.extend([None] * (self._rows - len(self._row_ids)))
+            if self._changes is not None:
+                self._changes.update(item[0] for item in items)
+            for offset, (embedding_id, _, text, metadata, _) in enumerate(items):
+                self._index_put(embedding_id, {
+                    'row': first_row + offset,
+                    'text': text,
+                    'metadata': metadata,
+                    'created_at': created[offset],
+                })
+            self._live_cache = None
+            self._maybe_compact()
+            return len(items)
+
+    def put(self, embedding_id: str, vector, text: Optional[str] = None,
+            metadata: Optional[dict] = None, created_at: Optional[str] = None):
+        self.put_many([(embedding_id, vector, text, metadata, created_at)])
+
+    def delete(self, embedding_id: str) -> bool:
+        return self.delete_many([embedding_id]) == 1
+
+    def delete_many(self, embedding_ids: Iterable[str]) -> int:
+        """Delete ids with one WAL write; unknown ids are skipped"""
+        with self._exclusive():
+            removed = [(i, self._entries.pop(i)) for i in dict.fromkeys(embedding_ids) if i in self._entries]
+            if not removed:
+                return 0
+            self._write_wal([json.dumps({'op': 'delete', 'id': embedding_id}) for embedding_id, _ in removed])
+            if self._changes is not None:
+                self._changes.update(embedding_id for embedding_id, _ in removed)
+            for embedding_id, entry in removed:
+                self._index_delete(embedding_id, entry)
+            self._live_cache = None
+            self._maybe_compact()
+            return len(removed)
+
+    def _write_wal(self, lines: List[str]):
+        self._wal_file.write('\n'.join(lines) + '\n')
+        self._wal_file.flush()
+        if self.fsync:
+            os.fsync(self._wal_file.fileno())
+        self._wal_records += len(lines)
+        self._wal_offset = self._wal_file.tell()
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def _view(self) -> np.ndarray:
+        """Read-only mapping of every row on disk, remapped after appends"""
+        if not self.dim or self._rows == 0:
+            return np.zeros((0, self.dim or 0), dtype=VECTOR_DTYPE)
+        if self._mapped is None or self._mapped.shape[0] != self._rows:
+            self._mapped = np.memmap(self._path('vectors', self.generation), dtype=VECTOR_DTYPE,
+                                     mode='r', shape=(self._rows, self.dim))
+        return self._mapped
+
+    def live(self) -> Tuple[List[str], np.ndarray]:
+        """Ids and row numbers of every live (not deleted or superseded) vector"""
+        with self._lock:
+            self.refresh()
+            if self._live_cache is None:
+                ids = list(self._entries)
+                rows = np.fromiter((self._entries[i]['row'] for i in ids), dtype=np.int64, count=len(ids))
+                self._live_cache = (ids, rows)
+            return self._live_cache
+
+    def _sync_codes(self, build: bool = False):
+        """Compressed codes covering every row on disk, or None for exact search
+
+        Missing codes are built in a background thread while searches stay
+        exact, so (re)building never stalls a query; ``build`` builds inline.
+        """
+        if self.quantization == 'none' or not self.dim:
+            return None
+        if self._codes is None:
+            if self.quantization == 'pq' and self._rows < PQ_MIN_TRAIN_ROWS:
+                # Too little data to train codebooks yet; search stays exact
+                return None
+            if not build:
+                self._build_codes_in_background()
+                return None
+            self._codes, _ = self.build_codes(self.quantization, self.pq_subspaces)
+        view = self._view()
+        for start in range(len(self._codes), self._rows, 65536):
+            self._codes.append(normalize_rows(view[start:min(start + 65536, self._rows)]))
+        return self._codes
+
+    def _build_codes_in_background(self):
+        if self._codes_thread is not None and self._codes_thread.is_alive():
+            return
+
+        mode, subspaces = self.quantization, self.pq_subspaces
+
+        def run():
+            try:
+                codes, epoch = self.build_codes(mode, subspaces)
+                with self._lock:
+                    # A re-index may have switched modes while this one was building
+                    if (self.quantization, self.pq_subspaces) == (mode, subspaces):
+                        self.swap_codes(codes, epoch, mode, subspaces)
+            except Exception as e:
+                print(f"Error building search codes: {str(e)}")
+
+        self._codes_thread = threading.Thread(target=run, name='vector-codes', daemon=True)
+        self._codes_thread.start()
+
+    def build_codes(self, quantization: str, pq_subspaces: int, progress=None):
+        """Encode the rows on disk into new codes without holding the store lock
+
+        Rows are immutable once appended, so encoding can run alongside
+        searches and writes; ``swap_codes`` later catches up on newer rows.
+        Returns ``(codes, row_epoch)``.
+        """
+        with self._lock:
+            epoch = self.row_epoch
+            rows = self._rows
+            view = self._view()
+            dim = self.dim
+        codes = make_codes(quantization, dim, pq_subspaces)
+        if codes is None or (isinstance(codes, ProductQuantizedCodes) and rows < PQ_MIN_TRAIN_ROWS):
+            return None, epoch
+        if isinstance(codes, ProductQuantizedCodes):
+            rng = np.random.default_rng(0)
+            sample = np.sort(rng.choice(rows, min(rows, codes.train_size), replace=False))
+            codes.fit(normalize_rows(view[sample]))
+        for start in range(0, rows, 65536):
+            codes.append(normalize_rows(view[start:min(start + 65536, rows)]))
+            if progress is not None:
+                progress(min(start + 65536, rows), rows)
+        return codes, epoch
+
+    def swap_codes(self, codes, epoch: int, quantization: str, pq_subspaces: int, rerank: Optional[int] = None):
+        """Atomically replace the search codes and quantization settings"""
+        with self._lock:
+            if epoch != self.row_epoch:
+                raise RuntimeError("Rows were renumbered by compaction during the rebuild; retry")
+            self.quantization = quantization
+            self.pq_subspaces = pq_subspaces
+            if rerank is not None:
+                self.rerank = rerank
+            self._codes = codes
+            self._sync_codes(build=True)
+
+    def track_changes(self):
+        """Start recording ids written or deleted from now on"""
+        with self._lock:
+            self._changes = set()
+
+    def take_changes(self, stop: bool = False) -> set:
+        """Ids changed since the last call; ``stop`` ends tracking"""
+        with self._lock:
+            changes = self._changes or set()
+            self._changes = None if stop else set()
+            return changes
+
+    def _candidates(self, filters: Optional[Dict[str, Any]],
+                    candidate_ids: Optional[Iterable[str]] = None) -> Tuple[List[str], np.ndarray]:
+        if filters or candidate_ids is not None:
+            if candidate_ids is not None:
+                ids = [i for i in dict.fromkeys(candidate_ids) if i in self._entries]
+                if filters:
+                    allowed = self.metadata_index.candidates(filters)
+                    ids = [i for i in ids if i in allowed]
+            else:
+                ids = list(self.metadata_index.candidates(filters))
+            rows = np.fromiter((self._entries[i]['row'] for i in ids), dtype=np.int64, count=len(ids))
+            return ids, rows
+        return self.live()
+
+    def lexical_index(self) -> BM25Index:
+        """BM25 index over stored texts, built on first use and then kept in sync"""
+        with self._lock:
+            if self._bm25 is None:
+                index = BM25Index()
+                for embedding_id, entry in self._entries.items():
+                    index.add(embedding_id, entry['text'])
+                self._bm25 = index
+            return self._bm25
+
+    @staticmethod
+    def _merge_top(best: Optional[Tuple[np.ndarray, np.ndarray]], positions: np.ndarray,
+                   scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Fold one chunk's ``(rows, queries)`` scores into the running per-query top-k"""
+        positions = np.broadcast_to(positions[:, None], scores.shape)
+        if best is not None:
+            positions = np.vstack([best[0], positions])
+            scores = np.vstack([best[1], scores])
+        if len(scores) > k:
+            keep = np.argpartition(-scores, k - 1, axis=0)[:k]
+            positions = np.take_along_axis(positions, keep, axis=0)
+            scores = np.take_along_axis(scores, keep, axis=0)
+        return positions, scores
+
+    def _scan(self, rows: np.ndarray, total_rows: int, k: int, score_block) -> Tuple[np.ndarray, np.ndarray]:
+        """Per-query top-k over candidate ``rows`` in bounded-memory chunks
+
+        ``score_block(selector)`` returns ``(len(block), queries)`` scores for a
+        slice of contiguous rows or an array of gathered rows. Selective
+        candidate sets are gathered; otherwise contiguous blocks are scored and
+        masked, which is cheaper than gathering most of the file.
+        Returns ``(positions, scores)`` of shape ``(k, queries)``, best first,
+        where positions index into ``rows``.
+        """
+        best = None
+        if len(rows) * 2 < total_rows:
+            for start in range(0, len(rows), SCAN_CHUNK_ROWS):
+                positions = np.arange(start, min(start + SCAN_CHUNK_ROWS, len(rows)))
+                best = self._merge_top(best, positions, score_block(rows[positions]), k)
+        else:
+            lookup = np.full(total_rows, -1, dtype=np.int64)
+            lookup[rows] = np.arange(len(rows))
+            for start in range(0, total_rows, SCAN_CHUNK_ROWS):
+                end = min(start + SCAN_CHUNK_ROWS, total_rows)
+                positions = lookup[start:end]
+                valid = positions >= 0
+                if not valid.any():
+                    continue
+                best = self._merge_top(best, positions[valid], score_block(slice(start, end))[valid], k)
+        positions, scores = best
+        order = np.argsort(-scores, axis=0, kind='stable')
+        return np.take_along_axis(positions, order, axis=0), np.take_along_axis(scores, order, axis=0)
+
+    def _exact_block(self, matrix: np.ndarray, units: np.ndarray):
+        """Exact cosine scorer over float32 rows for unit-length queries"""
+        def score(selector):
+            block = np.asarray(matrix[selector], dtype=np.float32)
+            norms = np.linalg.norm(block, axis=1, keepdims=True)
+            dots = block @ units.T
+            return np.divide(dots, norms, out=np.zeros_like(dots), where=norms != 0)
+        return score
+
+    def search_many(self, query_vectors, k: int, filters: Optional[Dict[str, Any]] = None,
+                    rerank: Optional[int] = None, exact: bool = False,
+                    candidate_ids: Optional[Iterable[str]] = None) -> List[List[Tuple[str, float]]]:
+        """Top-k live ids by cosine similarity for each row of ``query_vectors``
+
+        All queries are scored together with one matrix-matrix product per
+        chunk of stored rows. With ``filters``, the metadata index narrows the
+        candidates first. When quantization is on, the compressed codes are
+        scanned and the best ``k * rerank`` candidates per query re-ranked
+        exactly; ``rerank=0`` returns the approximate scores as-is.
+        ``candidate_ids`` restricts scoring to an explicit set of ids.
+        """
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        with self._lock:
+            self.refresh()
+            ids, rows = self._candidates(filters, candidate_ids)
+            if not ids or k <= 0 or len(queries) == 0:
+                return [[] for _ in range(len(queries))]
+            matrix = self._view()
+            codes = None if exact else self._sync_codes()
+        units = normalize_rows(queries)
+        k = min(k, len(ids))
+
+        if codes is None:
+            positions, scores = self._scan(rows, matrix.shape[0], k, self._exact_block(matrix, units))
+            return [[(ids[p], float(s)) for p, s in zip(positions[:, q], scores[:, q])]
+                    for q in range(len(queries))]
+
+        rerank = self.rerank if rerank is None else rerank
+        shortlist = k if rerank <= 0 else min(k * rerank, len(ids))
+        positions, scores = self._scan(rows, len(codes), shortlist,
+                                       lambda selector: codes.score(units, selector))
+        if rerank <= 0:
+            return [[(ids[p], float(s)) for p, s in zip(positions[:, q], scores[:, q])]
+                    for q in range(len(queries))]
+
+        # Exact re-rank: score the union of every query's shortlist once
+        union, inverse = np.unique(positions, return_inverse=True)
+        exact_scores = self._exact_block(matrix, units)(rows[union])
+        inverse = inverse.reshape(positions.shape)
+        results = []
+        for q in range(len(queries)):
+            candidate_scores = exact_scores[inverse[:, q], q]
+            top = np.argsort(-candidate_scores, kind='stable')[:k]
+            results.append([(ids[positions[i, q]], float(candidate_scores[i])) for i in top])
+        return results
+
+    def search(self, query_vector, k: int, filters: Optional[Dict[str, Any]] = None,
+               rerank: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Top-k live ids by cosine similarity to ``query_vector``"""
+        return self.search_many([query_vector], k, filters, rerank)[0]
+
+    def lexical_search(self, query_text: str, k: int,
+                       filters: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """Top-k ids by BM25 score of their stored text"""
+        with self._lock:
+            self.refresh()
+            allowed = self.metadata_index.candidates(filters) if filters else None
+            return self.lexical_index().search(query_text, k, allowed)
+
+    def hybrid_search(self, query_vector, query_text: str, k: int, filters: Optional[Dict[str, Any]] = None,
+                      fusion: str = 'rrf', alpha: float = 0.5, lexical_prefilter: bool = False,
+                      depth: Optional[int] = None) -> List[Tuple[str, float, Optional[float], Optional[float]]]:
+        """Fuse BM25 and dense rankings into ``(id, score, dense, lexical)`` tuples
+
+        ``fusion`` is ``rrf`` (reciprocal-rank fusion) or ``weighted``
+        (``alpha * cosine + (1 - alpha) * BM25 / max BM25``). With
+        ``lexical_prefilter``, only documents matching a query term are
+        scored densely, which shrinks the dense pass to the lexical candidates.
+        """
+        depth = depth or max(50, k * 10)
+        lexical = self.lexical_search(query_text, depth, filters)
+        if lexical_prefilter:
+            if not lexical:
+                return []
+            dense = self.search_many([query_vector], len(lexical), filters,
+                                     candidate_ids=[i for i, _ in lexical])[0]
+        else:
+            dense = self.search_many([query_vector], depth, filters)[0]
+
+        dense_scores = dict(dense)
+        lexical_scores = dict(lexical)
+        if fusion == 'rrf':
+            fused = reciprocal_rank_fusion([dense, lexical])
+        elif fusion == 'weighted':
+            top_lexical = max(lexical_scores.values(), default=0.0) or 1.0
+            fused = {
+                doc_id: alpha * dense_scores.get(doc_id, 0.0)
+                + (1.0 - alpha) * lexical_scores.get(doc_id, 0.0) / top_lexical
+                for doc_id in set(dense_scores) | set(lexical_scores)
+            }
+        else:
+            raise ValueError(f"Unknown fusion '{fusion}', expected 'rrf' or 'weighted'")
+
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(doc_id, score, dense_scores.get(doc_id), lexical_scores.get(doc_id)) for doc_id, score in ranked]
+
+    def evaluate_quantization(self, k: int = 10, samples: int = 100) -> Dict[str, Any]:
+        """Recall@k of the compressed search against exact search
+
+        Uses a sample of stored vectors as queries and reports recall with
+        and without re-ranking, plus the memory cost per vector.
+        """
+        with self._lock:
+            ids, rows = self.live()
+            codes = self._sync_codes(build=True)
+            matrix = self._view()
+        report = describe_codes(codes, self.dim or 0)
+        report['rerank'] = self.rerank
+        if codes is None or not ids:
+            return report
+
+        rng = np.random.default_rng(0)
+        picks = rng.choice(len(rows), min(samples, len(rows)), replace=False)
+        queries = np.asarray(matrix[np.sort(rows[picks])], dtype=np.float32)
+        exact = self.search_many(queries, k, exact=True)
+        approx = self.search_many(queries, k, rerank=0)
+        reranked = self.search_many(queries, k, rerank=max(self.rerank, 1))
+
+        def hits(results):
+            return sum(len({i for i, _ in e} & {i for i, _ in r}) for e, r in zip(exact, results))
+
+        total = len(picks) * min(k, len(ids))
+        report['queries'] = len(picks)
+        report['recall_at_k'] = round(hits(approx) / total, 4)
+        report['recall_at_k_reranked'] = round(hits(reranked) / total, 4)
+        return report
+
+    # ------------------------------------------------------------------
+    # Compaction
+    # ------------------------------------------------------------------
+
+    def _maybe_compact(self):
+        dead_rows = self._rows - len(self._entries)
+        if self._wal_records >= self.compact_every or (dead_rows > 1000 and dead_rows > len(self._entries)):
+            self.compact()
+
+    def compact(self):
+        """Write the live state as a new generation and switch to it
+
+        The vector file is only rewritten when enough rows are dead to be
+        worth it; otherwise the new generation hard-links the existing file
+        and just folds the WAL into a fresh snapshot.
+        """
+        with self._exclusive():
+            new_generation = self.generation + 1
+            ids, rows = self.live()
+            vectors_path = self._path('vectors', new_generation)
+            dead_rows = self._rows - len(ids)
+
+            rewrite = dead_rows > 0.1 * self._rows
+            if not rewrite:
+                try:
+                    os.link(self._path('vectors', self.generation), vectors_path)
+                except OSError:
+                    rewrite = True
+
+            if rewrite:
+                view = self._view()
+                with open(vectors_path, 'wb') as f:
+                    for start in range(0, len(rows), 65536):
+                        f.write(np.ascontiguousarray(view[rows[start:start + 65536]]).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                entries = {}
+                for new_row, embedding_id in enumerate(ids):
+                    entry = dict(self._entries[embedding_id])
+                    entry['row'] = new_row
+                    entries[embedding_id] = entry
+            else:
+                entries = self._entries
+
+            snapshot_path = self._path('snapshot', new_generation)
+            with open(snapshot_path, 'w', encoding='utf-8') as f:
+                # An emptied store forgets its dimension, so it can be refilled with another
+                json.dump({'dim': self.dim if entries else None, 'entries': entries, 'settings': self.settings}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            open(self._path('wal', new_generation), 'w').close()
+
+            codes = self._codes
+            bm25 = self._bm25
+            self._switch_generation(new_generation)
+            # Ids and texts are unchanged, so the lexical index carries over
+            self._bm25 = bm25
+            if rewrite:
+                self.row_epoch += 1
+            else:
+                # Row numbers are unchanged, so the compressed codes still line up
+                self._codes = codes
+
+    def _switch_generation(self, new_generation: int):
+        """Point CURRENT at a fully written generation, reload it and drop the old one"""
+        current_tmp = os.path.join(self.data_dir, 'CURRENT.tmp')
+        with open(current_tmp, 'w') as f:
+            f.write(str(new_generation))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(current_tmp, os.path.join(self.data_dir, 'CURRENT'))
+
+        old_generation = self.generation
+        self._vector_file.close()
+        self._wal_file.close()
+        self._mapped = None
+        self._load()
+        for kind in ('vectors', 'snapshot', 'wal'):
+            path = self._path(kind, old_generation)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def update_settings(self, **settings):
+        """Persist index parameters in a new generation so every process sees them"""
+        with self._exclusive():
+            self.settings = {**self.settings, **settings}
+            self.compact()
+
+    def adopt(self, staging: 'VectorStore', settings: Optional[Dict[str, Any]] = None, same_texts: bool = True):
+        """Atomically replace this store's contents with a separately built store
+
+        ``staging`` must live in its own directory on the same filesystem; its
+        compacted files are renamed in as the next generation and CURRENT is
+        switched, so readers see either the old or the new index, never a mix.
+        The lexical index is kept unless ``same_texts`` is False, when it is
+        rebuilt on next use.
+        """
+        with self._exclusive():
+            staging.settings = {**self.settings, **(settings or {})}
+            staging.compact()
+            new_generation = self.generation + 1
+            os.replace(staging._path('vectors', staging.generation), self._path('vectors', new_generation))
+            os.replace(staging._path('snapshot', staging.generation), self._path('snapshot', new_generation))
+            open(self._path('wal', new_generation), 'w').close()
+            codes = staging._codes
+            staging.close()
+
+            bm25 = self._bm25
+            self._switch_generation(new_generation)
+            self.row_epoch += 1
+            self._codes = codes
+            # A re-embedded store holds the same ids and texts
+            self._bm25 = bm25 if same_texts else None
+
+    def close(self):
+        with self._lock:
+            self._vector_file.close()
+            self._wal_file.close()
+            self._mapped = None
+            if self._lock_file is not None:
+                self._lock_file.close()
+
+    def stats(self) -> Dict[str, Any]:
+        self.refresh()
+        vectors_path = self._path('vectors', self.generation)
+        return {
+            'generation': self.generation,
+            'dimension': self.dim,
+            'live_vectors': len(self._entries),
+            'rows_on_disk': self._rows,
+            'dead_rows': self._rows - len(self._entries),
+            'wal_records': self._wal_records,
+            'metadata_index': self.metadata_index.stats(),
+            'lexical_index': self._bm25.stats() if self._bm25 is not None else None,
+            'quantization': describe_codes(self._codes, self.dim or 0) if self._codes is not None
+            else {'mode': self.quantization, 'encoded_vectors': 0},
+            'vector_file_bytes': os.path.getsize(vectors_path) if os.path.exists(vectors_path) else 0,
+            'shared': self.shared,
+        }